@@ -3,6 +3,11 @@ ASGI config for amarce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Los eventos en vivo de envíos (`envios/eventos/`, Server-Sent Events) necesitan
+este punto de entrada: servir con un servidor ASGI, p.ej.
+`uvicorn amarce.asgi:application`. Bajo WSGI cada cliente conectado ocuparía
+un worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
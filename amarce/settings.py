@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import datetime
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -78,13 +79,92 @@ WSGI_APPLICATION = 'amarce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Perfil de producción (amarce/sqlite): PRAGMAs en cada conexión y BEGIN
+# IMMEDIATE en las transacciones. WAL no va acá: queda grabado en el archivo y
+# se activa una sola vez al instalar con `manage.py activar_wal`.
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,            # ms esperando el lock antes de "database is locked"
+    'mmap_size': 256 * 1024 * 1024,  # bytes
+    'cache_size': -20000,            # negativo = KiB (~20 MB por conexión)
+    'temp_store': 'MEMORY',
+}
+SQLITE_PRAGMAS_LECTURA = {
+    nombre: valor for nombre, valor in SQLITE_PRAGMAS.items()
+    if nombre != 'synchronous'
+}
+
+# Conexión de reportes: 'copia' (archivo aparte rehecho con la API de backup
+# por cron con `manage.py refrescar_reportes`, o en un hilo aparte cuando un
+# reporte la encuentra con más de REPORTES_ATRASO_MAXIMO segundos) o
+# 'solo_lectura' (db.sqlite3 con mode=ro, sin atraso)
+REPORTES_MODO = 'copia'
+REPORTES_ATRASO_MAXIMO = 5 * 60
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'amarce.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'PRAGMAS': SQLITE_PRAGMAS,
+        'TRANSACCION': 'IMMEDIATE',
+    },
+    # Reportes (stock/reportes.py): consultar_ventas, exportaciones e historial
+    # del chofer leen de acá. Siempre mode=ro: no escribe ni crea un archivo
+    # vacío si la copia todavía no existe. En tests es un espejo de default.
+    'reporting': {
+        'ENGINE': 'amarce.sqlite',
+        'NAME': (BASE_DIR / ('reportes.sqlite3' if REPORTES_MODO == 'copia' else 'db.sqlite3')).as_uri() + '?mode=ro',
+        'PRAGMAS': SQLITE_PRAGMAS_LECTURA,
+        # Con mode=ro un BEGIN IMMEDIATE falla: acá no se escribe nunca
+        'TRANSACCION': 'DEFERRED',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['stock.reportes.RouterReportes']
+
+# Las vistas de escritura (stock/reintentos.py) se reintentan si la base
+# sigue ocupada después de busy_timeout: hasta estos reintentos, esperando
+# ESCRITURA_ESPERA_INICIAL segundos y duplicando en cada uno (con jitter)
+ESCRITURA_REINTENTOS = 3
+ESCRITURA_ESPERA_INICIAL = 0.1
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# El catálogo de productos se cachea versionado (stock/cache.py). Con varios
+# workers usar FileBasedCache para que todos vean la misma versión:
+#   'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#   'LOCATION': BASE_DIR / 'cache',
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'amarce',
     }
 }
 
+# Reintentos con la misma Idempotency-Key reciben la respuesta guardada
+# durante este tiempo (segundos). Purgar con `manage.py purgar_idempotencia`.
+IDEMPOTENCIA_TTL = 60 * 60 * 24
+
+# Eventos en vivo (SSE) de envíos y ventas. El broker en memoria sirve con un
+# solo worker ASGI; con varios workers, apuntar a otra implementación con la
+# misma interfaz (publicar / suscribir / desuscribir).
+EVENTOS_BROKER = 'stock.eventos.BrokerLocal'
+
+# Rutas de reparto (programa_dia): punto de salida (lat, lon) o None para
+# arrancar por la primera parada, hora de salida, velocidad promedio en la
+# ciudad y tiempo de descarga por parada
+RUTA_DEPOSITO = None
+RUTA_HORA_SALIDA = datetime.time(8, 0)
+RUTA_VELOCIDAD_KMH = 25
+RUTA_MINUTOS_POR_PARADA = 10
+
+# Estadísticas de choferes: una entrega cuenta "a tiempo" si llega hasta
+# estos minutos después de la hora estimada
+ESTADISTICAS_TOLERANCIA_MINUTOS = 15
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
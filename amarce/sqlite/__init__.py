@@ -0,0 +1,19 @@
+"""
+Perfil de producción de SQLite (ENGINE 'amarce.sqlite').
+
+Es el backend sqlite3 de Django con dos agregados para que vendedores y
+choferes escriban a la vez sin "database is locked":
+
+- Cada conexión nueva recibe los PRAGMAs de la clave 'PRAGMAS' de su
+  entrada en settings.DATABASES (receptor de `connection_created`):
+  synchronous=NORMAL (en WAL sólo se sincroniza en los checkpoints),
+  busy_timeout, mmap_size, cache_size y temp_store. Ninguno toca el archivo.
+  WAL, para que las lecturas no bloqueen a las escrituras ni al revés, sí
+  queda grabado en la base: se activa una vez con `manage.py activar_wal`,
+  no en cada conexión (así `manage.py check` no reescribe db.sqlite3).
+- Los bloques `transaction.atomic()` abren con BEGIN IMMEDIATE (clave
+  'TRANSACCION'): la transacción toma el lock de escritura al empezar, y
+  si está ocupado espera busy_timeout ahí, antes de haber leído nada. Con
+  el BEGIN diferido por defecto, dos transacciones que leyeron y después
+  quieren escribir chocan y una falla en el medio sin esperar.
+"""
@@ -0,0 +1,28 @@
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+from django.dispatch import receiver
+
+MODOS_TRANSACCION = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    @property
+    def modo_transaccion(self):
+        modo = self.settings_dict.get('TRANSACCION', 'IMMEDIATE').upper()
+        if modo not in MODOS_TRANSACCION:
+            raise ValueError(f'TRANSACCION debe ser uno de {MODOS_TRANSACCION}, no {modo!r}')
+        return modo
+
+    def _start_transaction_under_autocommit(self):
+        # atomic() empieza la transacción por acá (Django usa un BEGIN a secas)
+        self.cursor().execute(f'BEGIN {self.modo_transaccion}')
+
+
+@receiver(connection_created)
+def aplicar_pragmas(sender, connection, **kwargs):
+    """Ejecuta los PRAGMAs del perfil en cada conexión SQLite nueva."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for nombre, valor in connection.settings_dict.get('PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {nombre} = {valor}')
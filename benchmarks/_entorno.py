@@ -0,0 +1,40 @@
+"""
+Arranque común de los benchmarks.
+
+Levanta Django sobre una base SQLite temporal (nunca toca db.sqlite3),
+aplica las migraciones y deja listo el entorno de test (Client, testserver).
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def preparar_django(nombre='bench', **base_de_datos):
+    """
+    Configura Django contra una base nueva y devuelve su ruta.
+    `base_de_datos`: claves a pisar en DATABASES['default'] (ENGINE, PRAGMAS...).
+    """
+    sys.path.insert(0, str(RAIZ))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'amarce.settings')
+
+    directorio = tempfile.mkdtemp(prefix=f'amarce-{nombre}-')
+    ruta_db = os.path.join(directorio, 'bench.sqlite3')
+
+    from django.conf import settings
+    settings.DATABASES['default'].update(base_de_datos, NAME=ruta_db)
+    # Los reportes leen de una copia (o de la misma base) en el directorio temporal
+    if 'reporting' in settings.DATABASES:
+        copia = ruta_db if settings.REPORTES_MODO != 'copia' else os.path.join(directorio, 'reportes.sqlite3')
+        settings.DATABASES['reporting']['NAME'] = Path(copia).as_uri() + '?mode=ro'
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    call_command('migrate', verbosity=0)
+    return ruta_db
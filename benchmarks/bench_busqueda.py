@@ -0,0 +1,95 @@
+"""
+Benchmark de búsqueda de productos: `nombre__icontains` vs índice FTS5.
+
+Carga catálogos sintéticos de distintos tamaños y mide la latencia de la
+primera página de `lista_productos` (50 filas) con cada estrategia:
+
+    python benchmarks/bench_busqueda.py --tamanios 10000 100000 1000000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from _entorno import preparar_django
+
+PALABRAS = [
+    'Café', 'Azúcar', 'Yerba', 'Galletitas', 'Aceite', 'Harina', 'Té', 'Leche',
+    'Fideos', 'Arroz', 'Polenta', 'Mermelada', 'Dulce', 'Jabón', 'Lavandina',
+    'Detergente', 'Gaseosa', 'Agua', 'Cerveza', 'Vino', 'Queso', 'Manteca',
+]
+MARCAS = ['La Serenísima', 'Marolio', 'Arcor', 'Molinos', 'Ledesma', 'Playadito', 'Cañuelas']
+BUSQUEDAS = ['cafe', 'azucar led', 'yerba play', 'jab', 'vino', 'zzz']
+
+
+def cargar(hasta, desde, tipos):
+    """Inserta productos [desde, hasta) en crudo (los triggers indexan FTS)."""
+    from django.db import connection, transaction
+    from django.utils import timezone
+
+    rnd = random.Random(desde)
+    ahora = timezone.now().isoformat()
+    umbral = 5
+
+    def fila(i):
+        cantidad = rnd.randint(0, 500)
+        return (
+            f'{rnd.choice(PALABRAS)} {rnd.choice(MARCAS)} {rnd.randint(1, 5000)}g #{i}',
+            rnd.choice(tipos), cantidad, '100.00', '60.00', umbral, cantidad < umbral,
+            0, cantidad, ahora,
+        )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO stock_producto (nombre, tipo_id, cantidad, valor, valor_compra, '
+            'umbral_alerta, en_alerta, reservado, disponible, fecha_modificacion) '
+            'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)',
+            (fila(i) for i in range(desde, hasta)),
+        )
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tamanios', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    preparar_django('busqueda')
+
+    from django.test import RequestFactory
+    from stock.models import Producto, TipoProducto
+    from stock.pagination import paginar
+    from stock.search import buscar_productos
+
+    tipos = [TipoProducto.objects.create(nombre=n).id for n in ('Almacén', 'Bebidas', 'Limpieza', 'Lácteos')]
+    request = RequestFactory().get('/productos/')
+    base = Producto.objects.select_related('tipo')
+
+    def pagina_icontains(texto):
+        return lambda: paginar(request, base.filter(nombre__icontains=texto), ['nombre', 'id']).items
+
+    def pagina_fts(texto):
+        return lambda: paginar(request, buscar_productos(base, texto), ['rank', 'id']).items
+
+    cargados = 0
+    print(f"{'productos':>10} {'búsqueda':<12} {'icontains ms':>13} {'fts ms':>9} {'x':>7}")
+    for tamanio in sorted(args.tamanios):
+        cargar(tamanio, cargados, tipos)
+        cargados = tamanio
+        for texto in BUSQUEDAS:
+            lento = medir(pagina_icontains(texto), args.repeticiones)
+            rapido = medir(pagina_fts(texto), args.repeticiones)
+            print(f'{tamanio:>10} {texto:<12} {lento:>13.2f} {rapido:>9.2f} {lento / rapido:>6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
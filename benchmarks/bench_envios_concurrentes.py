@@ -0,0 +1,115 @@
+"""
+Benchmark de concurrencia de crear_envio.
+
+Crea un producto con stock limitado y muchas ventas confirmadas que lo
+piden, y dispara POSTs paralelos a `crear_envio` desde varios hilos.
+Reporta throughput y verifica que no haya sobreventa:
+
+    python benchmarks/bench_envios_concurrentes.py --hilos 8 --ventas 300 --stock 200
+"""
+import argparse
+import queue
+import threading
+import time
+
+from _entorno import preparar_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--ventas', type=int, default=300)
+    parser.add_argument('--stock', type=int, default=200)
+    parser.add_argument('--unidades', type=int, default=1, help='Unidades por venta')
+    args = parser.parse_args()
+
+    preparar_django('envios')
+
+    from datetime import date
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.db.models import Sum
+    from django.test import Client
+    from django.urls import reverse
+    from stock.models import (
+        TipoProducto, Producto, Cliente, Chofer, Ventas, DetalleVenta,
+        Envio, StockMovimiento,
+    )
+
+    usuario = User.objects.create_user('bench', password='bench')
+    tipo = TipoProducto.objects.create(nombre='Bench')
+    producto = Producto.objects.create(
+        nombre='Producto disputado', tipo=tipo, cantidad=args.stock, valor=10,
+    )
+    cliente = Cliente.objects.create(nombre_completo='Cliente Bench', direccion='Calle 1')
+    chofer = Chofer.objects.create(nombre_completo='Chofer Bench', telefono='1', vehiculo='AAA111')
+
+    ventas = Ventas.objects.bulk_create([
+        Ventas(cliente=cliente, estado='confirmada', usuario_creador=usuario, valor_total=10 * args.unidades)
+        for _ in range(args.ventas)
+    ])
+    DetalleVenta.objects.bulk_create([
+        DetalleVenta(venta=v, producto=producto, cantidad=args.unidades,
+                     precio_unitario=10, subtotal=10 * args.unidades)
+        for v in ventas
+    ])
+
+    pendientes = queue.Queue()
+    for v in ventas:
+        pendientes.put(v.id)
+
+    datos = {
+        'chofer': chofer.id,
+        'fecha_envio': date.today().isoformat(),
+        'hora_estimada': '10:00',
+    }
+    errores = []
+
+    def trabajador():
+        client = Client()
+        client.force_login(usuario)
+        try:
+            while True:
+                try:
+                    venta_id = pendientes.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    client.post(reverse('crear_envio', args=[venta_id]), datos)
+                except Exception as e:  # se reportan al final
+                    errores.append(f'#{venta_id}: {e}')
+        finally:
+            connection.close()
+
+    hilos = [threading.Thread(target=trabajador) for _ in range(args.hilos)]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    duracion = time.perf_counter() - inicio
+
+    producto.refresh_from_db()
+    envios = Envio.objects.count()
+    enviadas = Ventas.objects.filter(estado='enviada').count()
+    salidas = -(StockMovimiento.objects.filter(tipo='salida').aggregate(t=Sum('cantidad'))['t'] or 0)
+    esperados = min(args.ventas, args.stock // args.unidades)
+
+    print(f'Hilos: {args.hilos}  Ventas: {args.ventas}  Stock inicial: {args.stock}  Unidades/venta: {args.unidades}')
+    print(f'Duración: {duracion:.2f}s  Throughput: {args.ventas / duracion:.1f} req/s')
+    print(f'Envíos creados: {envios} (esperados {esperados})  Ventas enviadas: {enviadas}')
+    print(f'Stock final: {producto.cantidad}  Salidas en ledger: {salidas}')
+    if errores:
+        print(f'Errores: {len(errores)} (primero: {errores[0]})')
+
+    consistente = (
+        producto.cantidad >= 0
+        and envios == enviadas == esperados
+        and args.stock - producto.cantidad == salidas == envios * args.unidades
+    )
+    print('✅ Sin sobreventa' if consistente else '❌ INCONSISTENCIA DE STOCK')
+    raise SystemExit(0 if consistente else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark del secuenciado de rutas (vecino más cercano + 2-opt).
+
+Genera paradas al azar alrededor de un depósito (un radio de ciudad) y
+mide el tiempo de `stock.rutas.secuenciar` y el largo del recorrido
+contra el orden por hora (al azar) y el vecino más cercano solo:
+
+    python benchmarks/bench_rutas.py --paradas 50 100 200 500
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from _entorno import RAIZ
+
+DEPOSITO = (-34.6037, -58.3816)
+
+
+def paradas(cantidad, semilla, radio=0.15):
+    rnd = random.Random(semilla)
+    return [
+        (DEPOSITO[0] + rnd.uniform(-radio, radio), DEPOSITO[1] + rnd.uniform(-radio, radio))
+        for _ in range(cantidad)
+    ]
+
+
+def largo(puntos, orden, distancia_km):
+    recorrido = [DEPOSITO] + [puntos[i] for i in orden]
+    return sum(distancia_km(a, b) for a, b in zip(recorrido, recorrido[1:]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--paradas', type=int, nargs='+', default=[50, 100, 200, 500])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(RAIZ))
+    from stock.rutas import _matriz, _vecino_mas_cercano, distancia_km, secuenciar
+
+    print(f"{'paradas':>8} {'ms':>8} {'km por hora':>12} {'km vecino':>10} {'km 2-opt':>9} {'ahorro':>7}")
+    for cantidad in args.paradas:
+        tiempos, sin_orden, vecino, optimizado = [], [], [], []
+        for semilla in range(args.repeticiones):
+            puntos = paradas(cantidad, semilla)
+            inicio = time.perf_counter()
+            orden = secuenciar(puntos, DEPOSITO)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+
+            assert sorted(orden) == list(range(cantidad))
+            solo_vecino = [n - 1 for n in _vecino_mas_cercano(_matriz([DEPOSITO, *puntos]), cantidad + 1)[1:]]
+            sin_orden.append(largo(puntos, range(cantidad), distancia_km))
+            vecino.append(largo(puntos, solo_vecino, distancia_km))
+            optimizado.append(largo(puntos, orden, distancia_km))
+
+        base, final = statistics.mean(sin_orden), statistics.mean(optimizado)
+        print(
+            f'{cantidad:>8} {statistics.median(tiempos):>8.1f} {base:>12.1f} '
+            f'{statistics.mean(vecino):>10.1f} {final:>9.1f} {1 - final / base:>6.0%}'
+        )
+
+
+if __name__ == '__main__':
+    main()
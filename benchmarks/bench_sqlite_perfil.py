@@ -0,0 +1,195 @@
+"""
+Benchmark de lecturas y escrituras concurrentes con y sin el perfil de producción de SQLite.
+
+Durante unos segundos, varios hilos escriben (alta de ventas por API y
+ajustes de stock) mientras otros leen (consultar_ventas y lista de
+ventas). Se corre una vez con el backend sqlite3 tal cual (journal
+clásico, BEGIN diferido, sin reintentos) y otra con amarce.sqlite (WAL
+con `activar_wal`, PRAGMAs, BEGIN IMMEDIATE y reintentos), cada una en un
+proceso y una base nueva, y se comparan throughput, latencias y errores
+"database is locked":
+
+    python benchmarks/bench_sqlite_perfil.py --escritores 6 --lectores 6 --segundos 10
+    python benchmarks/bench_sqlite_perfil.py --perfil produccion
+"""
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+
+from _entorno import preparar_django
+
+PERFILES = {
+    'base': {'ENGINE': 'django.db.backends.sqlite3', 'PRAGMAS': {}},
+    'produccion': {},
+}
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def correr(perfil, args):
+    preparar_django(f'sqlite-{perfil}', **PERFILES[perfil])
+
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client
+    from django.urls import reverse
+    from stock.models import TipoProducto, Producto, Cliente
+
+    if perfil == 'base':
+        settings.ESCRITURA_REINTENTOS = 0
+    else:
+        call_command('activar_wal', verbosity=0)
+
+    usuario = User.objects.create_user('bench', password='bench')
+    tipo = TipoProducto.objects.create(nombre='Bench')
+    productos = Producto.objects.bulk_create([
+        Producto(nombre=f'Producto {i}', tipo=tipo, cantidad=10 ** 6, valor=10 + i)
+        for i in range(20)
+    ])
+    clientes = Cliente.objects.bulk_create([
+        Cliente(nombre_completo=f'Cliente {i}', direccion=f'Calle {i}') for i in range(20)
+    ])
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        modo_journal = cursor.fetchone()[0]
+    connection.close()
+
+    resultados = {'escrituras': [], 'lecturas': []}
+    errores = []
+    listos = threading.Barrier(args.escritores + args.lectores + 1)
+    fin = [0.0]
+
+    def escritor(n):
+        client = Client()
+        client.force_login(usuario)
+        listos.wait()
+        i = 0
+        try:
+            while time.perf_counter() < fin[0]:
+                producto = productos[(n + i) % len(productos)]
+                inicio = time.perf_counter()
+                try:
+                    if i % 2:
+                        r = client.post(reverse('actualizar_stock', args=[producto.id]),
+                                        {'accion': 'sumar', 'cantidad': 1})
+                    else:
+                        r = client.post(reverse('api_crear_venta'), json.dumps({
+                            'cliente': clientes[(n + i) % len(clientes)].id,
+                            'lineas': [{'producto': productos[(n + i + k) % len(productos)].id, 'cantidad': 1}
+                                       for k in range(3)],
+                        }), content_type='application/json')
+                    if r.status_code >= 500:
+                        errores.append(f'HTTP {r.status_code}')
+                    else:
+                        resultados['escrituras'].append(time.perf_counter() - inicio)
+                except Exception as e:  # se reportan al final
+                    errores.append(str(e))
+                i += 1
+        finally:
+            connection.close()
+
+    def lector(n):
+        client = Client()
+        client.force_login(usuario)
+        listos.wait()
+        urls = [reverse('consultar_ventas'), reverse('lista_ventas')]
+        i = 0
+        try:
+            while time.perf_counter() < fin[0]:
+                inicio = time.perf_counter()
+                try:
+                    r = client.get(urls[(n + i) % len(urls)])
+                    if r.status_code >= 500:
+                        errores.append(f'HTTP {r.status_code}')
+                    else:
+                        resultados['lecturas'].append(time.perf_counter() - inicio)
+                except Exception as e:  # se reportan al final
+                    errores.append(str(e))
+                i += 1
+        finally:
+            connection.close()
+
+    hilos = [threading.Thread(target=escritor, args=(n,)) for n in range(args.escritores)]
+    hilos += [threading.Thread(target=lector, args=(n,)) for n in range(args.lectores)]
+    for h in hilos:
+        h.start()
+    # Los hilos arrancan juntos cuando todos hicieron login; el plazo se fija justo después
+    fin[0] = time.perf_counter() + 3600
+    listos.wait()
+    fin[0] = time.perf_counter() + args.segundos
+    for h in hilos:
+        h.join()
+
+    return {
+        'perfil': perfil,
+        'journal': modo_journal,
+        'escrituras_s': len(resultados['escrituras']) / args.segundos,
+        'lecturas_s': len(resultados['lecturas']) / args.segundos,
+        'escritura_p95_ms': percentil(resultados['escrituras'], 0.95) * 1000,
+        'lectura_p95_ms': percentil(resultados['lecturas'], 0.95) * 1000,
+        'errores': len(errores),
+        'bloqueos': sum('is locked' in e for e in errores),
+        'primer_error': errores[0] if errores else '',
+    }
+
+
+def imprimir(r):
+    print(f"[{r['perfil']}] journal={r['journal']}")
+    print(f"  Escrituras: {r['escrituras_s']:.1f}/s (p95 {r['escritura_p95_ms']:.0f} ms)")
+    print(f"  Lecturas:   {r['lecturas_s']:.1f}/s (p95 {r['lectura_p95_ms']:.0f} ms)")
+    print(f"  Errores: {r['errores']} ({r['bloqueos']} 'database is locked')"
+          + (f"  primero: {r['primer_error'][:80]}" if r['primer_error'] else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--perfil', choices=['ambos', *PERFILES], default='ambos')
+    parser.add_argument('--escritores', type=int, default=6)
+    parser.add_argument('--lectores', type=int, default=6)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--json', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.perfil != 'ambos':
+        resultado = correr(args.perfil, args)
+        if args.json:
+            print(json.dumps(resultado))
+        else:
+            imprimir(resultado)
+        return
+
+    # Cada perfil en su propio proceso: la configuración de Django es una por proceso
+    print(f'Escritores: {args.escritores}  Lectores: {args.lectores}  Duración: {args.segundos}s\n')
+    resultados = []
+    for perfil in PERFILES:
+        salida = subprocess.run(
+            [sys.executable, __file__, '--perfil', perfil, '--json',
+             '--escritores', str(args.escritores), '--lectores', str(args.lectores),
+             '--segundos', str(args.segundos)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        resultados.append(json.loads(salida.strip().splitlines()[-1]))
+        imprimir(resultados[-1])
+
+    antes, despues = resultados
+    print()
+    for clave, nombre in (('escrituras_s', 'Escrituras'), ('lecturas_s', 'Lecturas')):
+        factor = despues[clave] / antes[clave] if antes[clave] else float('inf')
+        print(f'{nombre}: {antes[clave]:.1f}/s → {despues[clave]:.1f}/s (x{factor:.2f})')
+    print('✅ Sin bloqueos con el perfil de producción' if not despues['bloqueos']
+          else f"❌ {despues['bloqueos']} bloqueos con el perfil de producción")
+    raise SystemExit(0 if not despues['bloqueos'] else 1)
+
+
+if __name__ == '__main__':
+    main()
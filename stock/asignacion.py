@@ -0,0 +1,233 @@
+"""
+Asignación automática de choferes (asignar_envios_pendientes).
+
+Reparte entre los choferes activos las ventas pendientes/confirmadas sin
+chofer de un día (programadas para ese día o sin fecha programada). Cada
+venta, de la más pesada a la más liviana, va al chofer al que menos le
+"cuesta": cuánto se carga en entregas y en unidades respecto del promedio
+del día y, si se pide agrupar por zona, qué tan lejos queda del centro de
+sus otras entregas. Se respetan los topes de cada chofer
+(`capacidad_paradas`, `capacidad_unidades`); lo que no entra en ninguno
+queda sin asignar.
+
+Cuenta lo que cada chofer ya tiene ese día (ventas asignadas y envíos
+activos). `planificar` no escribe nada (vista previa); `aplicar` guarda un
+plan con un solo UPDATE y confirma las pendientes asignadas (el panel del
+chofer sólo muestra confirmadas), reservando su stock en la misma
+transacción.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .eventos import publicar_ventas
+from .models import Chofer, Envio, Ventas
+from .rutas import distancia_km
+from .services import cambiar_estado_ventas
+
+ESTADOS_ASIGNABLES = ('pendiente', 'confirmada')
+
+
+def ventas_asignables(fecha):
+    """Ventas sin chofer para `fecha`, con sus `unidades` anotadas."""
+    return Ventas.objects.filter(
+        Q(fecha_envio_programada=fecha) | Q(fecha_envio_programada__isnull=True),
+        estado__in=ESTADOS_ASIGNABLES,
+        chofer__isnull=True,
+    ).select_related('cliente').annotate(
+        unidades=Coalesce(Sum('detalles__cantidad'), 0)
+    ).order_by('fecha_creacion', 'id')
+
+
+def _punto(latitud, longitud):
+    if latitud is None or longitud is None:
+        return None
+    return float(latitud), float(longitud)
+
+
+class _Carga:
+    """Lo que lleva un chofer en el día (lo que ya tenía + lo que se le suma)."""
+
+    def __init__(self, chofer):
+        self.chofer = chofer
+        self.paradas = 0
+        self.unidades = 0
+        self.nuevas = []
+        self._suma = [0.0, 0.0, 0]  # lat, lon, puntos
+        self.semilla = None
+
+    def sumar(self, unidades, punto):
+        self.paradas += 1
+        self.unidades += unidades
+        if punto:
+            self._suma[0] += punto[0]
+            self._suma[1] += punto[1]
+            self._suma[2] += 1
+
+    @property
+    def centro(self):
+        lat, lon, puntos = self._suma
+        return (lat / puntos, lon / puntos) if puntos else self.semilla
+
+    def entra(self, unidades):
+        capacidad_paradas = self.chofer.capacidad_paradas
+        capacidad_unidades = self.chofer.capacidad_unidades
+        return (
+            (capacidad_paradas is None or self.paradas + 1 <= capacidad_paradas)
+            and (capacidad_unidades is None or self.unidades + unidades <= capacidad_unidades)
+        )
+
+
+def _carga_actual(cargas, fecha):
+    """Suma a cada chofer sus ventas ya asignadas y sus envíos activos del día."""
+    ventas = Ventas.objects.filter(
+        chofer_id__in=cargas, estado__in=ESTADOS_ASIGNABLES, fecha_envio_programada=fecha,
+    ).values('id', 'chofer_id', 'cliente__latitud', 'cliente__longitud').annotate(
+        unidades=Coalesce(Sum('detalles__cantidad'), 0)
+    )
+    envios = Envio.objects.filter(
+        chofer_id__in=cargas, fecha_envio=fecha, estado__in=('pendiente', 'en_camino'),
+    ).values('id', 'chofer_id', 'venta__cliente__latitud', 'venta__cliente__longitud').annotate(
+        unidades=Coalesce(Sum('venta__detalles__cantidad'), 0)
+    )
+    for fila in ventas:
+        cargas[fila['chofer_id']].sumar(fila['unidades'], _punto(fila['cliente__latitud'], fila['cliente__longitud']))
+    for fila in envios:
+        cargas[fila['chofer_id']].sumar(
+            fila['unidades'], _punto(fila['venta__cliente__latitud'], fila['venta__cliente__longitud'])
+        )
+
+
+def _sembrar(cargas, puntos):
+    """
+    Choferes sin entregas con ubicación arrancan en puntos bien separados
+    (el más lejano a todos los centros ya elegidos), así cada uno toma una zona.
+    """
+    centros = [c.centro for c in cargas if c.centro]
+    for carga in cargas:
+        if carga.centro or not puntos:
+            continue
+        if centros:
+            semilla = max(puntos, key=lambda p: min(distancia_km(p, c) for c in centros))
+        else:
+            semilla = puntos[0]
+        carga.semilla = semilla
+        centros.append(semilla)
+
+
+def planificar(fecha, agrupar=False, choferes=None):
+    """
+    Plan de reparto para `fecha` sin guardar nada:
+    {'cargas': [_Carga], 'sin_asignar': [venta], 'asignaciones': {venta_id: chofer_id}}.
+    """
+    if choferes is None:
+        choferes = Chofer.objects.filter(activo=True).order_by('nombre_completo')
+    cargas = {chofer.id: _Carga(chofer) for chofer in choferes}
+    ventas = list(ventas_asignables(fecha))
+    plan = {'cargas': list(cargas.values()), 'sin_asignar': [], 'asignaciones': {}}
+    if not cargas:
+        plan['sin_asignar'] = ventas
+        return plan
+
+    _carga_actual(cargas, fecha)
+    puntos = {venta.id: _punto(venta.cliente.latitud, venta.cliente.longitud) for venta in ventas}
+
+    # Escalas para que entregas, unidades y km pesen parecido
+    meta_paradas = max((sum(c.paradas for c in cargas.values()) + len(ventas)) / len(cargas), 1)
+    meta_unidades = max(
+        (sum(c.unidades for c in cargas.values()) + sum(v.unidades for v in ventas)) / len(cargas), 1
+    )
+    escala_km = 1.0
+    con_ubicacion = [p for p in puntos.values() if p]
+    if agrupar and con_ubicacion:
+        centro = (
+            sum(p[0] for p in con_ubicacion) / len(con_ubicacion),
+            sum(p[1] for p in con_ubicacion) / len(con_ubicacion),
+        )
+        escala_km = max(sum(distancia_km(p, centro) for p in con_ubicacion) / len(con_ubicacion), 0.1)
+        _sembrar(list(cargas.values()), con_ubicacion)
+
+    for venta in sorted(ventas, key=lambda v: (-v.unidades, v.fecha_creacion, v.id)):
+        punto = puntos[venta.id]
+
+        def costo(carga):
+            valor = (carga.paradas + 1) / meta_paradas + (carga.unidades + venta.unidades) / meta_unidades
+            if agrupar and punto and carga.centro:
+                valor += distancia_km(punto, carga.centro) / escala_km
+            return valor, carga.chofer.nombre_completo, carga.chofer.id
+
+        candidatas = [carga for carga in cargas.values() if carga.entra(venta.unidades)]
+        if not candidatas:
+            plan['sin_asignar'].append(venta)
+            continue
+        elegida = min(candidatas, key=costo)
+        elegida.sumar(venta.unidades, punto)
+        elegida.nuevas.append(venta)
+        plan['asignaciones'][venta.id] = elegida.chofer.id
+    return plan
+
+
+def aplicar(fecha, asignaciones, usuario=None):
+    """
+    Guarda {venta_id: chofer_id} en UN UPDATE (CASE por chofer), sólo sobre
+    ventas que siguen sin chofer y asignables, y sólo con choferes activos.
+    Programa para `fecha` las que no tenían fecha. Las pendientes pasan a
+    confirmada con cambiar_estado_ventas (reserva de stock e historial); las
+    que no tienen disponible vuelven a quedar sin chofer y con la fecha que
+    tenían.
+    Devuelve cuántas se asignaron.
+    """
+    activos = set(Chofer.objects.filter(
+        activo=True, id__in=set(asignaciones.values())
+    ).values_list('id', flat=True))
+    por_chofer = defaultdict(list)
+    for venta_id, chofer_id in asignaciones.items():
+        if chofer_id in activos:
+            por_chofer[chofer_id].append(venta_id)
+    ids = [venta_id for ventas in por_chofer.values() for venta_id in ventas]
+    if not ids:
+        return 0
+
+    with transaction.atomic():
+        # Las que siguen asignables, leídas antes del UPDATE: se asignan y
+        # confirman exactamente esas (con la fecha que tenían, para deshacer)
+        libres = {
+            venta_id: (estado, programada)
+            for venta_id, estado, programada in Ventas.objects.select_for_update().filter(
+                id__in=ids, chofer__isnull=True, estado__in=ESTADOS_ASIGNABLES,
+            ).filter(
+                Q(fecha_envio_programada=fecha) | Q(fecha_envio_programada__isnull=True)
+            ).values_list('id', 'estado', 'fecha_envio_programada')
+        }
+        if not libres:
+            return 0
+        Ventas.objects.filter(id__in=libres).update(
+            chofer_id=Case(
+                *[When(id__in=ventas, then=Value(chofer_id)) for chofer_id, ventas in por_chofer.items()],
+                output_field=IntegerField(),
+            ),
+            fecha_envio_programada=fecha,
+            fecha_modificacion=timezone.now(),
+        )
+        confirmadas = [venta_id for venta_id, (estado, _) in libres.items() if estado == 'confirmada']
+        pendientes = [venta_id for venta_id, (estado, _) in libres.items() if estado == 'pendiente']
+
+        # Confirmar ya publica sus eventos en vivo
+        sin_stock = [
+            venta_id
+            for venta_id, (aceptada, _) in cambiar_estado_ventas(pendientes, 'confirmada', usuario).items()
+            if not aceptada
+        ]
+        if sin_stock:
+            # Quedan como estaban: sin chofer y, si no tenían fecha, sin fecha
+            Ventas.objects.filter(id__in=sin_stock).update(chofer=None, fecha_modificacion=timezone.now())
+            Ventas.objects.filter(
+                id__in=[venta_id for venta_id in sin_stock if libres[venta_id][1] is None]
+            ).update(fecha_envio_programada=None)
+
+        # update() no dispara señales: eventos en vivo a mano
+        publicar_ventas(Ventas.objects.filter(id__in=confirmadas))
+    return len(libres) - len(sin_stock)
@@ -0,0 +1,81 @@
+"""
+Cache versionado del catálogo de productos.
+
+Los payloads del catálogo (api_productos, lista_productos, selector de
+productos de crear_venta) se guardan bajo `catalogo:<version>:...`. Cualquier
+cambio en Producto/ImagenProducto/TipoProducto cambia la versión (señales en
+stock.signals, y stock.services para los UPDATE de stock), así que las
+entradas viejas simplemente dejan de leerse y expiran solas.
+
+La versión vive en el mismo cache: con FileBasedCache todos los workers la
+comparten; LocMemCache es por proceso (sirve para un único worker/dev).
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+CLAVE_VERSION = 'catalogo:version'
+CLAVE_HITS = 'catalogo:hits'
+CLAVE_MISSES = 'catalogo:misses'
+TIMEOUT = 60 * 60
+
+
+def version_catalogo():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Un valor nuevo (no 1): si el cache perdió la clave no se reusan entradas viejas
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def _bump_version():
+    cache.set(CLAVE_VERSION, time.time_ns(), None)
+
+
+def invalidar_catalogo():
+    """Cambia la versión cuando la transacción en curso confirma."""
+    transaction.on_commit(_bump_version)
+
+
+def _contar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.add(clave, 0, None)
+        cache.incr(clave)
+
+
+def obtener_o_construir(nombre, parametros, construir, timeout=TIMEOUT):
+    """
+    Devuelve el payload `nombre` para `parametros` (str) de la versión actual
+    del catálogo, o lo construye con `construir()` y lo guarda.
+    """
+    firma = hashlib.sha1(parametros.encode()).hexdigest()
+    clave = f'catalogo:{version_catalogo()}:{nombre}:{firma}'
+    valor = cache.get(clave)
+    if valor is not None:
+        _contar(CLAVE_HITS)
+        return valor
+    _contar(CLAVE_MISSES)
+    valor = construir()
+    cache.set(clave, valor, timeout)
+    return valor
+
+
+def estadisticas():
+    hits = cache.get(CLAVE_HITS, 0)
+    misses = cache.get(CLAVE_MISSES, 0)
+    total = hits + misses
+    return {
+        'version': cache.get(CLAVE_VERSION),
+        'hits': hits,
+        'misses': misses,
+        'ratio': hits / total if total else 0.0,
+    }
+
+
+def reiniciar_estadisticas():
+    cache.delete_many([CLAVE_HITS, CLAVE_MISSES])
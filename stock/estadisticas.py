@@ -0,0 +1,215 @@
+"""
+Estadísticas semanales de choferes (chofer_historial y ranking_choferes).
+
+Cuando un envío se cierra (entregado o cancelado) se suma en la fila del
+chofer y la semana de su fecha de envío: entregados, entregados a tiempo
+(hora real de entrega contra fecha de envío + hora estimada, con
+settings.ESTADISTICAS_TOLERANCIA_MINUTOS de tolerancia), minutos de
+atraso, cancelados y los días con entregas. Si el envío se reabre, cambia
+de chofer o de fecha, se resta lo que había sumado. Así el historial y el
+ranking leen una fila por chofer y semana en vez de recorrer todos los
+envíos. `reconstruir()` las rehace desde cero.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Envio, ResumenChoferSemana
+
+ESTADOS_CERRADOS = ('entregado', 'cancelado')
+
+# Lo que hace falta de un envío para saber cuánto suma (en este orden)
+CAMPOS = ('chofer_id', 'fecha_envio', 'hora_estimada', 'hora_real_entrega', 'estado')
+
+
+def inicio_semana(dia):
+    return dia - timedelta(days=dia.weekday())
+
+
+def _tolerancia():
+    return timedelta(minutes=getattr(settings, 'ESTADISTICAS_TOLERANCIA_MINUTOS', 15))
+
+
+def aporte(chofer_id, fecha_envio, hora_estimada, hora_real_entrega, estado, tolerancia):
+    """(clave, valores) que un envío suma a su fila semanal, o None si no suma."""
+    if chofer_id is None or fecha_envio is None or estado not in ESTADOS_CERRADOS:
+        return None
+    clave = {'chofer_id': chofer_id, 'semana': inicio_semana(fecha_envio)}
+    if estado == 'cancelado':
+        return clave, {'cancelados': 1}
+
+    valores = {'entregados': 1, 'a_tiempo': 1, 'dias': 1 << fecha_envio.weekday()}
+    # Sin hora de entrega (cargados antes de registrarla) no hay atraso que medir
+    if hora_real_entrega is not None and hora_estimada is not None:
+        prevista = timezone.make_aware(datetime.combine(fecha_envio, hora_estimada))
+        atraso = hora_real_entrega - prevista
+        if atraso > tolerancia:
+            valores['a_tiempo'] = 0
+            valores['minutos_demora'] = int(atraso.total_seconds() // 60)
+    return clave, valores
+
+
+def _dias_con_entregas(chofer_id, semana):
+    """Máscara de días con entregas de la semana, desde los envíos (índice chofer/estado/fecha)."""
+    mascara = 0
+    for dia in Envio.objects.filter(
+        chofer_id=chofer_id, estado='entregado',
+        fecha_envio__gte=semana, fecha_envio__lt=semana + timedelta(days=7),
+    ).dates('fecha_envio', 'day'):
+        mascara |= 1 << dia.weekday()
+    return mascara
+
+
+def _sumar(clave, valores, signo):
+    """Suma (o resta) en la fila `clave` con UPDATE ... SET x = x + n; la crea si hace falta."""
+    incrementos = {campo: F(campo) + signo * n for campo, n in valores.items() if campo != 'dias'}
+    if signo > 0 and 'dias' in valores:
+        incrementos['dias'] = F('dias').bitor(valores['dias'])
+    filas = ResumenChoferSemana.objects.filter(**clave)
+    if not filas.update(**incrementos) and signo > 0:
+        try:
+            with transaction.atomic():
+                ResumenChoferSemana.objects.create(**clave, **valores)
+        except IntegrityError:
+            # Otro request creó la fila entre el UPDATE y el INSERT
+            filas.update(**incrementos)
+    if signo < 0 and 'dias' in valores:
+        # Un bit no se puede "restar": puede haber otra entrega el mismo día
+        filas.update(dias=_dias_con_entregas(clave['chofer_id'], clave['semana']))
+
+
+def datos(envio):
+    """Los CAMPOS de un envío en memoria, con los tipos de la base."""
+    return {
+        'chofer_id': envio.chofer_id,
+        **{campo: Envio._meta.get_field(campo).to_python(getattr(envio, campo)) for campo in CAMPOS[1:]},
+    }
+
+
+def registrar_cambio(antes, despues):
+    """
+    Ajusta las estadísticas por un envío que pasó de `antes` a `despues`
+    (dicts con CAMPOS; None si se creó o se borró).
+    """
+    if antes == despues:
+        return
+    tolerancia = _tolerancia()
+    restar = aporte(*(antes[c] for c in CAMPOS), tolerancia) if antes else None
+    sumar = aporte(*(despues[c] for c in CAMPOS), tolerancia) if despues else None
+    if restar == sumar:
+        return
+    with transaction.atomic():
+        if restar:
+            _sumar(*restar, -1)
+        if sumar:
+            _sumar(*sumar, 1)
+
+
+# ------------------------------
+#  Lectura
+# ------------------------------
+class Totales:
+    """Indicadores de una o varias filas semanales sumadas."""
+
+    def __init__(self, filas=(), chofer=None, semana=None):
+        self.chofer = chofer
+        self.semana = semana
+        self.entregados = self.a_tiempo = self.minutos_demora = 0
+        self.cancelados = self.dias_trabajados = 0
+        for fila in filas:
+            self.entregados += fila.entregados
+            self.a_tiempo += fila.a_tiempo
+            self.minutos_demora += fila.minutos_demora
+            self.cancelados += fila.cancelados
+            self.dias_trabajados += bin(fila.dias).count('1')
+
+    @property
+    def tardes(self):
+        return self.entregados - self.a_tiempo
+
+    @property
+    def tasa_a_tiempo(self):
+        return round(self.a_tiempo * 100 / self.entregados, 1) if self.entregados else None
+
+    @property
+    def demora_promedio(self):
+        """Minutos promedio de atraso de las entregas que llegaron tarde."""
+        return round(self.minutos_demora / self.tardes) if self.tardes else 0
+
+    @property
+    def entregas_por_dia(self):
+        return round(self.entregados / self.dias_trabajados, 1) if self.dias_trabajados else 0
+
+    @property
+    def tasa_cancelacion(self):
+        cerrados = self.entregados + self.cancelados
+        return round(self.cancelados * 100 / cerrados, 1) if cerrados else None
+
+    def como_dict(self):
+        return {
+            'entregados': self.entregados,
+            'a_tiempo': self.a_tiempo,
+            'cancelados': self.cancelados,
+            'dias_trabajados': self.dias_trabajados,
+            'tasa_a_tiempo': self.tasa_a_tiempo,
+            'demora_promedio': self.demora_promedio,
+            'entregas_por_dia': self.entregas_por_dia,
+            'tasa_cancelacion': self.tasa_cancelacion,
+        }
+
+
+def historial(chofer, desde=None, hasta=None):
+    """(Totales del período, [Totales de cada semana, la más reciente primero])."""
+    filas = ResumenChoferSemana.objects.filter(chofer=chofer)
+    if desde:
+        filas = filas.filter(semana__gte=inicio_semana(desde))
+    if hasta:
+        filas = filas.filter(semana__lte=hasta)
+    filas = list(filas.order_by('-semana'))
+    return Totales(filas, chofer), [Totales([fila], chofer, fila.semana) for fila in filas]
+
+
+def ranking(desde, hasta):
+    """
+    Totales por chofer de las semanas entre `desde` y `hasta`, mejor
+    puntualidad primero (a igual puntualidad, más entregas).
+    """
+    por_chofer = defaultdict(list)
+    for fila in ResumenChoferSemana.objects.filter(
+        semana__gte=inicio_semana(desde), semana__lte=hasta
+    ).select_related('chofer'):
+        por_chofer[fila.chofer].append(fila)
+    totales = [Totales(filas, chofer) for chofer, filas in por_chofer.items()]
+    return sorted(totales, key=lambda t: (
+        -(t.tasa_a_tiempo if t.tasa_a_tiempo is not None else -1),
+        -t.entregados,
+        t.chofer.nombre_completo,
+    ))
+
+
+def reconstruir():
+    """Borra y recalcula todas las filas semanales. Devuelve cuántas quedaron."""
+    tolerancia = _tolerancia()
+    filas = defaultdict(lambda: defaultdict(int))
+    for valores in Envio.objects.filter(
+        estado__in=ESTADOS_CERRADOS, chofer__isnull=False
+    ).values_list(*CAMPOS).iterator():
+        resultado = aporte(*valores, tolerancia)
+        if resultado is None:
+            continue
+        clave, sumas = resultado
+        fila = filas[clave['chofer_id'], clave['semana']]
+        for campo, n in sumas.items():
+            fila[campo] = fila[campo] | n if campo == 'dias' else fila[campo] + n
+
+    with transaction.atomic():
+        ResumenChoferSemana.objects.all().delete()
+        creadas = ResumenChoferSemana.objects.bulk_create([
+            ResumenChoferSemana(chofer_id=chofer_id, semana=semana, **valores)
+            for (chofer_id, semana), valores in filas.items()
+        ], batch_size=500)
+    return len(creadas)
@@ -0,0 +1,188 @@
+"""
+Eventos en vivo de envíos y ventas (cambio de estado o de chofer).
+
+Los publican las señales de Envio/Ventas y los servicios que escriben con
+update()/bulk_create (esos no disparan señales), siempre después del commit.
+`lista_envios` y `programa_dia` los reciben por Server-Sent Events
+(`envios/eventos/`) y actualizan la fila en el lugar en vez de recargar.
+
+El broker por defecto vive en memoria del proceso: alcanza con un solo
+worker ASGI. Con varios workers se reemplaza por otro con la misma interfaz
+(`publicar`, `suscribir`, `desuscribir`) vía settings.EVENTOS_BROKER.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+class Suscripcion:
+    """Cola de un cliente conectado; vive en el event loop de su stream."""
+
+    def __init__(self, loop, tamanio=1000):
+        self._loop = loop
+        self._cola = asyncio.Queue(maxsize=tamanio)
+        self.desbordada = False
+
+    def entregar(self, evento):
+        # Se llama desde el hilo que hizo el commit, no desde el loop
+        try:
+            self._loop.call_soon_threadsafe(self._poner, evento)
+        except RuntimeError:
+            pass  # loop cerrado: el cliente ya se fue
+
+    def _poner(self, evento):
+        try:
+            self._cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Cliente que no lee: se corta y al reconectar pide desde su último id
+            self.desbordada = True
+
+    async def siguiente(self, espera):
+        """Próximo evento, o None si pasan `espera` segundos sin ninguno."""
+        try:
+            return await asyncio.wait_for(self._cola.get(), espera)
+        except asyncio.TimeoutError:
+            return None
+
+
+class BrokerLocal:
+    """
+    Broker en memoria. Numera los eventos y guarda los últimos `historial`
+    para que un cliente que reconecta con Last-Event-ID no pierda ninguno.
+    """
+
+    def __init__(self, historial=500):
+        self._lock = threading.Lock()
+        self._suscripciones = set()
+        self._historial = deque(maxlen=historial)
+        self._secuencia = 0
+
+    def publicar(self, evento):
+        with self._lock:
+            self._secuencia += 1
+            evento = {**evento, 'secuencia': self._secuencia}
+            self._historial.append(evento)
+            suscripciones = list(self._suscripciones)
+        for suscripcion in suscripciones:
+            suscripcion.entregar(evento)
+
+    def suscribir(self, desde=None):
+        """Nueva suscripción (llamar desde el loop); con `desde` repite lo posterior."""
+        suscripcion = Suscripcion(asyncio.get_running_loop())
+        with self._lock:
+            self._suscripciones.add(suscripcion)
+            if desde is not None:
+                for evento in self._historial:
+                    if evento['secuencia'] > desde:
+                        suscripcion._poner(evento)
+        return suscripcion
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+
+@lru_cache(maxsize=None)
+def broker():
+    return import_string(getattr(settings, 'EVENTOS_BROKER', 'stock.eventos.BrokerLocal'))()
+
+
+def _texto(valor):
+    return str(valor) if valor is not None else None
+
+
+def evento_envio(envio, chofer_anterior=None):
+    return {
+        'tipo': 'envio',
+        'objeto': envio.id,
+        'venta': envio.venta_id,
+        'estado': envio.estado,
+        'estado_display': envio.get_estado_display(),
+        'chofer': envio.chofer_id,
+        'chofer_anterior': chofer_anterior,
+        'fecha': _texto(envio.fecha_envio),
+        'hora_estimada': _texto(envio.hora_estimada),
+    }
+
+
+def evento_venta(venta, chofer_anterior=None):
+    fecha = venta.fecha_envio_programada
+    if not fecha and venta.fecha_envio:
+        fecha = timezone.localdate(venta.fecha_envio)
+    return {
+        'tipo': 'venta',
+        'objeto': venta.id,
+        'estado': venta.estado,
+        'estado_display': venta.get_estado_display(),
+        'chofer': venta.chofer_id,
+        'chofer_anterior': chofer_anterior,
+        'fecha': _texto(fecha),
+    }
+
+
+def publicar(evento):
+    """Publica `evento` cuando la transacción en curso confirme (o ya, si no hay)."""
+    transaction.on_commit(lambda: broker().publicar(evento))
+
+
+def publicar_envios(envios):
+    for envio in envios:
+        publicar(evento_envio(envio))
+
+
+def publicar_ventas(ventas):
+    for venta in ventas:
+        publicar(evento_venta(venta))
+
+
+def coincide(evento, fecha=None, chofer=None, tipos=None):
+    """Filtro de un stream: por fecha, chofer (id como texto) y tipo."""
+    if tipos and evento['tipo'] not in tipos:
+        return False
+    if fecha and evento['fecha'] != fecha:
+        return False
+    # Un cambio de chofer le interesa también al que lo tenía
+    if chofer and chofer not in (str(evento['chofer']), str(evento['chofer_anterior'])):
+        return False
+    return True
+
+
+# ------------------------------
+#  Stream SSE
+# ------------------------------
+LATIDO = 15  # segundos sin eventos antes de mandar un comentario de latido
+# En Django 4.2 el stream no se entera si el cliente se fue: se corta
+# cada tanto y EventSource reconecta solo, con Last-Event-ID
+DURACION_MAXIMA = 10 * 60
+
+
+def _mensaje_sse(evento):
+    return (
+        f"id: {evento['secuencia']}\n"
+        f"event: {evento['tipo']}\n"
+        f"data: {json.dumps(evento)}\n\n"
+    )
+
+
+async def flujo_sse(fecha=None, chofer=None, tipos=None, desde=None):
+    """Generador asíncrono con los eventos que pasan el filtro, en formato SSE."""
+    suscripcion = broker().suscribir(desde)
+    limite = time.monotonic() + DURACION_MAXIMA
+    try:
+        yield 'retry: 3000\n\n'
+        while not suscripcion.desbordada and time.monotonic() < limite:
+            evento = await suscripcion.siguiente(LATIDO)
+            if evento is None:
+                yield ': latido\n\n'
+            elif coincide(evento, fecha, chofer, tipos):
+                yield _mensaje_sse(evento)
+    finally:
+        broker().desuscribir(suscripcion)
@@ -0,0 +1,197 @@
+"""
+Exportaciones de ventas y envíos en CSV y XLSX, en streaming.
+
+Las filas se leen con `iterator(chunk_size=...)` y se escriben a medida que
+llegan: ni el queryset ni el archivo completo quedan en memoria, así un año
+entero de ventas pesa lo mismo para el worker que un día.
+
+El XLSX se arma a mano (zip + XML de hoja con celdas inline) escribiendo el
+zip sobre un buffer que se vacía en cada tanda de filas; no hace falta
+ninguna librería extra.
+"""
+import csv
+import datetime
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import DetalleVenta
+
+TAMANIO_TANDA = 2000
+
+COLUMNAS_DETALLE = [
+    'Venta', 'Fecha envío', 'Estado venta', 'Cliente', 'Producto',
+    'Cantidad', 'Precio unitario', 'Subtotal', 'Chofer', 'Estado envío',
+]
+
+COLUMNAS_ENVIO = [
+    'Envío', 'Fecha envío', 'Hora estimada', 'Estado envío', 'Chofer',
+    'Venta', 'Cliente', 'Producto', 'Cantidad', 'Subtotal',
+]
+
+
+def filas_ventas(ventas):
+    """Una fila por DetalleVenta de las ventas dadas."""
+    return DetalleVenta.objects.filter(venta__in=ventas).order_by(
+        'venta__fecha_envio', 'venta_id', 'id'
+    ).values_list(
+        'venta_id', 'venta__fecha_envio', 'venta__estado', 'venta__cliente__nombre_completo',
+        'producto__nombre', 'cantidad', 'precio_unitario', 'subtotal',
+        # Despachadas: el chofer queda en el Envio; la venta sólo lo tiene si se asignó antes
+        Coalesce('venta__envio__chofer__nombre_completo', 'venta__chofer__nombre_completo'),
+        'venta__envio__estado',
+    ).iterator(chunk_size=TAMANIO_TANDA)
+
+
+def filas_envios(envios):
+    """Una fila por DetalleVenta de la venta de cada envío."""
+    return envios.order_by(
+        'fecha_envio', 'hora_estimada', 'id', 'venta__detalles__id'
+    ).values_list(
+        'id', 'fecha_envio', 'hora_estimada', 'estado', 'chofer__nombre_completo',
+        'venta_id', 'venta__cliente__nombre_completo', 'venta__detalles__producto__nombre',
+        'venta__detalles__cantidad', 'venta__detalles__subtotal',
+    ).iterator(chunk_size=TAMANIO_TANDA)
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime.datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.localtime(valor)
+        return valor.strftime('%Y-%m-%d %H:%M')
+    if isinstance(valor, (datetime.date, datetime.time)):
+        return valor.isoformat()
+    return str(valor)
+
+
+# ------------------------------
+#  CSV
+# ------------------------------
+class _Eco:
+    """Pseudo-archivo: csv.writer devuelve la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _csv(columnas, filas):
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel reconozca UTF-8 (tildes, ñ)
+    yield '\ufeff' + escritor.writerow(columnas)
+    for fila in filas:
+        yield escritor.writerow([_texto(v) for v in fila])
+
+
+# ------------------------------
+#  XLSX
+# ------------------------------
+_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{hoja}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+class _Tubo:
+    """Destino del zip: junta lo escrito hasta que el generador lo entrega."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def _celda(valor):
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(_INVALIDOS_XML.sub('', _texto(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xml(valores):
+    return ('<row>' + ''.join(_celda(v) for v in valores) + '</row>').encode()
+
+
+def _xlsx(columnas, filas, hoja):
+    tubo = _Tubo()
+    # Sin tell()/seek() zipfile escribe en modo streaming (data descriptors)
+    with zipfile.ZipFile(tubo, 'w', compression=zipfile.ZIP_DEFLATED) as archivo:
+        archivo.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archivo.writestr('_rels/.rels', _RELS)
+        archivo.writestr('xl/workbook.xml', _WORKBOOK.format(hoja=escape(hoja)))
+        archivo.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+
+        with archivo.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja_xml:
+            hoja_xml.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            hoja_xml.write(_fila_xml(columnas))
+            for numero, fila in enumerate(filas, 1):
+                hoja_xml.write(_fila_xml(fila))
+                if numero % TAMANIO_TANDA == 0:
+                    yield tubo.vaciar()
+            hoja_xml.write(b'</sheetData></worksheet>')
+    yield tubo.vaciar()
+
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def respuesta_exportacion(nombre, columnas, filas, formato='csv'):
+    """StreamingHttpResponse con `filas` en CSV (por defecto) o XLSX."""
+    if formato not in FORMATOS:
+        formato = 'csv'
+    content_type, extension = FORMATOS[formato]
+    if formato == 'xlsx':
+        contenido = _xlsx(columnas, filas, hoja=nombre[:31])
+    else:
+        contenido = _csv(columnas, filas)
+
+    response = StreamingHttpResponse(contenido, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{nombre}.{extension}"'
+    return response
@@ -0,0 +1,115 @@
+"""
+Filtros de los listados (ventas, envíos, historial del chofer) a partir de
+los parámetros GET.
+
+Las fechas del formulario (YYYY-MM-DD) se traducen a rangos semiabiertos
+sobre la columna tal cual: `desde` incluye desde las 00:00 de ese día y
+`hasta` llega hasta antes de las 00:00 del día siguiente, en la zona
+horaria local. Un `fecha_creacion__date__gte` envuelve la columna en una
+función y SQLite ya no puede usar el índice; `fecha_creacion__gte=<datetime>`
+sí. Las fechas inválidas se ignoran en vez de romper la consulta.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import DateTimeField
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import DetalleVenta, Envio, Ventas
+from .resumenes import ESTADOS_CONTABLES
+
+ESTADOS_POR_DESPACHAR = ('pendiente', 'confirmada')
+
+
+def fecha(parametros, nombre):
+    """`date` del parámetro `nombre`, o None si falta o no es una fecha."""
+    try:
+        return parse_date(parametros.get(nombre) or '')
+    except ValueError:
+        return None
+
+
+def inicio_del_dia(dia):
+    """00:00 de `dia` en la zona horaria actual (aware)."""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def rango(queryset, campo, desde=None, hasta=None):
+    """
+    Filtra `campo` entre los días `desde` y `hasta` (ambos incluidos) como
+    `campo >= desde AND campo < hasta + 1`. Sirve para DateField y
+    DateTimeField; en el segundo caso los límites son las 00:00 locales.
+    """
+    es_datetime = isinstance(queryset.model._meta.get_field(campo), DateTimeField)
+    if desde:
+        queryset = queryset.filter(**{
+            f'{campo}__gte': inicio_del_dia(desde) if es_datetime else desde
+        })
+    if hasta:
+        siguiente = hasta + timedelta(days=1)
+        queryset = queryset.filter(**{
+            f'{campo}__lt': inicio_del_dia(siguiente) if es_datetime else siguiente
+        })
+    return queryset
+
+
+def ventas(parametros):
+    """lista_ventas: estado, cliente y rango de creación."""
+    qs = Ventas.objects.all()
+    if parametros.get('estado'):
+        qs = qs.filter(estado=parametros['estado'])
+    if parametros.get('cliente'):
+        qs = qs.filter(cliente_id=parametros['cliente'])
+    return rango(qs, 'fecha_creacion', fecha(parametros, 'desde'), fecha(parametros, 'hasta'))
+
+
+def ventas_consultadas(parametros):
+    """consultar_ventas y su exportación: SOLO enviadas/entregadas, por fecha de envío."""
+    qs = Ventas.objects.filter(estado__in=ESTADOS_CONTABLES)
+    qs = rango(qs, 'fecha_envio', fecha(parametros, 'desde'), fecha(parametros, 'hasta'))
+    if parametros.get('cliente'):
+        qs = qs.filter(cliente_id=parametros['cliente'])
+    if parametros.get('producto'):
+        qs = qs.filter(id__in=DetalleVenta.objects.filter(
+            producto_id=parametros['producto']
+        ).values('venta_id'))
+    return qs
+
+
+def ventas_por_despachar(parametros):
+    """asignar_envios_pendientes: pendientes y confirmadas, por cliente y día de creación."""
+    qs = Ventas.objects.filter(estado__in=ESTADOS_POR_DESPACHAR)
+    if parametros.get('cliente'):
+        qs = qs.filter(cliente_id=parametros['cliente'])
+    dia = fecha(parametros, 'fecha')
+    return rango(qs, 'fecha_creacion', dia, dia)
+
+
+def envios(parametros):
+    """
+    lista_envios y su exportación.
+    Un día con `fecha` o un rango con `desde`/`hasta`; sin nada, hoy.
+    """
+    qs = Envio.objects.all()
+    dia = fecha(parametros, 'fecha')
+    desde, hasta = fecha(parametros, 'desde'), fecha(parametros, 'hasta')
+    if dia:
+        qs = qs.filter(fecha_envio=dia)
+    elif desde or hasta:
+        qs = rango(qs, 'fecha_envio', desde, hasta)
+    else:
+        qs = qs.filter(fecha_envio=timezone.localdate())
+
+    if parametros.get('chofer'):
+        qs = qs.filter(chofer_id=parametros['chofer'])
+    if parametros.get('estado'):
+        qs = qs.filter(estado=parametros['estado'])
+    return qs
+
+
+def historial_chofer(chofer, parametros):
+    """chofer_historial: envíos del chofer por estado y rango de fecha de envío."""
+    qs = Envio.objects.filter(chofer=chofer)
+    if parametros.get('estado'):
+        qs = qs.filter(estado=parametros['estado'])
+    return rango(qs, 'fecha_envio', fecha(parametros, 'desde'), fecha(parametros, 'hasta'))
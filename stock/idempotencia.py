@@ -0,0 +1,115 @@
+"""
+Idempotencia para POSTs que no deben ejecutarse dos veces.
+
+El cliente manda una clave única por operación: header `Idempotency-Key`
+(API) o el campo oculto `idempotency_key` que agrega `{% clave_idempotencia %}`
+en los formularios. La primera vez se ejecuta la vista y se guarda la
+respuesta; los reintentos con la misma clave reciben esa respuesta sin
+volver a ejecutar nada. Sin clave, la vista funciona como siempre.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import ClaveIdempotencia
+
+CABECERA = 'HTTP_IDEMPOTENCY_KEY'
+CAMPO_FORM = 'idempotency_key'
+
+
+def ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCIA_TTL', 60 * 60 * 24))
+
+
+def _firmar(request, clave_cliente):
+    usuario_id = request.user.id if request.user.is_authenticated else ''
+    crudo = f'{usuario_id}|{request.path}|{clave_cliente}'
+    return hashlib.sha256(crudo.encode()).hexdigest()
+
+
+def _guardar(registro, response):
+    if hasattr(response, 'data') and not getattr(response, 'is_rendered', True):
+        # Response de DRF todavía sin renderizar: se guarda como JSON
+        cuerpo = json.dumps(response.data, cls=DjangoJSONEncoder).encode()
+        content_type = 'application/json'
+    else:
+        cuerpo = b'' if response.streaming else response.content
+        content_type = response.get('Content-Type', '')
+
+    registro.estado = 'completada'
+    registro.codigo_http = response.status_code
+    registro.content_type = content_type
+    registro.ubicacion = response.get('Location', '')
+    registro.cuerpo = cuerpo
+    registro.save(update_fields=['estado', 'codigo_http', 'content_type', 'ubicacion', 'cuerpo'])
+
+
+def _reproducir(request, registro):
+    response = HttpResponse(
+        bytes(registro.cuerpo), status=registro.codigo_http, content_type=registro.content_type or None
+    )
+    if registro.ubicacion:
+        response['Location'] = registro.ubicacion
+    response['Idempotent-Replayed'] = 'true'
+    if 'json' not in registro.content_type:
+        messages.info(request, 'ℹ️ Esta operación ya había sido procesada')
+    return response
+
+
+def idempotente(vista):
+    """Decorador para vistas POST: ejecuta una sola vez por clave."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        clave_cliente = request.META.get(CABECERA) or (
+            request.POST.get(CAMPO_FORM) if request.method == 'POST' else None
+        )
+        if request.method != 'POST' or not clave_cliente:
+            return vista(request, *args, **kwargs)
+
+        clave = _firmar(request, clave_cliente)
+        ClaveIdempotencia.objects.filter(
+            clave=clave, fecha_creacion__lt=timezone.now() - ttl()
+        ).delete()
+
+        try:
+            with transaction.atomic():
+                registro = ClaveIdempotencia.objects.create(
+                    clave=clave,
+                    usuario=request.user if request.user.is_authenticated else None,
+                )
+        except IntegrityError:
+            registro = ClaveIdempotencia.objects.filter(clave=clave).first()
+            if registro is not None and registro.estado == 'completada':
+                return _reproducir(request, registro)
+            return HttpResponse('⏳ La operación ya se está procesando', status=409)
+
+        try:
+            response = vista(request, *args, **kwargs)
+        except Exception:
+            # Falló: se libera la clave para que el reintento pueda ejecutarse
+            registro.delete()
+            raise
+
+        if response.status_code >= 500:
+            registro.delete()
+        else:
+            _guardar(registro, response)
+        return response
+
+    return envoltura
+
+
+def purgar_vencidas():
+    """Borra las claves más viejas que el TTL. Devuelve cuántas."""
+    borradas, _ = ClaveIdempotencia.objects.filter(
+        fecha_creacion__lt=timezone.now() - ttl()
+    ).delete()
+    return borradas
@@ -0,0 +1,205 @@
+"""
+Archivos de imágenes de producto.
+
+Los originales se guardan por contenido (`productos/<sha256>.<ext>`): la misma
+foto subida para varios productos ocupa un solo archivo, y sus derivados
+también se comparten. `manage.py limpiar_media` borra lo que ya nadie
+referencia.
+
+Cada imagen subida se reescala a miniatura/tarjeta/completa en WebP y en JPEG
+(fallback) y las rutas quedan en `ImagenProducto.variantes`. La generación
+corre en un hilo aparte después del commit, así `subir_imagen` responde en
+cuanto guarda el original; `manage.py generar_derivados` completa lo que
+haya quedado pendiente (p.ej. si el proceso se reinició).
+
+Requiere Pillow. Sin Pillow se sirve el original, como antes.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import invalidar_catalogo
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow es opcional
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# (nombre, ancho máximo en px)
+TAMANIOS = [
+    ('miniatura', 160),
+    ('tarjeta', 480),
+    ('completa', 1280),
+]
+CALIDAD_WEBP = 80
+CALIDAD_JPEG = 82
+CARPETA_ORIGINALES = 'productos'
+CARPETA_DERIVADOS = 'productos/derivados'
+
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='derivados')
+
+
+def pillow_disponible():
+    return Image is not None
+
+
+def guardar_original(archivo):
+    """
+    Guarda un UploadedFile bajo su hash SHA-256 y devuelve la ruta relativa.
+    Si ya existe un archivo con el mismo contenido no se escribe de nuevo.
+    """
+    extension = os.path.splitext(archivo.name)[1].lower()
+    carpeta = os.path.join(settings.MEDIA_ROOT, CARPETA_ORIGINALES)
+    os.makedirs(carpeta, exist_ok=True)
+
+    sha = hashlib.sha256()
+    # Se escribe a un temporal en la misma carpeta para poder renombrar atómicamente
+    descriptor, temporal = tempfile.mkstemp(dir=carpeta, prefix='.subida-')
+    try:
+        with os.fdopen(descriptor, 'wb') as destino:
+            for chunk in archivo.chunks():
+                sha.update(chunk)
+                destino.write(chunk)
+
+        ruta_relativa = f'{CARPETA_ORIGINALES}/{sha.hexdigest()}{extension}'
+        ruta_completa = os.path.join(settings.MEDIA_ROOT, ruta_relativa)
+        if os.path.exists(ruta_completa):
+            os.remove(temporal)
+            # Renovar mtime: el GC no toca archivos recién usados
+            os.utime(ruta_completa)
+        else:
+            os.replace(temporal, ruta_completa)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return ruta_relativa
+
+
+def variantes_existentes(ruta):
+    """Derivados ya generados para el mismo archivo (dedup): {} si no hay."""
+    from .models import ImagenProducto
+    return (
+        ImagenProducto.objects.filter(ruta=ruta)
+        .exclude(variantes={})
+        .values_list('variantes', flat=True)
+        .first()
+    ) or {}
+
+
+def referencias_media():
+    """Counter {ruta relativa: cantidad de ImagenProducto que la usan}."""
+    from .models import ImagenProducto
+    referencias = Counter()
+    for ruta, variantes in ImagenProducto.objects.values_list('ruta', 'variantes').iterator():
+        referencias[ruta] += 1
+        for variante in (variantes or {}).values():
+            referencias[variante['webp']] += 1
+            referencias[variante['jpeg']] += 1
+    return referencias
+
+
+def archivos_huerfanos(min_edad_segundos=3600):
+    """
+    Archivos bajo media/productos que ninguna ImagenProducto referencia.
+    Se ignoran los más nuevos que `min_edad_segundos` (subidas en curso).
+    Devuelve lista de (ruta relativa, bytes).
+    """
+    referencias = referencias_media()
+    limite = time.time() - min_edad_segundos
+    raiz = os.path.join(settings.MEDIA_ROOT, CARPETA_ORIGINALES)
+    huerfanos = []
+    for carpeta, _, archivos in os.walk(raiz):
+        for nombre in archivos:
+            ruta_completa = os.path.join(carpeta, nombre)
+            ruta_relativa = os.path.relpath(ruta_completa, settings.MEDIA_ROOT).replace(os.sep, '/')
+            if referencias[ruta_relativa]:
+                continue
+            estado = os.stat(ruta_completa)
+            if estado.st_mtime > limite:
+                continue
+            huerfanos.append((ruta_relativa, estado.st_size))
+    return huerfanos
+
+
+def _guardar(imagen, ruta_relativa, formato, **opciones):
+    ruta_completa = os.path.join(settings.MEDIA_ROOT, ruta_relativa)
+    os.makedirs(os.path.dirname(ruta_completa), exist_ok=True)
+    imagen.save(ruta_completa, formato, **opciones)
+
+
+def _sin_transparencia(imagen):
+    """JPEG no tiene canal alfa: se aplana sobre blanco."""
+    if imagen.mode in ('RGBA', 'LA', 'P'):
+        imagen = imagen.convert('RGBA')
+        fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+        fondo.paste(imagen, mask=imagen.split()[-1])
+        return fondo
+    return imagen.convert('RGB')
+
+
+def generar_derivados(imagen_producto):
+    """Genera (o regenera) los derivados de una ImagenProducto y los registra."""
+    if not pillow_disponible():
+        raise RuntimeError('Pillow no está instalado')
+
+    base = os.path.splitext(os.path.basename(imagen_producto.ruta))[0]
+    with Image.open(os.path.join(settings.MEDIA_ROOT, imagen_producto.ruta)) as original:
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    variantes = {}
+    for nombre, ancho_max in TAMANIOS:
+        # No se agranda: si el original es chico, los tamaños mayores se omiten
+        if variantes and original.width <= max(v['ancho'] for v in variantes.values()):
+            break
+        copia = original.copy()
+        copia.thumbnail((ancho_max, ancho_max * 4), Image.LANCZOS)
+
+        ruta_webp = f'{CARPETA_DERIVADOS}/{base}_{ancho_max}.webp'
+        ruta_jpeg = f'{CARPETA_DERIVADOS}/{base}_{ancho_max}.jpg'
+        _guardar(copia, ruta_webp, 'WEBP', quality=CALIDAD_WEBP, method=4)
+        _guardar(_sin_transparencia(copia), ruta_jpeg, 'JPEG',
+                 quality=CALIDAD_JPEG, optimize=True, progressive=True)
+
+        variantes[nombre] = {'ancho': copia.width, 'webp': ruta_webp, 'jpeg': ruta_jpeg}
+
+    from .models import Producto
+    with transaction.atomic():
+        imagen_producto.variantes = variantes
+        imagen_producto.save(update_fields=['variantes'])
+        # Cambian las URLs del catálogo: nuevo ETag/Last-Modified para api_productos
+        Producto.objects.filter(id=imagen_producto.producto_id).update(fecha_modificacion=timezone.now())
+        invalidar_catalogo()
+    return variantes
+
+
+def _generar_en_segundo_plano(imagen_id):
+    from .models import ImagenProducto
+    try:
+        imagen = ImagenProducto.objects.filter(id=imagen_id).first()
+        if imagen is not None:
+            generar_derivados(imagen)
+    except Exception:
+        logger.exception('No se pudieron generar los derivados de la imagen %s', imagen_id)
+    finally:
+        connection.close()
+
+
+def programar_derivados(imagen_producto):
+    """Encola la generación para después del commit (fuera del request)."""
+    if not pillow_disponible():
+        logger.warning('Pillow no está instalado: se servirá la imagen original')
+        return
+    imagen_id = imagen_producto.id
+    transaction.on_commit(lambda: _ejecutor.submit(_generar_en_segundo_plano, imagen_id))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Pasa la base SQLite a journal_mode=WAL (queda grabado en el archivo: se corre una vez al instalar)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--desactivar', action='store_true', help='Vuelve al journal clásico (DELETE)')
+
+    def handle(self, *args, **options):
+        conexion = connections[options['database']]
+        if conexion.vendor != 'sqlite':
+            raise CommandError('Sólo aplica a SQLite')
+        pedido = 'DELETE' if options['desactivar'] else 'WAL'
+        with conexion.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode = {pedido}')
+            modo = cursor.fetchone()[0].upper()
+        if modo != pedido:
+            raise CommandError(f'SQLite quedó en journal_mode={modo} (¿base en memoria o abierta por otro proceso?)')
+        self.stdout.write(self.style.SUCCESS(f'journal_mode={modo}'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from stock.cache import estadisticas, invalidar_catalogo, reiniciar_estadisticas
+
+
+class Command(BaseCommand):
+    help = 'Muestra hits/misses del cache del catálogo (y opcionalmente lo invalida)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reiniciar', action='store_true', help='Pone los contadores en cero')
+        parser.add_argument('--invalidar', action='store_true', help='Cambia la versión del catálogo')
+
+    def handle(self, *args, **options):
+        datos = estadisticas()
+        self.stdout.write(f"Versión: {datos['version']}")
+        self.stdout.write(f"Hits: {datos['hits']}  Misses: {datos['misses']}  Ratio: {datos['ratio']:.1%}")
+        if options['reiniciar']:
+            reiniciar_estadisticas()
+            self.stdout.write(self.style.SUCCESS('Contadores reiniciados'))
+        if options['invalidar']:
+            invalidar_catalogo()
+            self.stdout.write(self.style.SUCCESS('Catálogo invalidado'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from stock.imagenes import generar_derivados, pillow_disponible
+from stock.models import ImagenProducto
+
+
+class Command(BaseCommand):
+    help = 'Genera miniaturas/WebP de las imágenes de producto que no los tengan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help='Regenera también las que ya tienen derivados')
+
+    def handle(self, *args, **options):
+        if not pillow_disponible():
+            raise CommandError('Pillow no está instalado (pip install Pillow)')
+
+        imagenes = ImagenProducto.objects.order_by('id')
+        if not options['todas']:
+            imagenes = imagenes.filter(variantes={})
+
+        generadas = errores = 0
+        for imagen in imagenes.iterator():
+            try:
+                generar_derivados(imagen)
+                generadas += 1
+            except Exception as e:
+                errores += 1
+                self.stderr.write(f'Imagen {imagen.id} ({imagen.ruta}): {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Derivados generados: {generadas}  Errores: {errores}'))
@@ -0,0 +1,41 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from stock.imagenes import archivos_huerfanos
+
+
+def _legible(cantidad):
+    if cantidad < 1024:
+        return f'{cantidad} B'
+    for unidad in ('KB', 'MB'):
+        cantidad /= 1024
+        if cantidad < 1024:
+            return f'{cantidad:.1f} {unidad}'
+    return f'{cantidad / 1024:.1f} GB'
+
+
+class Command(BaseCommand):
+    help = 'Borra de media/productos los archivos que ninguna ImagenProducto referencia'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Sólo lista lo que se borraría')
+        parser.add_argument(
+            '--min-edad', type=int, default=60,
+            help='Minutos de antigüedad mínima para borrar (protege subidas en curso). Default: 60',
+        )
+
+    def handle(self, *args, **options):
+        huerfanos = archivos_huerfanos(min_edad_segundos=options['min_edad'] * 60)
+        total = sum(tamanio for _, tamanio in huerfanos)
+
+        for ruta, tamanio in huerfanos:
+            self.stdout.write(f'  {ruta} ({_legible(tamanio)})')
+            if not options['dry_run']:
+                os.remove(os.path.join(settings.MEDIA_ROOT, ruta))
+
+        accion = 'Se liberarían' if options['dry_run'] else 'Liberados'
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(huerfanos)} archivos huérfanos. {accion} {_legible(total)}'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from stock.idempotencia import purgar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Borra las claves de idempotencia vencidas (más viejas que IDEMPOTENCIA_TTL)'
+
+    def handle(self, *args, **options):
+        borradas = purgar_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'Claves vencidas borradas: {borradas}'))
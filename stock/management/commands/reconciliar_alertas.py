@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from stock.services import reconciliar_alertas
+
+
+class Command(BaseCommand):
+    help = 'Recalcula Producto.en_alerta donde no coincida con cantidad < umbral_alerta'
+
+    def handle(self, *args, **options):
+        corregidos = reconciliar_alertas()
+        self.stdout.write(self.style.SUCCESS(f'Alertas reconciliadas: {corregidos} productos corregidos'))
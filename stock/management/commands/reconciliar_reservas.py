@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from stock.services import recalcular_reservas
+
+
+class Command(BaseCommand):
+    help = 'Recalcula Producto.reservado/disponible desde las ventas confirmadas'
+
+    def handle(self, *args, **options):
+        corregidos = recalcular_reservas()
+        self.stdout.write(self.style.SUCCESS(f'Reservas reconciliadas: {corregidos} productos corregidos'))
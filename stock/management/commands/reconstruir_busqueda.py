@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from stock.search import reconstruir_indice, usa_fts
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de productos (FTS5)'
+
+    def handle(self, *args, **options):
+        if not usa_fts():
+            raise CommandError('El índice FTS5 sólo existe en SQLite')
+        total = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f'Índice reconstruido: {total} productos'))
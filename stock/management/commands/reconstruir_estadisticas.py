@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from stock.estadisticas import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero las estadísticas semanales de choferes'
+
+    def handle(self, *args, **options):
+        filas = reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'Estadísticas reconstruidas: {filas} filas chofer/semana'))
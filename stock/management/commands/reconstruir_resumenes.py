@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from stock.resumenes import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero los resúmenes diarios de ventas (por cliente y por producto)'
+
+    def handle(self, *args, **options):
+        clientes, productos = reconstruir()
+        self.stdout.write(self.style.SUCCESS(
+            f'Resúmenes reconstruidos: {clientes} filas por cliente, {productos} por producto'
+        ))
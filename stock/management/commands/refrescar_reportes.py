@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from stock import reportes
+
+
+class Command(BaseCommand):
+    help = 'Rehace la copia de la base que usan los reportes (REPORTES_MODO = "copia")'
+
+    def handle(self, *args, **options):
+        if reportes.modo() != 'copia' or reportes.alias() != reportes.ALIAS:
+            self.stdout.write('Los reportes no usan copia: no hay nada que refrescar')
+            return
+        fecha = reportes.refrescar()
+        self.stdout.write(self.style.SUCCESS(
+            f'Copia de reportes al {timezone.localtime(fecha):%d/%m/%Y %H:%M:%S}'
+        ))
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import stock.models
+
+from stock.migrations._fts import (
+    CREAR_TABLA, BORRAR_TABLA, POBLAR, CREAR_TRIGGERS, BORRAR_TRIGGERS, ejecutar_sqlite,
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0002_stockmovimiento'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            ejecutar_sqlite([CREAR_TABLA, *CREAR_TRIGGERS, POBLAR]),
+            ejecutar_sqlite([*BORRAR_TRIGGERS, BORRAR_TABLA]),
+        ),
+        migrations.CreateModel(
+            name='ProductoBusqueda',
+            fields=[
+                ('producto', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='busqueda', serialize=False, to='stock.producto')),
+                ('nombre', models.TextField()),
+                ('tipo', models.TextField()),
+                ('indice', stock.models.CampoFTS(db_column='stock_producto_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'stock_producto_fts',
+                'managed': False,
+            },
+        ),
+    ]
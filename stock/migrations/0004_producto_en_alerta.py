@@ -0,0 +1,33 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:55
+
+from django.db import migrations, models
+from django.db.models import F
+
+from stock.migrations._fts import SUSPENDER_TRIGGERS, RESTAURAR_TRIGGERS
+
+
+def calcular_alertas(apps, schema_editor):
+    Producto = apps.get_model('stock', 'Producto')
+    Producto.objects.filter(cantidad__lt=F('umbral_alerta')).update(en_alerta=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0003_producto_fts'),
+    ]
+
+    operations = [
+        SUSPENDER_TRIGGERS,
+        migrations.AddField(
+            model_name='producto',
+            name='en_alerta',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(calcular_alertas, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('en_alerta', True)), fields=['nombre'], name='producto_en_alerta_idx'),
+        ),
+        RESTAURAR_TRIGGERS,
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0004_producto_en_alerta'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['fecha_modificacion'], name='producto_fecha_mod_idx'),
+        ),
+    ]
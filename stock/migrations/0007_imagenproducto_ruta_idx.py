@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0006_imagenproducto_variantes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='imagenproducto',
+            index=models.Index(fields=['ruta'], name='imagenproducto_ruta_idx'),
+        ),
+    ]
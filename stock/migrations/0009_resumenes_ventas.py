@@ -0,0 +1,109 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+# Lo mismo que stock.resumenes.reconstruir() hoy, copiado para que la
+# migración no cambie si cambia el módulo
+ESTADOS_CONTABLES = ('enviada', 'entregada')
+
+
+def cargar_resumenes(apps, schema_editor):
+    Ventas = apps.get_model('stock', 'Ventas')
+    DetalleVenta = apps.get_model('stock', 'DetalleVenta')
+    ResumenVentaCliente = apps.get_model('stock', 'ResumenVentaCliente')
+    ResumenVentaProducto = apps.get_model('stock', 'ResumenVentaProducto')
+
+    # Ventas viejas marcadas como enviadas a mano, sin fecha de envío
+    Ventas.objects.filter(
+        estado__in=ESTADOS_CONTABLES, fecha_envio__isnull=True
+    ).update(fecha_envio=F('fecha_creacion'))
+
+    ventas = Ventas.objects.filter(estado__in=ESTADOS_CONTABLES)
+    detalles = DetalleVenta.objects.filter(venta__in=ventas)
+
+    por_cliente = {
+        (fila['dia'], fila['cliente_id']): ResumenVentaCliente(
+            dia=fila['dia'], cliente_id=fila['cliente_id'],
+            ventas=fila['num_ventas'], recaudado=fila['total'] or 0,
+        )
+        for fila in (
+            ventas.annotate(dia=TruncDate('fecha_envio'))
+            .values('dia', 'cliente_id')
+            .annotate(num_ventas=Count('id'), total=Sum('valor_total'))
+        )
+    }
+    for fila in (
+        detalles.annotate(dia=TruncDate('venta__fecha_envio'))
+        .values('dia', 'venta__cliente_id')
+        .annotate(unidades=Sum('cantidad'))
+    ):
+        por_cliente[fila['dia'], fila['venta__cliente_id']].unidades = fila['unidades']
+    ResumenVentaCliente.objects.bulk_create(por_cliente.values(), batch_size=500)
+
+    ResumenVentaProducto.objects.bulk_create([
+        ResumenVentaProducto(
+            dia=fila['dia'], producto_id=fila['producto_id'], ventas=fila['num_ventas'],
+            unidades=fila['unidades'], recaudado=fila['recaudado'],
+        )
+        for fila in (
+            detalles.annotate(dia=TruncDate('venta__fecha_envio'))
+            .values('dia', 'producto_id')
+            .annotate(
+                num_ventas=Count('venta_id', distinct=True),
+                unidades=Sum('cantidad'),
+                recaudado=Sum('subtotal'),
+            )
+        )
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0008_claveidempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenVentaProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('ventas', models.IntegerField(default=0)),
+                ('unidades', models.IntegerField(default=0)),
+                ('recaudado', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='stock.producto')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario por producto',
+                'verbose_name_plural': 'Resúmenes diarios por producto',
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenVentaCliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('ventas', models.IntegerField(default=0)),
+                ('unidades', models.IntegerField(default=0)),
+                ('recaudado', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='stock.cliente')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario por cliente',
+                'verbose_name_plural': 'Resúmenes diarios por cliente',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumenventaproducto',
+            constraint=models.UniqueConstraint(fields=('dia', 'producto'), name='resumen_producto_dia_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenventacliente',
+            constraint=models.UniqueConstraint(fields=('dia', 'cliente'), name='resumen_cliente_dia_unico'),
+        ),
+        migrations.RunPython(cargar_resumenes, migrations.RunPython.noop),
+    ]
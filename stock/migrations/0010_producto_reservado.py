@@ -0,0 +1,50 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:16
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+from stock.migrations._fts import SUSPENDER_TRIGGERS, RESTAURAR_TRIGGERS
+
+
+def calcular_reservas(apps, schema_editor):
+    """Reserva lo de las ventas confirmadas; disponible = cantidad - reservado."""
+    Producto = apps.get_model('stock', 'Producto')
+    DetalleVenta = apps.get_model('stock', 'DetalleVenta')
+
+    Producto.objects.update(disponible=F('cantidad'))
+    for producto_id, total in (
+        DetalleVenta.objects.filter(venta__estado='confirmada')
+        .values('producto_id')
+        .annotate(total=Sum('cantidad'))
+        .values_list('producto_id', 'total')
+    ):
+        Producto.objects.filter(id=producto_id).update(
+            reservado=total, disponible=F('cantidad') - total
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0009_resumenes_ventas'),
+    ]
+
+    operations = [
+        SUSPENDER_TRIGGERS,
+        migrations.AddField(
+            model_name='producto',
+            name='disponible',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='reservado',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['disponible'], name='producto_disponible_idx'),
+        ),
+        migrations.RunPython(calcular_reservas, migrations.RunPython.noop),
+        RESTAURAR_TRIGGERS,
+    ]
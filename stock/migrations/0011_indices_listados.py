@@ -0,0 +1,37 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0010_producto_reservado'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='envio',
+            index=models.Index(fields=['chofer', 'estado', 'fecha_envio'], name='envio_chofer_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='envio',
+            index=models.Index(fields=['fecha_envio', 'hora_estimada'], name='envio_fecha_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ventas',
+            index=models.Index(fields=['fecha_creacion'], name='ventas_fecha_creacion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ventas',
+            index=models.Index(fields=['estado', 'fecha_creacion'], name='ventas_estado_creacion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ventas',
+            index=models.Index(fields=['estado', 'fecha_envio'], name='ventas_estado_envio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ventas',
+            index=models.Index(fields=['chofer', 'estado'], name='ventas_chofer_estado_idx'),
+        ),
+    ]
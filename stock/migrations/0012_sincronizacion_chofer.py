@@ -0,0 +1,28 @@
+# Generated by Django 4.2.11 on 2026-10-18 21:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0011_indices_listados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ventas',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Última Modificación'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='envio',
+            index=models.Index(fields=['chofer', 'fecha_modificacion'], name='envio_chofer_modif_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ventas',
+            index=models.Index(fields=['chofer', 'fecha_modificacion'], name='ventas_chofer_modif_idx'),
+        ),
+    ]
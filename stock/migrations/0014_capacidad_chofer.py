@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0013_ubicaciones_ruta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chofer',
+            name='capacidad_paradas',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Máximo de Entregas por Día'),
+        ),
+        migrations.AddField(
+            model_name='chofer',
+            name='capacidad_unidades',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Máximo de Unidades por Día'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:34
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def cargar_estadisticas(apps, schema_editor):
+    """
+    Suma cada envío cerrado en la fila de su chofer y semana. Lo mismo que
+    stock.estadisticas.reconstruir() hoy, copiado para que la migración no
+    cambie si cambia el módulo.
+    """
+    Envio = apps.get_model('stock', 'Envio')
+    ResumenChoferSemana = apps.get_model('stock', 'ResumenChoferSemana')
+    tolerancia = timedelta(minutes=getattr(settings, 'ESTADISTICAS_TOLERANCIA_MINUTOS', 15))
+
+    filas = defaultdict(lambda: defaultdict(int))
+    for chofer_id, fecha_envio, hora_estimada, hora_real_entrega, estado in Envio.objects.filter(
+        estado__in=('entregado', 'cancelado'), chofer__isnull=False
+    ).values_list('chofer_id', 'fecha_envio', 'hora_estimada', 'hora_real_entrega', 'estado').iterator():
+        fila = filas[chofer_id, fecha_envio - timedelta(days=fecha_envio.weekday())]
+        if estado == 'cancelado':
+            fila['cancelados'] += 1
+            continue
+        fila['entregados'] += 1
+        fila['dias'] |= 1 << fecha_envio.weekday()
+        atraso = None
+        if hora_real_entrega is not None and hora_estimada is not None:
+            atraso = hora_real_entrega - timezone.make_aware(datetime.combine(fecha_envio, hora_estimada))
+        if atraso is not None and atraso > tolerancia:
+            fila['minutos_demora'] += int(atraso.total_seconds() // 60)
+        else:
+            fila['a_tiempo'] += 1
+
+    ResumenChoferSemana.objects.bulk_create([
+        ResumenChoferSemana(chofer_id=chofer_id, semana=semana, **valores)
+        for (chofer_id, semana), valores in filas.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0014_capacidad_chofer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenChoferSemana',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semana', models.DateField()),
+                ('entregados', models.IntegerField(default=0)),
+                ('a_tiempo', models.IntegerField(default=0)),
+                ('minutos_demora', models.IntegerField(default=0)),
+                ('cancelados', models.IntegerField(default=0)),
+                ('dias', models.IntegerField(default=0)),
+                ('chofer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_semanales', to='stock.chofer')),
+            ],
+            options={
+                'verbose_name': 'Resumen semanal por chofer',
+                'verbose_name_plural': 'Resúmenes semanales por chofer',
+                'indexes': [models.Index(fields=['semana'], name='resumen_chofer_semana_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumenchofersemana',
+            constraint=models.UniqueConstraint(fields=('chofer', 'semana'), name='resumen_chofer_semana_unico'),
+        ),
+        migrations.RunPython(cargar_estadisticas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import re
+from datetime import datetime, timezone
+
+# Líneas que agregaba agregar_nota: "[dd/mm/aaaa hh:mm] texto" (hora UTC)
+LINEA_NOTA = re.compile(r'^\[(\d{2}/\d{2}/\d{4} \d{2}:\d{2})\] ?(.*)$')
+
+
+def partir_notas(texto):
+    """(nota original, [(fecha, texto)]) de un campo notas con líneas agregadas."""
+    original, agregadas = [], []
+    for linea in (texto or '').splitlines():
+        coincide = LINEA_NOTA.match(linea)
+        if coincide:
+            fecha = datetime.strptime(coincide[1], '%d/%m/%Y %H:%M').replace(tzinfo=timezone.utc)
+            agregadas.append([fecha, coincide[2]])
+        elif agregadas:
+            # Nota de varias líneas
+            agregadas[-1][1] += '\n' + linea
+        else:
+            original.append(linea)
+    return '\n'.join(original), agregadas
+
+
+def separar_notas(apps, schema_editor):
+    Ventas = apps.get_model('stock', 'Ventas')
+    Envio = apps.get_model('stock', 'Envio')
+    EventoEstado = apps.get_model('stock', 'EventoEstado')
+
+    for modelo, tipo in ((Ventas, 'venta'), (Envio, 'envio')):
+        eventos, limpios = [], []
+        for registro in modelo.objects.filter(notas__contains='] ').iterator():
+            original, agregadas = partir_notas(registro.notas)
+            if not agregadas:
+                continue
+            for fecha, texto in agregadas:
+                eventos.append(EventoEstado(
+                    tipo=tipo,
+                    venta_id=registro.venta_id if tipo == 'envio' else registro.id,
+                    envio_id=registro.id if tipo == 'envio' else None,
+                    fecha=fecha,
+                    nota=texto,
+                ))
+            registro.notas = original
+            limpios.append(registro)
+        EventoEstado.objects.bulk_create(eventos, batch_size=500)
+        # bulk_update no toca fecha_modificacion: no es un cambio para la app del chofer
+        modelo.objects.bulk_update(limpios, ['notas'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('stock', '0015_estadisticas_choferes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoEstado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('venta', 'Venta'), ('envio', 'Envío')], max_length=10, verbose_name='Entidad')),
+                ('estado_anterior', models.CharField(blank=True, default='', max_length=20, verbose_name='Estado anterior')),
+                ('estado_nuevo', models.CharField(blank=True, default='', max_length=20, verbose_name='Estado nuevo')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+                ('nota', models.TextField(blank=True, default='', verbose_name='Nota')),
+                ('chofer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='eventos_estado', to='stock.chofer', verbose_name='Chofer')),
+                ('envio', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='eventos', to='stock.envio', verbose_name='Envío')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='eventos_estado', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+                ('venta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos', to='stock.ventas', verbose_name='Venta')),
+            ],
+            options={
+                'verbose_name': 'Evento de estado',
+                'verbose_name_plural': 'Eventos de estado',
+                'ordering': ['fecha', 'id'],
+                'indexes': [models.Index(fields=['venta', 'fecha'], name='evento_venta_fecha_idx'), models.Index(fields=['envio', 'fecha'], name='evento_envio_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(separar_notas, migrations.RunPython.noop),
+    ]
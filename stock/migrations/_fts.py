@@ -0,0 +1,80 @@
+"""
+SQL del índice FTS5 de productos, compartido entre migraciones.
+
+SQLite no tiene ALTER COLUMN: cuando una migración agrega o cambia campos de
+Producto/TipoProducto, Django reconstruye la tabla (CREATE nueva, copiar,
+DROP, RENAME) y eso se lleva puestos los triggers. Toda migración que toque
+esas tablas debe envolver sus operaciones con `SUSPENDER_TRIGGERS` /
+`RESTAURAR_TRIGGERS`.
+"""
+from django.db import migrations
+
+CREAR_TABLA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS stock_producto_fts USING fts5(
+        nombre, tipo,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+BORRAR_TABLA = 'DROP TABLE IF EXISTS stock_producto_fts'
+
+POBLAR = """
+    INSERT INTO stock_producto_fts(rowid, nombre, tipo)
+    SELECT p.id, p.nombre, t.nombre FROM stock_producto p
+    JOIN stock_tipoproducto t ON t.id = p.tipo_id
+"""
+
+CREAR_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS stock_producto_fts_ai AFTER INSERT ON stock_producto BEGIN
+        INSERT INTO stock_producto_fts(rowid, nombre, tipo)
+        SELECT new.id, new.nombre, (SELECT nombre FROM stock_tipoproducto WHERE id = new.tipo_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stock_producto_fts_au AFTER UPDATE OF nombre, tipo_id ON stock_producto
+    WHEN old.nombre IS NOT new.nombre OR old.tipo_id IS NOT new.tipo_id BEGIN
+        DELETE FROM stock_producto_fts WHERE rowid = old.id;
+        INSERT INTO stock_producto_fts(rowid, nombre, tipo)
+        SELECT new.id, new.nombre, (SELECT nombre FROM stock_tipoproducto WHERE id = new.tipo_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stock_producto_fts_ad AFTER DELETE ON stock_producto BEGIN
+        DELETE FROM stock_producto_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stock_tipoproducto_fts_au AFTER UPDATE OF nombre ON stock_tipoproducto
+    WHEN old.nombre IS NOT new.nombre BEGIN
+        UPDATE stock_producto_fts SET tipo = new.nombre
+        WHERE rowid IN (SELECT id FROM stock_producto WHERE tipo_id = new.id);
+    END
+    """,
+]
+
+BORRAR_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS stock_tipoproducto_fts_au',
+    'DROP TRIGGER IF EXISTS stock_producto_fts_ad',
+    'DROP TRIGGER IF EXISTS stock_producto_fts_au',
+    'DROP TRIGGER IF EXISTS stock_producto_fts_ai',
+]
+
+
+def ejecutar_sqlite(sentencias):
+    """RunPython que ejecuta `sentencias` sólo en SQLite (FTS5 es propio de SQLite)."""
+    def operacion(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in sentencias:
+            schema_editor.execute(sql)
+    return operacion
+
+
+SUSPENDER_TRIGGERS = migrations.RunPython(
+    ejecutar_sqlite(BORRAR_TRIGGERS), ejecutar_sqlite(CREAR_TRIGGERS)
+)
+RESTAURAR_TRIGGERS = migrations.RunPython(
+    ejecutar_sqlite(CREAR_TRIGGERS), ejecutar_sqlite(BORRAR_TRIGGERS)
+)
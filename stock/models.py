@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 # Create your models here.
@@ -45,8 +45,49 @@ class Producto(models.Model):
         verbose_name="Stock Mínimo de Alerta"
     )
     
+    # 🚨 cantidad < umbral_alerta, guardado para leerlo por índice parcial.
+    # Lo mantienen save() y los UPDATE de stock.services.
+    en_alerta = models.BooleanField(default=False, editable=False)
+    
+    # 🔒 Unidades comprometidas por ventas confirmadas todavía sin despachar,
+    # y lo que queda para prometer: disponible = cantidad - reservado
+    # (guardado para poder filtrar/ordenar por índice). Los mantienen los
+    # UPDATE de stock.services; puede quedar negativo tras un ajuste a la baja.
+    reservado = models.PositiveIntegerField(default=0, editable=False)
+    disponible = models.IntegerField(default=0, editable=False)
+    
     fecha_modificacion = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['nombre'],
+                condition=models.Q(en_alerta=True),
+                name='producto_en_alerta_idx',
+            ),
+            # Max() para ETag del catálogo y filtro updated_since
+            models.Index(fields=['fecha_modificacion'], name='producto_fecha_mod_idx'),
+            models.Index(fields=['disponible'], name='producto_disponible_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Stock y reserva de un producto existente sólo cambian con los UPDATE
+        # condicionales de stock.services (y su ledger): acá se releen, en la
+        # misma transacción que el guardado, para no pisar una salida o una
+        # reserva con lo que se leyó al abrir el formulario
+        with transaction.atomic():
+            if self.pk:
+                actual = Producto.objects.filter(pk=self.pk).values('cantidad', 'reservado').first()
+                if actual is not None:
+                    self.cantidad = actual['cantidad']
+                    self.reservado = actual['reservado']
+            self.en_alerta = int(self.cantidad) < int(self.umbral_alerta)
+            self.disponible = int(self.cantidad) - int(self.reservado)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and {'cantidad', 'umbral_alerta'} & set(update_fields):
+                kwargs['update_fields'] = set(update_fields) | {'en_alerta', 'reservado', 'disponible'}
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.nombre} ({self.cantidad} unidades)"
 
@@ -55,10 +96,69 @@ class ImagenProducto(models.Model):
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
     ruta = models.CharField(max_length=500)
     
+    # 🆕 Derivados: {'miniatura': {'ancho': 160, 'webp': ruta, 'jpeg': ruta}, ...}
+    # Los genera stock.imagenes fuera del request; vacío = sólo el original
+    variantes = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Dedup por contenido y GC de media buscan por ruta
+            models.Index(fields=['ruta'], name='imagenproducto_ruta_idx'),
+        ]
+    
+    def variante(self, ancho, formato='webp'):
+        """Ruta de la variante más chica con al menos `ancho` px (o la más grande)."""
+        candidatas = sorted(self.variantes.values(), key=lambda v: v['ancho'])
+        if not candidatas:
+            return self.ruta
+        for candidata in candidatas:
+            if candidata['ancho'] >= ancho:
+                return candidata[formato]
+        return candidatas[-1][formato]
+    
     def __str__(self):
         return f"Imagen {self.id} - {self.producto.nombre}"
 
 
+# ------------------------------
+#  ÍNDICE DE BÚSQUEDA (FTS5)
+# ------------------------------
+class CampoFTS(models.TextField):
+    """Columna oculta de FTS5 con el nombre de la tabla: sólo sirve para MATCH."""
+
+
+@CampoFTS.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class ProductoBusqueda(models.Model):
+    """
+    Fila del índice FTS5 de productos (tabla virtual creada en la migración
+    0003 y mantenida por triggers). Sólo lectura: se usa para hacer JOIN.
+    """
+    producto = models.OneToOneField(
+        Producto,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='busqueda'
+    )
+    nombre = models.TextField()
+    tipo = models.TextField()
+    indice = CampoFTS(db_column='stock_producto_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'stock_producto_fts'
+
+
 # ------------------------------
 #  MODELO: Cliente
 # ------------------------------
@@ -78,6 +178,9 @@ class Cliente(models.Model):
     email = models.EmailField(unique=True, blank=True, null=True)
     telefono = models.CharField(max_length=20, blank=True, null=True)
     direccion = models.TextField(blank=True, null=True)
+    # 🗺️ Ubicación para ordenar las rutas de reparto (opcional)
+    latitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     fecha_registro = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -96,6 +199,9 @@ class Chofer(models.Model):
     vehiculo = models.CharField(max_length=100, verbose_name="Vehículo/Patente")
     activo = models.BooleanField(default=True, verbose_name="Activo")
     notas = models.TextField(blank=True, null=True, verbose_name="Notas/Descripción")
+    # 🚚 Tope por día para la asignación automática (vacío = sin límite)
+    capacidad_paradas = models.PositiveIntegerField(blank=True, null=True, verbose_name="Máximo de Entregas por Día")
+    capacidad_unidades = models.PositiveIntegerField(blank=True, null=True, verbose_name="Máximo de Unidades por Día")
     fecha_registro = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -189,6 +295,12 @@ class Ventas(models.Model):
         verbose_name="Fecha Real de Envío"
     )
 
+    # Cambia con cada save(); la sincronización del chofer pide "lo modificado desde"
+    fecha_modificacion = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Última Modificación"
+    )
+
     # Información adicional
     notas = models.TextField(
         blank=True,
@@ -204,6 +316,12 @@ class Ventas(models.Model):
                 "Una venta en estado pendiente debe tener un usuario creador asignado"
             )
 
+        # Los resúmenes diarios se agrupan por fecha de envío
+        if self.estado in ('enviada', 'entregada') and not self.fecha_envio:
+            self.fecha_envio = timezone.now()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'fecha_envio'}
+
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -213,6 +331,18 @@ class Ventas(models.Model):
         verbose_name = "Venta"
         verbose_name_plural = "Ventas"
         ordering = ['-fecha_creacion']
+        indexes = [
+            # lista_ventas sin filtros (orden por fecha) y con rango de fechas
+            models.Index(fields=['fecha_creacion'], name='ventas_fecha_creacion_idx'),
+            # lista_ventas y asignar_envios_pendientes: estado + rango/orden por creación
+            models.Index(fields=['estado', 'fecha_creacion'], name='ventas_estado_creacion_idx'),
+            # consultar_ventas: enviadas/entregadas por rango de fecha de envío
+            models.Index(fields=['estado', 'fecha_envio'], name='ventas_estado_envio_idx'),
+            # Panel del chofer: sus ventas en un estado
+            models.Index(fields=['chofer', 'estado'], name='ventas_chofer_estado_idx'),
+            # Sincronización del chofer: sus ventas modificadas desde el cursor
+            models.Index(fields=['chofer', 'fecha_modificacion'], name='ventas_chofer_modif_idx'),
+        ]
 
     def __str__(self):
         return f"Venta #{self.id} - {self.cliente.nombre_completo} - {self.get_estado_display()}"
@@ -240,6 +370,87 @@ class DetalleVenta(models.Model):
         return f"{self.cantidad}x {self.producto.nombre} - ${self.subtotal}"
 
 
+# ------------------------------
+#  MODELOS: Resúmenes diarios de ventas
+# ------------------------------
+class ResumenVentaCliente(models.Model):
+    """
+    Ventas enviadas/entregadas de un cliente en un día (fecha de envío).
+    Se mantiene incrementalmente desde stock.resumenes.
+    """
+    dia = models.DateField()
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='resumenes_diarios')
+    ventas = models.IntegerField(default=0)
+    unidades = models.IntegerField(default=0)
+    recaudado = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumen diario por cliente"
+        verbose_name_plural = "Resúmenes diarios por cliente"
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'cliente'], name='resumen_cliente_dia_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} - {self.cliente_id}: ${self.recaudado}"
+
+
+class ResumenVentaProducto(models.Model):
+    """
+    Unidades y recaudación de un producto en un día (fecha de envío).
+    `ventas` cuenta las ventas que incluyen el producto.
+    """
+    dia = models.DateField()
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='resumenes_diarios')
+    ventas = models.IntegerField(default=0)
+    unidades = models.IntegerField(default=0)
+    recaudado = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumen diario por producto"
+        verbose_name_plural = "Resúmenes diarios por producto"
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'producto'], name='resumen_producto_dia_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} - {self.producto_id}: {self.unidades} u."
+
+
+# ------------------------------
+#  MODELO: Estadísticas semanales por chofer
+# ------------------------------
+class ResumenChoferSemana(models.Model):
+    """
+    Envíos cerrados (entregados/cancelados) de un chofer en una semana
+    (lunes de la fecha de envío). Se mantiene incrementalmente desde
+    stock.estadisticas.
+    """
+    chofer = models.ForeignKey(Chofer, on_delete=models.CASCADE, related_name='resumenes_semanales')
+    semana = models.DateField()
+    entregados = models.IntegerField(default=0)
+    a_tiempo = models.IntegerField(default=0)
+    # Suma de minutos de atraso de las entregas tarde
+    minutos_demora = models.IntegerField(default=0)
+    cancelados = models.IntegerField(default=0)
+    # Bit n = hubo entregas el día n de la semana (0 = lunes)
+    dias = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Resumen semanal por chofer"
+        verbose_name_plural = "Resúmenes semanales por chofer"
+        constraints = [
+            models.UniqueConstraint(fields=['chofer', 'semana'], name='resumen_chofer_semana_unico'),
+        ]
+        indexes = [
+            # Ranking de la oficina: todos los choferes de unas semanas
+            models.Index(fields=['semana'], name='resumen_chofer_semana_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.semana} - {self.chofer_id}: {self.entregados} entregados"
+
+
 # ------------------------------
 #  MODELO: Envío (OPCIONAL - Para tracking)
 # ------------------------------
@@ -276,6 +487,9 @@ class Envio(models.Model):
     
     # Información adicional
     direccion_entrega = models.TextField(verbose_name="Dirección de Entrega")
+    # 🗺️ Si la entrega no es en la ubicación del cliente (vacío = la del cliente)
+    latitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     notas = models.TextField(blank=True, null=True, verbose_name="Notas Adicionales")
     
     # Timestamps
@@ -286,6 +500,192 @@ class Envio(models.Model):
         verbose_name = "Envío"
         verbose_name_plural = "Envíos"
         ordering = ['-fecha_envio', 'hora_estimada']
+        indexes = [
+            # Historial y panel del chofer: sus envíos por estado y fecha
+            models.Index(fields=['chofer', 'estado', 'fecha_envio'], name='envio_chofer_estado_fecha_idx'),
+            # lista_envios: un día (o rango) ordenado por hora
+            models.Index(fields=['fecha_envio', 'hora_estimada'], name='envio_fecha_hora_idx'),
+            # Sincronización del chofer: sus envíos modificados desde el cursor
+            models.Index(fields=['chofer', 'fecha_modificacion'], name='envio_chofer_modif_idx'),
+        ]
     
     def __str__(self):
         return f"Envío {self.id} - Venta #{self.venta.id} ({self.fecha_envio})"
+
+
+# ------------------------------
+#  MODELO: Movimiento de Stock (LEDGER)
+# ------------------------------
+class StockMovimiento(models.Model):
+    """
+    Registro inmutable de cada cambio de stock.
+    `cantidad` es el delta aplicado: positivo para entradas,
+    negativo para salidas y ajustes a la baja.
+    """
+
+    TIPO_CHOICES = [
+        ('entrada', 'Entrada'),
+        ('salida', 'Salida'),     # 🎯 Descuento por envío
+        ('ajuste', 'Ajuste'),     # Corrección manual
+    ]
+
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='movimientos',
+        verbose_name="Producto"
+    )
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, verbose_name="Tipo")
+    cantidad = models.IntegerField(verbose_name="Cantidad")
+
+    venta = models.ForeignKey(
+        Ventas,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos_stock',
+        verbose_name="Venta"
+    )
+    envio = models.ForeignKey(
+        Envio,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos_stock',
+        verbose_name="Envío"
+    )
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos_stock',
+        verbose_name="Usuario"
+    )
+
+    fecha = models.DateTimeField(auto_now_add=True, verbose_name="Fecha")
+    notas = models.CharField(max_length=255, blank=True, default='', verbose_name="Notas")
+
+    class Meta:
+        verbose_name = "Movimiento de Stock"
+        verbose_name_plural = "Movimientos de Stock"
+        ordering = ['-fecha']
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.cantidad:+d} - {self.producto.nombre}"
+
+
+# ------------------------------
+#  MODELO: Historial de estados y notas
+# ------------------------------
+class EventoEstado(models.Model):
+    """
+    Historial inmutable de una venta y su envío: cada cambio de estado y
+    cada nota es una fila nueva (nunca se edita). Los eventos del envío
+    también llevan la venta, así la línea de tiempo de una venta es un solo
+    rango del índice. Una nota sin cambio tiene estado_anterior == estado_nuevo.
+    """
+
+    TIPO_CHOICES = [
+        ('venta', 'Venta'),
+        ('envio', 'Envío'),
+    ]
+
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, verbose_name="Entidad")
+    venta = models.ForeignKey(
+        Ventas,
+        on_delete=models.CASCADE,
+        related_name='eventos',
+        verbose_name="Venta"
+    )
+    envio = models.ForeignKey(
+        Envio,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='eventos',
+        verbose_name="Envío"
+    )
+    estado_anterior = models.CharField(max_length=20, blank=True, default='', verbose_name="Estado anterior")
+    estado_nuevo = models.CharField(max_length=20, blank=True, default='', verbose_name="Estado nuevo")
+
+    # Quién: el usuario logueado y, si lo hizo desde el panel, el chofer
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='eventos_estado',
+        verbose_name="Usuario"
+    )
+    chofer = models.ForeignKey(
+        Chofer,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='eventos_estado',
+        verbose_name="Chofer"
+    )
+
+    # default (no auto_now_add) para poder migrar notas viejas con su fecha
+    fecha = models.DateTimeField(default=timezone.now, verbose_name="Fecha")
+    nota = models.TextField(blank=True, default='', verbose_name="Nota")
+
+    class Meta:
+        verbose_name = "Evento de estado"
+        verbose_name_plural = "Eventos de estado"
+        ordering = ['fecha', 'id']
+        indexes = [
+            # Línea de tiempo de una venta (con los eventos de su envío)
+            models.Index(fields=['venta', 'fecha'], name='evento_venta_fecha_idx'),
+            # Línea de tiempo de un envío
+            models.Index(fields=['envio', 'fecha'], name='evento_envio_fecha_idx'),
+        ]
+
+    @property
+    def es_cambio(self):
+        return self.estado_anterior != self.estado_nuevo
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError('Los eventos de estado no se modifican')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        cambio = f"{self.estado_anterior or '-'} → {self.estado_nuevo}" if self.es_cambio else 'nota'
+        return f"{self.get_tipo_display()} {self.envio_id or self.venta_id}: {cambio}"
+
+
+# ------------------------------
+#  MODELO: Clave de Idempotencia
+# ------------------------------
+class ClaveIdempotencia(models.Model):
+    """
+    Resultado de un POST ya procesado, para devolverlo tal cual si el
+    cliente reintenta con la misma clave (ver stock.idempotencia).
+    """
+
+    ESTADO_CHOICES = [
+        ('en_proceso', 'En Proceso'),
+        ('completada', 'Completada'),
+    ]
+
+    # sha256(usuario | ruta | clave del cliente)
+    clave = models.CharField(max_length=64, unique=True)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, default='en_proceso')
+
+    # Respuesta original
+    codigo_http = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    ubicacion = models.CharField(max_length=500, blank=True, default='')
+    cuerpo = models.BinaryField(blank=True, default=b'')
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Clave de Idempotencia"
+        verbose_name_plural = "Claves de Idempotencia"
+
+    def __str__(self):
+        return f"{self.clave[:12]}… ({self.get_estado_display()})"
@@ -0,0 +1,179 @@
+"""
+Paginación por cursor (keyset) para los listados.
+
+En lugar de OFFSET, cada página se pide "a partir de" la clave de orden de
+la última fila vista: `WHERE (fecha, id) < (f, i) ORDER BY fecha, id LIMIT n`.
+Así la página 500 cuesta lo mismo que la primera.
+"""
+import base64
+import datetime
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+
+POR_PAGINA = 50
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido por GET no se puede decodificar."""
+
+
+class PaginaCursor:
+    """Una ventana de resultados y los links para moverse."""
+
+    def __init__(self, items, siguiente=None, anterior=None, url_base=''):
+        self.items = items
+        self.cursor_siguiente = siguiente
+        self.cursor_anterior = anterior
+        self._url_base = url_base
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def tiene_siguiente(self):
+        return self.cursor_siguiente is not None
+
+    @property
+    def tiene_anterior(self):
+        return self.cursor_anterior is not None
+
+    @property
+    def url_siguiente(self):
+        return self._url(self.cursor_siguiente)
+
+    @property
+    def url_anterior(self):
+        return self._url(self.cursor_anterior)
+
+    def _url(self, cursor):
+        if cursor is None:
+            return None
+        separador = '&' if self._url_base else ''
+        return f'?{self._url_base}{separador}cursor={cursor}'
+
+
+def _a_json(valor):
+    if isinstance(valor, (datetime.datetime, datetime.date, datetime.time)):
+        return valor.isoformat()
+    return valor
+
+
+def codificar_cursor(valores, direccion):
+    crudo = json.dumps({'v': [_a_json(v) for v in valores], 'd': direccion})
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, campos):
+    """Devuelve (valores, direccion) convertidos al tipo de cada campo."""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        valores, direccion = datos['v'], datos['d']
+        if len(valores) != len(campos) or direccion not in ('sig', 'ant'):
+            raise ValueError
+        return [
+            c.to_python(v) if c is not None else v
+            for c, v in zip(campos, valores)
+        ], direccion
+    except Exception as e:
+        raise CursorInvalido(cursor) from e
+
+
+def _posterior(nombre, descendente, valor):
+    """
+    Q "el campo viene después de `valor`" en el orden de SQLite, donde los
+    NULL van primero en ASC y últimos en DESC (None si nada viene después).
+    """
+    if valor is None:
+        return None if descendente else Q(**{f'{nombre}__isnull': False})
+    if descendente:
+        return Q(**{f'{nombre}__lt': valor}) | Q(**{f'{nombre}__isnull': True})
+    return Q(**{f'{nombre}__gt': valor})
+
+
+def _filtro_despues_de(orden, valores):
+    """
+    Q lexicográfico "fila posterior a `valores`" para un orden mixto:
+    (a > va) OR (a = va AND b > vb) OR ...  (con < en los campos DESC).
+    Los campos que admiten NULL se comparan con `_posterior`.
+    """
+    condiciones = []
+    for i, campo in enumerate(orden):
+        posterior = _posterior(campo.lstrip('-'), campo.startswith('-'), valores[i])
+        if posterior is None:
+            continue
+        # campo=None en un filtro es IS NULL
+        iguales = {o.lstrip('-'): v for o, v in zip(orden[:i], valores[:i])}
+        condiciones.append(Q(**iguales) & posterior)
+    if not condiciones:
+        return Q(pk__in=[])  # nada viene después
+    return reduce(or_, condiciones)
+
+
+def _campo(modelo, nombre):
+    try:
+        return modelo._meta.get_field(nombre)
+    except FieldDoesNotExist:
+        # Anotación (p.ej. `rank` de la búsqueda): el valor viaja tal cual
+        return None
+
+
+def _invertir(orden):
+    return [c[1:] if c.startswith('-') else f'-{c}' for c in orden]
+
+
+def paginar(request, queryset, orden, por_pagina=POR_PAGINA):
+    """
+    Pagina `queryset` según `orden` (debe terminar en un campo único, p.ej. 'id').
+    El cursor viaja en `?cursor=` y el resto de los GET (filtros) se conserva.
+    """
+    modelo = queryset.model
+    campos = [_campo(modelo, c.lstrip('-')) for c in orden]
+    nombres = [c.lstrip('-') for c in orden]
+
+    parametros = request.GET.copy()
+    cursor = parametros.pop('cursor', [None])[-1]
+    url_base = parametros.urlencode()
+
+    direccion = 'sig'
+    if cursor:
+        try:
+            valores, direccion = decodificar_cursor(cursor, campos)
+        except CursorInvalido:
+            cursor = None
+
+    orden_consulta = orden if direccion == 'sig' else _invertir(orden)
+    qs = queryset.order_by(*orden_consulta)
+    if cursor:
+        qs = qs.filter(_filtro_despues_de(orden_consulta, valores))
+
+    # Una fila de más para saber si hay otra página
+    items = list(qs[:por_pagina + 1])
+    hay_mas = len(items) > por_pagina
+    items = items[:por_pagina]
+    if direccion == 'ant':
+        items.reverse()
+
+    def clave(obj):
+        return [getattr(obj, n) for n in nombres]
+
+    siguiente = anterior = None
+    if items:
+        if direccion == 'sig':
+            if hay_mas:
+                siguiente = codificar_cursor(clave(items[-1]), 'sig')
+            if cursor:
+                anterior = codificar_cursor(clave(items[0]), 'ant')
+        else:
+            siguiente = codificar_cursor(clave(items[-1]), 'sig')
+            if hay_mas:
+                anterior = codificar_cursor(clave(items[0]), 'ant')
+
+    return PaginaCursor(items, siguiente, anterior, url_base)
@@ -0,0 +1,54 @@
+"""
+Reintentos de las vistas de escritura cuando SQLite está ocupada.
+
+Cada POST corre entero en una transacción. Con el perfil de producción
+(amarce/sqlite) esa transacción abre con BEGIN IMMEDIATE, así que si otro
+request está escribiendo se espera busy_timeout al principio, antes de
+tocar nada. Si aun así la base sigue bloqueada, se deshace todo y se vuelve
+a ejecutar la vista un número acotado de veces, con espera exponencial y
+jitter para que los que chocaron no vuelvan a chocar juntos. Al agotar los
+reintentos se deja subir el OperationalError (un 500, que `idempotente`
+no guarda, así el cliente puede reintentar con la misma clave).
+"""
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+METODOS_LECTURA = ('GET', 'HEAD', 'OPTIONS')
+
+
+def es_bloqueo(error):
+    # SQLITE_BUSY / SQLITE_LOCKED: "database is locked", "database table is locked"
+    return 'is locked' in str(error)
+
+
+def espera(intento):
+    """Segundos a esperar antes del reintento número `intento` (desde 0)."""
+    base = getattr(settings, 'ESCRITURA_ESPERA_INICIAL', 0.1) * 2 ** intento
+    return base * random.uniform(0.5, 1.5)
+
+
+def reintentar_si_ocupada(vista):
+    """Decorador para vistas de escritura: transacción por request y reintentos acotados."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        # Dentro de otra transacción no se puede reintentar: el rollback no sería nuestro
+        if request.method in METODOS_LECTURA or connection.in_atomic_block:
+            return vista(request, *args, **kwargs)
+
+        reintentos = getattr(settings, 'ESCRITURA_REINTENTOS', 3)
+        intento = 0
+        while True:
+            try:
+                with transaction.atomic():
+                    return vista(request, *args, **kwargs)
+            except OperationalError as e:
+                if intento >= reintentos or not es_bloqueo(e):
+                    raise
+                time.sleep(espera(intento))
+                intento += 1
+
+    return envoltura
@@ -0,0 +1,226 @@
+"""
+Lecturas de reportes en una conexión aparte ('reporting').
+
+consultar_ventas, las exportaciones y el historial del chofer recorren
+mucho y no necesitan lo escrito hace un segundo. Con `@reporte` sus
+consultas a modelos de `stock` van a la conexión 'reporting' (RouterReportes);
+todo lo que se escribe, y las lecturas del resto de la app, siguen en
+'default'. Según settings.REPORTES_MODO, 'reporting' es:
+
+- 'copia': un archivo aparte que se rehace con la API de backup de SQLite
+  (por cron con `manage.py refrescar_reportes`). Si un reporte la encuentra
+  con más de REPORTES_ATRASO_MAXIMO segundos, se refresca en un hilo aparte
+  y el reporte se sirve igual con la copia que hay (y su fecha): el backup
+  nunca corre dentro del request. Las lecturas largas no comparten
+  archivo, caché ni WAL con las ventas en curso.
+- 'solo_lectura': la misma base abierta con mode=ro. Sin atraso; con WAL las
+  lecturas ya no bloquean escrituras, esto sólo las saca de las conexiones
+  que escriben y asegura que no escriban.
+
+Las páginas muestran de cuándo son los datos (reportes_frescura.html) y las
+exportaciones lo mandan en el header X-Datos-Al.
+"""
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import wraps
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ALIAS = 'reporting'
+
+# Base de la que lee el reporte en curso (None = no hay reporte en curso)
+_base_reporte = contextvars.ContextVar('base_reporte', default=None)
+_refrescando = threading.Lock()
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reportes')
+
+
+def alias():
+    """'reporting' si es una base aparte; 'default' si no está o es la misma (espejo en tests)."""
+    if ALIAS not in connections.settings:
+        return DEFAULT_DB_ALIAS
+    if connections[ALIAS].settings_dict['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']:
+        return DEFAULT_DB_ALIAS
+    return ALIAS
+
+
+def modo():
+    return getattr(settings, 'REPORTES_MODO', 'copia')
+
+
+def atraso_maximo():
+    return timedelta(seconds=getattr(settings, 'REPORTES_ATRASO_MAXIMO', 300))
+
+
+class RouterReportes:
+    """Lecturas de `stock` dentro de un reporte → 'reporting'; escrituras siempre a 'default'."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'stock':
+            return _base_reporte.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_migrate(self, db, app_label, **hints):
+        # La copia se hace desde default ya migrada; la de sólo lectura es la misma base
+        return db != ALIAS
+
+
+# ------------------------------
+#  Copia
+# ------------------------------
+def _ruta_copia():
+    # NAME es una URI file:///...?mode=ro
+    return Path(unquote(urlparse(str(connections[ALIAS].settings_dict['NAME'])).path))
+
+
+def _stat_copia():
+    try:
+        return os.stat(_ruta_copia())
+    except FileNotFoundError:
+        return None
+
+
+def _fecha(stat):
+    return datetime.fromtimestamp(stat.st_mtime, tz=timezone.get_default_timezone()) if stat else None
+
+
+def fecha_copia():
+    """Cuándo se hizo la copia (aware), o None si no existe."""
+    return _fecha(_stat_copia())
+
+
+def _reconectar_si_cambio(stat):
+    """
+    Cada refresco reemplaza el archivo: una conexión abierta antes sigue
+    leyendo el anterior (ya borrado). La generación (inodo, mtime) se anota
+    en la conexión de este hilo y, si cambió, se cierra para abrir la nueva.
+    Sirve también para copias hechas por otro proceso.
+    """
+    conexion = connections[ALIAS]
+    generacion = (stat.st_ino, stat.st_mtime_ns)
+    if getattr(conexion, 'generacion_copia', None) != generacion:
+        conexion.close()
+        conexion.generacion_copia = generacion
+
+
+def refrescar():
+    """
+    Rehace la copia desde 'default' con la API de backup (una foto consistente,
+    sin frenar a los que escriben en WAL) y la reemplaza de una vez. Devuelve
+    la fecha de la copia nueva.
+    """
+    ruta = _ruta_copia()
+    temporal = ruta.with_name(f'{ruta.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    origen = connections[DEFAULT_DB_ALIAS]
+    origen.ensure_connection()
+    destino = sqlite3.connect(temporal)
+    try:
+        with origen.wrap_database_errors:
+            origen.connection.backup(destino)
+        # Nadie escribe en la copia: journal clásico, sin -wal/-shm que sobrevivan al reemplazo
+        destino.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        destino.close()
+    os.replace(temporal, ruta)
+    # Las conexiones de los demás hilos se cierran solas al ver otra generación
+    connections[ALIAS].close()
+    return fecha_copia()
+
+
+def _refrescar_y_cerrar():
+    try:
+        refrescar()
+    except Exception:
+        logger.exception('No se pudo refrescar la copia de reportes')
+    finally:
+        _refrescando.release()
+        connections.close_all()
+
+
+def refrescar_en_segundo_plano():
+    """Encola refrescar() si en este proceso no hay otro refresco en curso."""
+    if _refrescando.acquire(blocking=False):
+        _ejecutor.submit(_refrescar_y_cerrar)
+
+
+class Frescura:
+    """De cuándo son los datos de un reporte (fecha None = en vivo)."""
+
+    def __init__(self, fecha=None):
+        self.fecha = fecha
+        self.atraso_maximo = atraso_maximo()
+
+    @property
+    def en_vivo(self):
+        return self.fecha is None
+
+    @property
+    def atraso(self):
+        return timedelta(0) if self.fecha is None else timezone.now() - self.fecha
+
+    @property
+    def minutos_maximo(self):
+        return round(self.atraso_maximo.total_seconds() / 60)
+
+
+def preparar():
+    """
+    (base, Frescura) para un reporte. Si la copia está vencida se encola su
+    refresco y se usa la que hay; si todavía no hay ninguna, se lee en vivo.
+    """
+    if alias() == DEFAULT_DB_ALIAS or modo() != 'copia':
+        return alias(), Frescura()
+    stat = _stat_copia()
+    fecha = _fecha(stat)
+    if fecha is None or timezone.now() - fecha > atraso_maximo():
+        refrescar_en_segundo_plano()
+    if stat is None:
+        return DEFAULT_DB_ALIAS, Frescura()
+    _reconectar_si_cambio(stat)
+    return ALIAS, Frescura(fecha)
+
+
+# ------------------------------
+#  Vistas
+# ------------------------------
+def _leyendo(contenido, base):
+    """El contenido en streaming se genera después de la vista: también va a `base`."""
+    # set() y no reset(): el cierre del generador puede llegar desde otro contexto
+    anterior = _base_reporte.get()
+    _base_reporte.set(base)
+    try:
+        yield from contenido
+    finally:
+        _base_reporte.set(anterior)
+
+
+def reporte(vista):
+    """Decorador para vistas de sólo lectura: consultas a 'reporting' y `request.frescura`."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        base, request.frescura = preparar()
+        token = _base_reporte.set(base)
+        try:
+            response = vista(request, *args, **kwargs)
+        finally:
+            _base_reporte.reset(token)
+        if response.streaming:
+            response.streaming_content = _leyendo(response.streaming_content, base)
+        if request.frescura.fecha:
+            response['X-Datos-Al'] = request.frescura.fecha.isoformat()
+        return response
+
+    return envoltura
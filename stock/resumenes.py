@@ -0,0 +1,167 @@
+"""
+Resúmenes diarios de ventas (día × cliente y día × producto).
+
+Una venta cuenta para los reportes mientras está enviada o entregada. Cada
+vez que entra o sale de esos estados se suman (o restan) sus ventas,
+unidades y recaudación en las filas de su día de envío, así
+`consultar_ventas` lee unas pocas filas ya agregadas en vez de recorrer
+todas las ventas en cada pedido. `reconstruir()` los rehace desde cero.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DetalleVenta, ResumenVentaCliente, ResumenVentaProducto, Ventas
+
+ESTADOS_CONTABLES = ('enviada', 'entregada')
+
+
+def cuenta(estado):
+    return estado in ESTADOS_CONTABLES
+
+
+def _sumar(modelo, clave, ventas, unidades, recaudado):
+    """Suma en la fila `clave` (la crea si no existe) con UPDATE ... SET x = x + n."""
+    incrementos = {
+        'ventas': F('ventas') + ventas,
+        'unidades': F('unidades') + unidades,
+        'recaudado': F('recaudado') + recaudado,
+    }
+    if modelo.objects.filter(**clave).update(**incrementos):
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(**clave, ventas=ventas, unidades=unidades, recaudado=recaudado)
+    except IntegrityError:
+        # Otro request creó la fila entre el UPDATE y el INSERT
+        modelo.objects.filter(**clave).update(**incrementos)
+
+
+def aplicar_ventas(ventas, signo=1):
+    """
+    Suma (signo=1) o resta (signo=-1) las ventas en los resúmenes de su día.
+    Agrupa por (día, cliente) y (día, producto) antes de escribir: un lote
+    de ventas del mismo día son pocas filas.
+    """
+    dias = {venta.id: timezone.localdate(venta.fecha_envio) for venta in ventas}
+    if not dias:
+        return
+    por_cliente = defaultdict(lambda: [0, 0, Decimal('0')])
+    por_producto = defaultdict(lambda: [0, 0, Decimal('0')])
+    cliente_de = {}
+    for venta in ventas:
+        resumen = por_cliente[dias[venta.id], venta.cliente_id]
+        resumen[0] += 1
+        resumen[2] += venta.valor_total
+        cliente_de[venta.id] = venta.cliente_id
+
+    for fila in (
+        DetalleVenta.objects.filter(venta_id__in=dias)
+        .values('venta_id', 'producto_id')
+        .annotate(unidades=Sum('cantidad'), recaudado=Sum('subtotal'))
+    ):
+        dia = dias[fila['venta_id']]
+        por_cliente[dia, cliente_de[fila['venta_id']]][1] += fila['unidades']
+        resumen = por_producto[dia, fila['producto_id']]
+        resumen[0] += 1
+        resumen[1] += fila['unidades']
+        resumen[2] += fila['recaudado']
+
+    with transaction.atomic():
+        for (dia, cliente_id), (cantidad, unidades, recaudado) in por_cliente.items():
+            _sumar(
+                ResumenVentaCliente, {'dia': dia, 'cliente_id': cliente_id},
+                signo * cantidad, signo * unidades, signo * recaudado,
+            )
+        for (dia, producto_id), (cantidad, unidades, recaudado) in por_producto.items():
+            _sumar(
+                ResumenVentaProducto, {'dia': dia, 'producto_id': producto_id},
+                signo * cantidad, signo * unidades, signo * recaudado,
+            )
+
+
+def aplicar_venta(venta, signo=1):
+    """Suma (signo=1) o resta (signo=-1) la venta en los resúmenes de su día."""
+    aplicar_ventas([venta], signo)
+
+
+def registrar_transicion(venta, estado_anterior):
+    """Ajusta los resúmenes si la venta entró o salió de los estados contables."""
+    antes, ahora = cuenta(estado_anterior), cuenta(venta.estado)
+    if antes != ahora:
+        aplicar_venta(venta, 1 if ahora else -1)
+
+
+def totales(desde=None, hasta=None, cliente_id=None, producto_id=None):
+    """
+    {'ventas', 'unidades', 'recaudado'} del período leyendo los resúmenes.
+    Con producto, la recaudación es la de ese producto. Con cliente Y
+    producto no hay resumen que sirva: devuelve None.
+    """
+    if cliente_id and producto_id:
+        return None
+    if producto_id:
+        filas = ResumenVentaProducto.objects.filter(producto_id=producto_id)
+    else:
+        filas = ResumenVentaCliente.objects.all()
+        if cliente_id:
+            filas = filas.filter(cliente_id=cliente_id)
+    if desde:
+        filas = filas.filter(dia__gte=desde)
+    if hasta:
+        filas = filas.filter(dia__lte=hasta)
+
+    resultado = filas.aggregate(ventas=Sum('ventas'), unidades=Sum('unidades'), recaudado=Sum('recaudado'))
+    return {clave: valor or 0 for clave, valor in resultado.items()}
+
+
+def reconstruir():
+    """Borra y recalcula todos los resúmenes. Devuelve (filas_cliente, filas_producto)."""
+    ventas = Ventas.objects.filter(estado__in=ESTADOS_CONTABLES, fecha_envio__isnull=False)
+    detalles = DetalleVenta.objects.filter(venta__in=ventas)
+
+    por_cliente = defaultdict(lambda: {'ventas': 0, 'unidades': 0, 'recaudado': Decimal('0')})
+    for fila in (
+        ventas.annotate(dia=TruncDate('fecha_envio'))
+        .values('dia', 'cliente_id')
+        .annotate(num_ventas=Count('id'), total=Sum('valor_total'))
+    ):
+        resumen = por_cliente[fila['dia'], fila['cliente_id']]
+        resumen['ventas'] = fila['num_ventas']
+        resumen['recaudado'] = fila['total'] or 0
+    for fila in (
+        detalles.annotate(dia=TruncDate('venta__fecha_envio'))
+        .values('dia', 'venta__cliente_id')
+        .annotate(unidades=Sum('cantidad'))
+    ):
+        por_cliente[fila['dia'], fila['venta__cliente_id']]['unidades'] = fila['unidades']
+
+    por_producto = (
+        detalles.annotate(dia=TruncDate('venta__fecha_envio'))
+        .values('dia', 'producto_id')
+        .annotate(
+            num_ventas=Count('venta_id', distinct=True),
+            unidades=Sum('cantidad'),
+            recaudado=Sum('subtotal'),
+        )
+    )
+
+    with transaction.atomic():
+        ResumenVentaCliente.objects.all().delete()
+        ResumenVentaProducto.objects.all().delete()
+        clientes = ResumenVentaCliente.objects.bulk_create([
+            ResumenVentaCliente(dia=dia, cliente_id=cliente_id, **valores)
+            for (dia, cliente_id), valores in por_cliente.items()
+        ], batch_size=500)
+        productos = ResumenVentaProducto.objects.bulk_create([
+            ResumenVentaProducto(
+                dia=fila['dia'], producto_id=fila['producto_id'], ventas=fila['num_ventas'],
+                unidades=fila['unidades'], recaudado=fila['recaudado'],
+            )
+            for fila in por_producto
+        ], batch_size=500)
+    return len(clientes), len(productos)
@@ -0,0 +1,177 @@
+"""
+Secuenciado de rutas de reparto (programa_dia).
+
+Ordena las paradas del día de cada chofer con vecino más cercano desde el
+depósito y después lo mejora con 2-opt (dar vuelta un tramo si acorta el
+recorrido) hasta que no quede mejora o se agoten las pasadas. Es una
+heurística: no garantiza el óptimo, pero elimina los cruces y con 200+
+paradas tarda una fracción de segundo.
+
+Las distancias son en línea recta (haversine); para sugerir horarios se
+usa una velocidad promedio configurable, que ya descuenta que las calles
+no van en línea recta. Las paradas sin coordenadas van al final, en su
+orden de hora estimada.
+"""
+import math
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+RADIO_TIERRA_KM = 6371.0
+MAX_PASADAS_2OPT = 50
+
+
+def leer_coordenada(texto, limite):
+    """Decimal de un input de latitud (limite=90) / longitud (180), o None."""
+    try:
+        valor = Decimal(str(texto).strip().replace(',', '.'))
+    except (InvalidOperation, ValueError):
+        return None
+    if not valor.is_finite() or abs(valor) > limite:
+        return None
+    return valor.quantize(Decimal('0.000001'))
+
+
+def distancia_km(a, b):
+    """Haversine entre dos (lat, lon) en grados."""
+    lat1, lon1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lon2 = math.radians(b[0]), math.radians(b[1])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(h))
+
+
+def _matriz(puntos):
+    n = len(puntos)
+    matriz = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        fila = matriz[i]
+        for j in range(i + 1, n):
+            fila[j] = matriz[j][i] = distancia_km(puntos[i], puntos[j])
+    return matriz
+
+
+def _vecino_mas_cercano(d, n):
+    """Recorrido abierto que arranca en el nodo 0 (el depósito)."""
+    recorrido = [0]
+    pendientes = set(range(1, n))
+    actual = 0
+    while pendientes:
+        fila = d[actual]
+        actual = min(pendientes, key=fila.__getitem__)
+        pendientes.remove(actual)
+        recorrido.append(actual)
+    return recorrido
+
+
+def _dos_opt(recorrido, d):
+    """
+    2-opt sobre un recorrido abierto con el nodo 0 fijo al principio.
+    Invertir recorrido[i..j] cambia las aristas (i-1, i) y (j, j+1) por
+    (i-1, j) y (i, j+1); la última parada no tiene j+1.
+    """
+    n = len(recorrido)
+    for _ in range(MAX_PASADAS_2OPT):
+        mejoro = False
+        for i in range(1, n - 1):
+            a = recorrido[i - 1]
+            b = recorrido[i]
+            fila_a = d[a]
+            fila_b = d[b]
+            ab = fila_a[b]
+            for j in range(i + 1, n):
+                c = recorrido[j]
+                if j + 1 < n:
+                    e = recorrido[j + 1]
+                    delta = fila_a[c] + fila_b[e] - ab - d[c][e]
+                else:
+                    delta = fila_a[c] - ab
+                if delta < -1e-9:
+                    recorrido[i:j + 1] = recorrido[i:j + 1][::-1]
+                    b = recorrido[i]
+                    fila_b = d[b]
+                    ab = fila_a[b]
+                    mejoro = True
+        if not mejoro:
+            break
+    return recorrido
+
+
+def secuenciar(puntos, deposito=None):
+    """
+    Orden de visita de `puntos` [(lat, lon), ...] como lista de índices.
+    Sin depósito arranca por el primer punto.
+    """
+    if len(puntos) < 3 and deposito is None:
+        return list(range(len(puntos)))
+    if deposito is None:
+        nodos, desplazamiento = list(puntos), 0
+    else:
+        nodos, desplazamiento = [deposito, *puntos], 1
+    d = _matriz(nodos)
+    recorrido = _dos_opt(_vecino_mas_cercano(d, len(nodos)), d)
+    return [nodo - desplazamiento for nodo in recorrido[desplazamiento:]]
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def coordenadas(envio):
+    """(lat, lon) del envío: la del envío si la tiene, si no la del cliente."""
+    if envio.latitud is not None and envio.longitud is not None:
+        return float(envio.latitud), float(envio.longitud)
+    cliente = envio.venta.cliente
+    if cliente.latitud is not None and cliente.longitud is not None:
+        return float(cliente.latitud), float(cliente.longitud)
+    return None
+
+
+def planificar(envios, fecha=None):
+    """
+    Ruta de un chofer para un día: lista de dicts {'envio', 'orden',
+    'km' (tramo desde la parada anterior), 'hora_sugerida'} en orden de visita.
+    Depósito, hora de salida, velocidad y minutos por parada salen de
+    settings.RUTA_*.
+    """
+    deposito = _config('RUTA_DEPOSITO', None)
+    salida = _config('RUTA_HORA_SALIDA', time(8, 0))
+    velocidad = _config('RUTA_VELOCIDAD_KMH', 25)
+    minutos_parada = _config('RUTA_MINUTOS_POR_PARADA', 10)
+
+    envios = sorted(envios, key=lambda e: (e.hora_estimada, e.id))
+    con_coordenadas, sin_coordenadas = [], []
+    for envio in envios:
+        punto = coordenadas(envio)
+        (con_coordenadas if punto else sin_coordenadas).append((envio, punto))
+
+    orden = secuenciar([punto for _, punto in con_coordenadas], deposito)
+    ruta = [con_coordenadas[i] for i in orden] + sin_coordenadas
+
+    inicio = datetime.combine(fecha or datetime.min.date(), salida)
+    reloj = inicio
+    anterior = deposito
+    plan = []
+    for numero, (envio, punto) in enumerate(ruta, 1):
+        km = distancia_km(anterior, punto) if anterior and punto else None
+        if km is not None:
+            reloj += timedelta(hours=km / velocidad)
+        # Redondeado a 5 minutos hacia arriba; lo que no entra en el día no se sugiere
+        sugerida = _redondear(reloj)
+        plan.append({
+            'envio': envio,
+            'orden': numero,
+            'km': km,
+            'hora_sugerida': sugerida.time() if punto and sugerida.date() == inicio.date() else None,
+        })
+        if punto:
+            anterior = punto
+            reloj += timedelta(minutes=minutos_parada)
+    return plan
+
+
+def _redondear(momento, minutos=5):
+    resto = (momento.minute % minutos) * 60 + momento.second + momento.microsecond / 1e6
+    if resto:
+        momento += timedelta(seconds=minutos * 60 - resto)
+    return momento.replace(second=0, microsecond=0)
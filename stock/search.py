@@ -0,0 +1,58 @@
+"""
+Búsqueda de productos sobre un índice FTS5 de SQLite.
+
+`stock_producto_fts` guarda nombre del producto y de su tipo, sin acentos
+(`remove_diacritics`) y con índices de prefijo, así "cafe" encuentra
+"Café Molido" sin recorrer toda la tabla. Los triggers creados en la
+migración 0003 lo mantienen sincronizado; `reconstruir_indice()` lo repara.
+En otros motores se cae al `icontains` de siempre.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Value
+
+TABLA_FTS = 'stock_producto_fts'
+
+
+def usa_fts():
+    return connection.vendor == 'sqlite'
+
+
+def expresion_fts(texto):
+    """'café mol' -> '"café"* "mol"*' (todas las palabras, por prefijo)."""
+    palabras = re.findall(r'\w+', texto or '')
+    return ' '.join(f'"{p}"*' for p in palabras)
+
+
+def buscar_productos(queryset, texto):
+    """
+    Filtra `queryset` por `texto` y lo anota con `rank` (menor = más relevante).
+    Se ordena con ['rank', 'id'].
+    """
+    expresion = expresion_fts(texto)
+    if not expresion:
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+    if not usa_fts():
+        return queryset.filter(nombre__icontains=texto).annotate(
+            rank=Value(0.0, output_field=FloatField())
+        )
+
+    # JOIN contra la tabla virtual: FTS5 maneja el MATCH y calcula `rank` (bm25)
+    return queryset.filter(busqueda__indice__match=expresion).annotate(
+        rank=F('busqueda__rank')
+    )
+
+
+def reconstruir_indice():
+    """Regenera el índice completo desde Producto/TipoProducto. Devuelve filas indexadas."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLA_FTS}')
+        cursor.execute(
+            f'INSERT INTO {TABLA_FTS}(rowid, nombre, tipo) '
+            'SELECT p.id, p.nombre, t.nombre FROM stock_producto p '
+            'JOIN stock_tipoproducto t ON t.id = p.tipo_id'
+        )
+        cursor.execute(f'SELECT count(*) FROM {TABLA_FTS}')
+        return cursor.fetchone()[0]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Producto, ImagenProducto, TipoProducto
+from .models import Producto, ImagenProducto, TipoProducto, Cliente, Ventas, DetalleVenta, Envio
 
 class ImagenProductoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,6 +16,9 @@ class ProductoSerializer(serializers.ModelSerializer):
     # URL completa de la primera imagen (si existe)
     imagen_principal = serializers.SerializerMethodField()
     
+    # Derivados WebP/JPEG por tamaño de la primera imagen
+    imagen_variantes = serializers.SerializerMethodField()
+    
     class Meta:
         model = Producto
         fields = [
@@ -24,24 +27,115 @@ class ProductoSerializer(serializers.ModelSerializer):
             'tipo',
             'tipo_nombre',
             'cantidad',
+            'reservado',
+            'disponible',
             'valor',
             'umbral_alerta',
             'fecha_modificacion',
             'imagenes',
-            'imagen_principal'
+            'imagen_principal',
+            'imagen_variantes',
         ]
     
+    def _primera_imagen(self, obj):
+        # .all() usa el prefetch de imagenproducto_set; .first() haría otra consulta por fila
+        return min(obj.imagenproducto_set.all(), key=lambda i: i.id, default=None)
+    
+    def _url(self, ruta):
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(f'/media/{ruta}')
+        return f'/media/{ruta}'
+    
     def get_imagen_principal(self, obj):
-        """Retorna la URL completa de la primera imagen del producto"""
-        primera_imagen = obj.imagenproducto_set.first()
+        """Retorna la URL completa de la primera imagen del producto (tamaño tarjeta)"""
+        primera_imagen = self._primera_imagen(obj)
         if primera_imagen:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(f'/media/{primera_imagen.ruta}')
-            return f'/media/{primera_imagen.ruta}'
+            return self._url(primera_imagen.variante(480))
         return None
+    
+    def get_imagen_variantes(self, obj):
+        primera_imagen = self._primera_imagen(obj)
+        if not primera_imagen:
+            return {}
+        return {
+            nombre: {'ancho': v['ancho'], 'webp': self._url(v['webp']), 'jpeg': self._url(v['jpeg'])}
+            for nombre, v in primera_imagen.variantes.items()
+        }
 
 class TipoProductoSerializer(serializers.ModelSerializer):
     class Meta:
         model = TipoProducto
         fields = ['id', 'nombre']
+
+
+class LineaVentaSerializer(serializers.Serializer):
+    producto = serializers.IntegerField(min_value=1)
+    cantidad = serializers.IntegerField(min_value=1)
+
+
+class CrearVentaSerializer(serializers.Serializer):
+    """Pedido entrante por API: cliente + líneas (pensado para pedidos grandes)"""
+    cliente = serializers.PrimaryKeyRelatedField(queryset=Cliente.objects.all())
+    notas = serializers.CharField(required=False, allow_blank=True, default='')
+    lineas = LineaVentaSerializer(many=True, allow_empty=False, max_length=2000)
+
+
+# ------------------------------
+#  Sincronización de la app del chofer
+# ------------------------------
+class DetalleVentaSincronizacionSerializer(serializers.ModelSerializer):
+    producto_nombre = serializers.CharField(source='producto.nombre', read_only=True)
+
+    class Meta:
+        model = DetalleVenta
+        fields = ['id', 'producto', 'producto_nombre', 'cantidad', 'precio_unitario', 'subtotal']
+
+
+class VentaSincronizacionSerializer(serializers.ModelSerializer):
+    """Venta tal como la guarda el celular del chofer (con cliente y líneas)."""
+    cliente_nombre = serializers.CharField(source='cliente.nombre_completo', read_only=True)
+    cliente_direccion = serializers.CharField(source='cliente.direccion', read_only=True)
+    detalles = DetalleVentaSincronizacionSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Ventas
+        fields = [
+            'id', 'estado', 'cliente', 'cliente_nombre', 'cliente_direccion',
+            'fecha_envio_programada', 'hora_envio_programada', 'fecha_envio',
+            'valor_total', 'notas', 'fecha_modificacion', 'detalles',
+        ]
+
+
+class EnvioSincronizacionSerializer(serializers.ModelSerializer):
+    cliente_nombre = serializers.CharField(source='venta.cliente.nombre_completo', read_only=True)
+
+    class Meta:
+        model = Envio
+        fields = [
+            'id', 'venta', 'estado', 'cliente_nombre', 'direccion_entrega',
+            'fecha_envio', 'hora_estimada', 'hora_real_entrega', 'notas', 'fecha_modificacion',
+        ]
+
+
+class OperacionSincronizacionSerializer(serializers.Serializer):
+    """Un cambio hecho sin señal: nuevo estado y/o nota sobre una venta o un envío."""
+    id = serializers.CharField(max_length=64)  # generado por el celular, vuelve en el resultado
+    tipo = serializers.ChoiceField(choices=['venta', 'envio'])
+    objeto = serializers.IntegerField(min_value=1)
+    estado = serializers.CharField(required=False, allow_blank=True, default='')
+    nota = serializers.CharField(required=False, allow_blank=True, default='', max_length=2000)
+
+    def validate(self, datos):
+        if not datos['estado'] and not datos['nota']:
+            raise serializers.ValidationError('La operación no trae estado ni nota')
+        modelo = Ventas if datos['tipo'] == 'venta' else Envio
+        if datos['estado'] and datos['estado'] not in dict(modelo.ESTADO_CHOICES):
+            raise serializers.ValidationError(f"Estado inválido: {datos['estado']}")
+        return datos
+
+
+class SincronizacionSerializer(serializers.Serializer):
+    """Lote de operaciones encoladas + el último cursor que recibió el celular."""
+    cursor = serializers.CharField(required=False, allow_blank=True, default='')
+    operaciones = OperacionSincronizacionSerializer(many=True, max_length=500)
@@ -0,0 +1,693 @@
+"""
+Servicios de stock y ventas.
+
+Toda modificación de `Producto.cantidad` pasa por acá: cada cambio es un
+UPDATE condicional (`cantidad = cantidad - n WHERE cantidad >= n`) y deja su
+`StockMovimiento` dentro de la misma transacción, así dos despachantes
+trabajando a la vez nunca pisan el stock del otro ni venden de más.
+Lo mismo con las reservas: confirmar una venta reserva su demanda
+(`reservado = reservado + n WHERE disponible >= n`), cancelarla o volverla a
+pendiente la libera y el despacho la consume junto con el stock.
+Las ventas se dan de alta en bloque: una consulta para los productos, un
+bulk_create para los detalles y todo en una transacción.
+Cada cambio de estado y cada nota de ventas y envíos deja un EventoEstado
+(un INSERT chico, nunca se reescribe el texto de `notas`).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import invalidar_catalogo
+from .eventos import publicar_envios, publicar_ventas
+from .models import Producto, Ventas, DetalleVenta, Envio, EventoEstado, StockMovimiento
+from .resumenes import aplicar_venta, aplicar_ventas, cuenta
+
+
+class StockInsuficiente(Exception):
+    """Uno o más productos no alcanzan para cubrir lo pedido."""
+
+    def __init__(self, faltantes):
+        # faltantes: lista de dicts {'producto', 'necesita', 'hay'}
+        self.faltantes = faltantes
+        super().__init__(', '.join(
+            f"{f['producto']} (Necesita: {f['necesita']}, Hay: {f['hay']})"
+            for f in faltantes
+        ))
+
+
+class VentaNoDespachable(Exception):
+    """La venta dejó de estar confirmada (otro usuario la despachó o la cambió)."""
+
+
+class VentaInvalida(ValueError):
+    """Datos de la venta incorrectos (productos inexistentes, cantidades)."""
+
+
+# Cambios de estado permitidos a mano. El paso a "enviada" no está: lo hace
+# despachar_venta al crear el envío (descuenta stock).
+TRANSICIONES_VENTA = {
+    'pendiente': ['confirmada', 'cancelada'],
+    'confirmada': ['pendiente', 'cancelada'],
+    'enviada': ['entregada'],  # Solo si chofer actualiza envío
+    'entregada': [],  # No se puede cambiar
+    'cancelada': [],  # No se puede cambiar
+}
+
+TRANSICIONES_ENVIO = {
+    'pendiente': ['en_camino', 'entregado', 'cancelado'],
+    'en_camino': ['entregado', 'cancelado'],
+    'entregado': [],  # Cerrado: la venta ya pasó a entregada
+    'cancelado': [],
+}
+
+
+def _en_alerta_tras(delta):
+    """
+    Valor de `en_alerta` después de sumar `delta` a la cantidad, calculado en
+    el mismo UPDATE: (cantidad + delta) < umbral  <=>  cantidad < umbral - delta.
+    """
+    return ExpressionWrapper(
+        Q(cantidad__lt=F('umbral_alerta') - delta),
+        output_field=BooleanField(),
+    )
+
+
+def _cambios_stock(cantidad=0, reservado=0):
+    """
+    Campos del UPDATE que suma `cantidad` y `reservado` (deltas) a un producto,
+    recalculando en_alerta y disponible en la misma sentencia.
+    """
+    # Nunca por debajo de cero, aunque la reserva se haya desfasado
+    # (en el SET todas las F() leen los valores de antes del UPDATE)
+    reservado_nuevo = Greatest(F('reservado') + reservado, 0) if reservado < 0 else F('reservado') + reservado
+    cambios = {
+        'disponible': F('cantidad') + cantidad - reservado_nuevo,
+        'fecha_modificacion': timezone.now(),
+    }
+    if cantidad:
+        cambios['cantidad'] = F('cantidad') + cantidad
+        cambios['en_alerta'] = _en_alerta_tras(cantidad)
+    if reservado:
+        cambios['reservado'] = reservado_nuevo
+    return cambios
+
+
+def _descontar(producto_id, cantidad, reservado=0):
+    """
+    UPDATE condicional: True si había stock y se descontó.
+    `reservado`: parte de la reserva que se consume con la salida (despacho).
+    """
+    # update() no dispara señales: el catálogo cacheado muestra stock
+    invalidar_catalogo()
+    return Producto.objects.filter(
+        id=producto_id, cantidad__gte=cantidad
+    ).update(**_cambios_stock(-cantidad, -reservado)) == 1
+
+
+def _reservar(producto_id, cantidad):
+    """UPDATE condicional sobre lo disponible: True si alcanzó y se reservó."""
+    invalidar_catalogo()
+    return Producto.objects.filter(
+        id=producto_id, disponible__gte=cantidad
+    ).update(**_cambios_stock(reservado=cantidad)) == 1
+
+
+def _liberar(producto_id, cantidad):
+    invalidar_catalogo()
+    Producto.objects.filter(id=producto_id).update(**_cambios_stock(reservado=-cantidad))
+
+
+def _faltantes(demanda, campo='cantidad'):
+    """Arma el detalle de faltantes para los productos de `demanda` {id: cantidad}."""
+    productos = Producto.objects.filter(id__in=demanda).values_list('id', 'nombre', campo)
+    return [
+        {'producto': nombre, 'necesita': demanda[pid], 'hay': hay}
+        for pid, nombre, hay in productos
+    ]
+
+
+def _demanda_por_venta(ventas):
+    """{venta_id: {producto_id: unidades}} en una sola consulta."""
+    demanda = defaultdict(dict)
+    for venta_id, producto_id, total in (
+        DetalleVenta.objects.filter(venta__in=ventas)
+        .values('venta_id', 'producto_id')
+        .annotate(total=Sum('cantidad'))
+        .values_list('venta_id', 'producto_id', 'total')
+    ):
+        demanda[venta_id][producto_id] = total
+    return demanda
+
+
+def _asignar(venta_ids, demanda_por_venta, campo):
+    """
+    Reparte el stock (`campo`: 'cantidad' o 'disponible', leído en UNA
+    consulta) entre las ventas en el orden dado. La que no alcanza queda
+    afuera sin consumir nada.
+    Devuelve (ids aceptados, {venta_id: faltantes}, {producto_id: total aceptado}).
+    """
+    productos = {
+        producto_id: (nombre, hay)
+        for producto_id, nombre, hay in Producto.objects.filter(
+            id__in={pid for demanda in demanda_por_venta.values() for pid in demanda}
+        ).values_list('id', 'nombre', campo)
+    }
+    restante = {producto_id: hay for producto_id, (_, hay) in productos.items()}
+
+    aceptadas, sin_stock = [], {}
+    demanda_total = defaultdict(int)
+    for venta_id in venta_ids:
+        demanda = demanda_por_venta.get(venta_id, {})
+        faltantes = [
+            {'producto': productos[pid][0], 'necesita': total, 'hay': restante[pid]}
+            for pid, total in demanda.items()
+            if restante[pid] < total
+        ]
+        if faltantes:
+            sin_stock[venta_id] = faltantes
+            continue
+        for pid, total in demanda.items():
+            restante[pid] -= total
+            demanda_total[pid] += total
+        aceptadas.append(venta_id)
+    return aceptadas, sin_stock, demanda_total
+
+
+def sumar_stock(producto, cantidad, usuario=None, notas=''):
+    """Ingreso de mercadería."""
+    with transaction.atomic():
+        invalidar_catalogo()
+        Producto.objects.filter(id=producto.id).update(**_cambios_stock(cantidad))
+        StockMovimiento.objects.create(
+            producto=producto, tipo='entrada', cantidad=cantidad,
+            usuario=usuario, notas=notas,
+        )
+
+
+def restar_stock(producto, cantidad, usuario=None, notas=''):
+    """Ajuste manual a la baja. Nunca deja el stock negativo."""
+    with transaction.atomic():
+        if not _descontar(producto.id, cantidad):
+            raise StockInsuficiente(_faltantes({producto.id: cantidad}))
+        StockMovimiento.objects.create(
+            producto=producto, tipo='ajuste', cantidad=-cantidad,
+            usuario=usuario, notas=notas,
+        )
+
+
+def reconciliar_alertas():
+    """
+    Corrige `en_alerta` donde no coincida con cantidad < umbral_alerta
+    (p.ej. tras cambios hechos por fuera de la app). Devuelve filas corregidas.
+    """
+    invalidar_catalogo()
+    activadas = Producto.objects.filter(
+        en_alerta=False, cantidad__lt=F('umbral_alerta')
+    ).update(en_alerta=True)
+    desactivadas = Producto.objects.filter(
+        en_alerta=True, cantidad__gte=F('umbral_alerta')
+    ).update(en_alerta=False)
+    return activadas + desactivadas
+
+
+def recalcular_reservas():
+    """
+    Recalcula `reservado` (y `disponible`) desde las ventas confirmadas, por
+    si quedaron desfasados tras cambios hechos por fuera de la app.
+    Devuelve productos corregidos.
+    """
+    reservas = dict(
+        DetalleVenta.objects.filter(venta__estado='confirmada')
+        .values('producto_id')
+        .annotate(total=Sum('cantidad'))
+        .values_list('producto_id', 'total')
+    )
+    corregidos = 0
+    for producto_id, cantidad, reservado, disponible in Producto.objects.values_list(
+        'id', 'cantidad', 'reservado', 'disponible'
+    ).iterator():
+        correcto = reservas.get(producto_id, 0)
+        if reservado != correcto or disponible != cantidad - correcto:
+            Producto.objects.filter(id=producto_id).update(
+                reservado=correcto, disponible=F('cantidad') - correcto
+            )
+            corregidos += 1
+    invalidar_catalogo()
+    return corregidos
+
+
+def registrar_stock_inicial(producto, usuario=None):
+    """Deja en el ledger el stock con el que se dio de alta el producto."""
+    if producto.cantidad:
+        StockMovimiento.objects.create(
+            producto=producto, tipo='entrada', cantidad=producto.cantidad,
+            usuario=usuario, notas='Stock inicial',
+        )
+
+
+def registrar_venta(cliente, lineas, usuario, notas=''):
+    """
+    Crea una venta pendiente con sus detalles.
+    `lineas`: iterable de (producto_id, cantidad). Resuelve todos los productos
+    con un solo `in_bulk`, inserta los detalles con `bulk_create` y calcula
+    el total en la misma pasada; si algo falla no queda una venta a medias.
+    """
+    lineas = [(int(producto_id), int(cantidad)) for producto_id, cantidad in lineas]
+    if not lineas:
+        raise VentaInvalida('La venta no tiene productos')
+    if any(cantidad <= 0 for _, cantidad in lineas):
+        raise VentaInvalida('Las cantidades deben ser mayores a cero')
+
+    productos = Producto.objects.only('id', 'valor').in_bulk({pid for pid, _ in lineas})
+    inexistentes = sorted({pid for pid, _ in lineas if pid not in productos})
+    if inexistentes:
+        raise VentaInvalida(f'Productos inexistentes: {", ".join(map(str, inexistentes))}')
+
+    detalles = []
+    total = 0
+    for producto_id, cantidad in lineas:
+        precio = productos[producto_id].valor
+        subtotal = precio * cantidad
+        total += subtotal
+        detalles.append(DetalleVenta(
+            producto_id=producto_id,
+            cantidad=cantidad,
+            precio_unitario=precio,
+            subtotal=subtotal,
+        ))
+
+    with transaction.atomic():
+        venta = Ventas.objects.create(
+            cliente=cliente,
+            estado='pendiente',
+            notas=notas or '',
+            valor_total=total,
+            usuario_creador=usuario,
+        )
+        for detalle in detalles:
+            detalle.venta = venta
+        DetalleVenta.objects.bulk_create(detalles)
+        registrar_evento(venta, '', 'pendiente', usuario=usuario)
+
+    return venta
+
+
+def demanda_de_venta(venta):
+    """{producto_id: unidades} sumando las líneas de la venta."""
+    return dict(
+        venta.detalles.values('producto_id')
+        .annotate(total=Sum('cantidad'))
+        .values_list('producto_id', 'total')
+    )
+
+
+def cambiar_estado_venta(venta, nuevo_estado, usuario=None, chofer=None, nota=''):
+    """
+    Cambia el estado de UNA venta (y la guarda con lo que traiga la
+    instancia) y lo registra en su historial, con `nota` si viene.
+    Mantiene las reservas de stock:
+    - al entrar a confirmada reserva su demanda sobre lo disponible
+      (StockInsuficiente si no alcanza, y no se cambia nada);
+    - al salir de confirmada la libera, o la consume si pasa a
+      enviada/entregada sin pasar por despachar_venta.
+    """
+    with transaction.atomic():
+        anterior = Ventas.objects.filter(pk=venta.pk).values_list('estado', flat=True).first()
+        if anterior != nuevo_estado and 'confirmada' in (anterior, nuevo_estado):
+            demanda = demanda_de_venta(venta)
+            if nuevo_estado == 'confirmada':
+                sin_stock = {
+                    producto_id: total
+                    for producto_id, total in demanda.items()
+                    if not _reservar(producto_id, total)
+                }
+                if sin_stock:
+                    raise StockInsuficiente(_faltantes(sin_stock, 'disponible'))
+            elif cuenta(nuevo_estado):
+                sin_stock = {
+                    producto_id: total
+                    for producto_id, total in demanda.items()
+                    if not _descontar(producto_id, total, reservado=total)
+                }
+                if sin_stock:
+                    raise StockInsuficiente(_faltantes(sin_stock))
+                StockMovimiento.objects.bulk_create([
+                    StockMovimiento(
+                        producto_id=producto_id, tipo='salida', cantidad=-total,
+                        venta=venta, usuario=usuario, notas='Salida sin envío',
+                    )
+                    for producto_id, total in demanda.items()
+                ])
+            else:
+                for producto_id, total in demanda.items():
+                    _liberar(producto_id, total)
+
+        venta.estado = nuevo_estado
+        venta.save()
+        if anterior != nuevo_estado or nota:
+            registrar_evento(venta, anterior, nuevo_estado, nota, usuario, chofer)
+
+
+def evento(registro, anterior, nuevo, nota='', usuario=None, chofer=None):
+    """EventoEstado (sin guardar) de la venta o envío `registro`."""
+    es_envio = isinstance(registro, Envio)
+    return EventoEstado(
+        tipo='envio' if es_envio else 'venta',
+        venta_id=registro.venta_id if es_envio else registro.id,
+        envio=registro if es_envio else None,
+        estado_anterior=anterior or '',
+        estado_nuevo=nuevo or '',
+        nota=nota or '',
+        usuario=usuario if usuario is not None and usuario.is_authenticated else None,
+        chofer=chofer,
+    )
+
+
+def registrar_evento(registro, anterior, nuevo, nota='', usuario=None, chofer=None):
+    """Agrega una fila al historial de la venta o envío `registro`."""
+    fila = evento(registro, anterior, nuevo, nota, usuario, chofer)
+    fila.save()
+    return fila
+
+
+def agregar_nota(registro, texto, usuario=None, chofer=None):
+    """Nota en el historial de `registro` sin cambiar su estado (un INSERT)."""
+    return registrar_evento(registro, registro.estado, registro.estado, texto, usuario, chofer)
+
+
+def historial(registro):
+    """
+    Línea de tiempo de una venta (con los eventos de su envío) o de un
+    envío, en orden: un solo rango del índice (venta|envio, fecha).
+    """
+    filtro = {'envio': registro} if isinstance(registro, Envio) else {'venta': registro}
+    return EventoEstado.objects.filter(**filtro).select_related('usuario', 'chofer').order_by('fecha', 'id')
+
+
+def cambiar_estado_envio(envio, nuevo_estado, nota='', usuario=None, chofer=None):
+    """
+    Cambia el estado de un envío, lo guarda y lo registra en el historial.
+    Al marcarlo entregado registra la hora real de entrega y pasa la venta
+    de enviada a entregada.
+    """
+    with transaction.atomic():
+        eventos = []
+        if envio.estado != nuevo_estado or nota:
+            eventos.append(evento(envio, envio.estado, nuevo_estado, nota, usuario, chofer))
+        envio.estado = nuevo_estado
+        if nuevo_estado == 'entregado' and not envio.hora_real_entrega:
+            envio.hora_real_entrega = timezone.now()
+            if envio.venta.estado == 'enviada':
+                envio.venta.estado = 'entregada'
+                envio.venta.save()
+                eventos.append(evento(envio.venta, 'enviada', 'entregada', '', usuario, chofer))
+        envio.save()
+        EventoEstado.objects.bulk_create(eventos)
+
+
+def liberar_venta(venta):
+    """Devuelve a disponible lo reservado por una venta confirmada (p.ej. al borrarla)."""
+    for producto_id, total in demanda_de_venta(venta).items():
+        _liberar(producto_id, total)
+
+
+def despachar_venta(venta, chofer, fecha_envio, hora_estimada,
+                    direccion_entrega='', notas='', usuario=None):
+    """
+    Crea el Envío de una venta confirmada en UNA transacción:
+    marca la venta como enviada, descuenta el stock producto por producto
+    con UPDATE condicional, escribe los movimientos del ledger y la suma
+    a los resúmenes diarios.
+    Si algo falla no queda nada a medias.
+    """
+    demanda = demanda_de_venta(venta)
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        # 🔒 Reclamar la venta: sólo un despacho puede pasarla a enviada
+        reclamada = Ventas.objects.filter(
+            id=venta.id, estado='confirmada'
+        ).update(estado='enviada', fecha_envio=ahora, fecha_modificacion=ahora)
+        if not reclamada:
+            raise VentaNoDespachable(f'La venta #{venta.id} ya no está confirmada')
+
+        # Sale el stock y se consume la reserva hecha al confirmar
+        sin_stock = {
+            producto_id: total
+            for producto_id, total in demanda.items()
+            if not _descontar(producto_id, total, reservado=total)
+        }
+        if sin_stock:
+            raise StockInsuficiente(_faltantes(sin_stock))
+
+        envio = Envio.objects.create(
+            venta=venta,
+            chofer=chofer,
+            fecha_envio=fecha_envio,
+            hora_estimada=hora_estimada,
+            direccion_entrega=direccion_entrega,
+            notas=notas,
+            estado='pendiente',
+        )
+
+        StockMovimiento.objects.bulk_create([
+            StockMovimiento(
+                producto_id=producto_id, tipo='salida', cantidad=-total,
+                venta=venta, envio=envio, usuario=usuario,
+            )
+            for producto_id, total in demanda.items()
+        ])
+        EventoEstado.objects.bulk_create([
+            evento(venta, 'confirmada', 'enviada', usuario=usuario),
+            evento(envio, '', 'pendiente', usuario=usuario),
+        ])
+
+        # update() no dispara señales: sumar a los resúmenes del día a mano
+        venta.fecha_envio = ahora
+        aplicar_venta(venta, 1)
+
+    venta.estado = 'enviada'
+    publicar_ventas([venta])  # el Envío lo publica su señal
+    return envio
+
+
+def despachar_ventas(venta_ids, chofer=None, fecha_envio=None, hora_estimada=None, usuario=None):
+    """
+    Despacho en lote: crea los Envíos de muchas ventas confirmadas de una vez.
+    Cada venta usa su chofer / fecha / hora programados y, si no los tiene,
+    los que vienen por parámetro.
+
+    Suma la demanda por producto de todas las ventas y lee el stock en UNA
+    consulta. Las ventas se atienden por antigüedad: la que no alcanza queda
+    afuera (sin consumir stock) y las demás siguen. Luego, en una transacción:
+    un UPDATE para pasar las ventas a enviada, un UPDATE condicional por
+    producto (sale el stock y se consume la reserva), bulk_create de Envíos
+    y movimientos.
+
+    Devuelve {'despachadas': [venta_id], 'sin_stock': {venta_id: faltantes},
+    'rechazadas': {venta_id: motivo}}.
+    """
+    try:
+        ids = {int(venta_id) for venta_id in venta_ids}
+    except (TypeError, ValueError):
+        raise VentaInvalida('IDs de venta inválidos')
+    resultado = {'despachadas': [], 'sin_stock': {}, 'rechazadas': {}}
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        ventas = list(
+            Ventas.objects.filter(id__in=ids, estado='confirmada', envio__isnull=True)
+            .select_related('cliente')
+            .order_by('fecha_creacion', 'id')
+        )
+        for venta_id in ids - {venta.id for venta in ventas}:
+            resultado['rechazadas'][venta_id] = 'No está confirmada o ya tiene envío'
+
+        datos_envio = {}
+        for venta in ventas:
+            datos = {
+                'chofer_id': venta.chofer_id or (chofer.id if chofer else None),
+                'fecha_envio': venta.fecha_envio_programada or fecha_envio,
+                'hora_estimada': venta.hora_envio_programada or hora_estimada,
+            }
+            if not all(datos.values()):
+                resultado['rechazadas'][venta.id] = 'Falta chofer, fecha u hora de envío'
+            else:
+                datos_envio[venta.id] = datos
+        ventas = [venta for venta in ventas if venta.id in datos_envio]
+
+        # 🔎 Chequeo de stock: una sola consulta para todos los productos.
+        # Las ventas confirmadas ya tienen su parte reservada dentro de cantidad.
+        demanda_por_venta = _demanda_por_venta(ventas)
+        ids_aceptados, resultado['sin_stock'], demanda_total = _asignar(
+            [venta.id for venta in ventas], demanda_por_venta, 'cantidad'
+        )
+        aceptadas = [venta for venta in ventas if venta.id in set(ids_aceptados)]
+
+        if not aceptadas:
+            return resultado
+
+        # 🔒 Reclamar las ventas: si otro despacho tomó alguna, no se hace nada
+        reclamadas = Ventas.objects.filter(
+            id__in=[venta.id for venta in aceptadas], estado='confirmada'
+        ).update(estado='enviada', fecha_envio=ahora, fecha_modificacion=ahora)
+        if reclamadas != len(aceptadas):
+            raise VentaNoDespachable('Otro usuario modificó alguna de las ventas; reintentar')
+
+        sin_stock = {
+            producto_id: total
+            for producto_id, total in demanda_total.items()
+            if not _descontar(producto_id, total, reservado=total)
+        }
+        if sin_stock:
+            raise StockInsuficiente(_faltantes(sin_stock))
+
+        envios = Envio.objects.bulk_create([
+            Envio(
+                venta=venta,
+                direccion_entrega=venta.cliente.direccion or '',
+                notas='',
+                estado='pendiente',
+                **datos_envio[venta.id],
+            )
+            for venta in aceptadas
+        ])
+        StockMovimiento.objects.bulk_create([
+            StockMovimiento(
+                producto_id=producto_id, tipo='salida', cantidad=-total,
+                venta=envio.venta, envio=envio, usuario=usuario,
+            )
+            for envio in envios
+            for producto_id, total in demanda_por_venta.get(envio.venta_id, {}).items()
+        ])
+        EventoEstado.objects.bulk_create([
+            fila
+            for envio in envios
+            for fila in (
+                evento(envio.venta, 'confirmada', 'enviada', usuario=usuario),
+                evento(envio, '', 'pendiente', usuario=usuario),
+            )
+        ])
+
+        for venta in aceptadas:
+            venta.estado = 'enviada'
+            venta.fecha_envio = ahora
+        aplicar_ventas(aceptadas, 1)
+        # update() y bulk_create no disparan señales: eventos en vivo a mano
+        publicar_ventas(aceptadas)
+        publicar_envios(envios)
+
+    resultado['despachadas'] = [venta.id for venta in aceptadas]
+    return resultado
+
+
+def cambiar_estado_ventas(venta_ids, nuevo_estado, usuario=None):
+    """
+    Pasa varias ventas a `nuevo_estado` respetando TRANSICIONES_VENTA:
+    una lectura para validar, un solo UPDATE ... WHERE id IN (...) AND
+    estado IN (orígenes permitidos) y una relectura para confirmar.
+    Al confirmar reserva stock (las que no tienen disponible se rechazan);
+    al salir de confirmada lo libera. Los eventos del historial van en un
+    bulk_create.
+    Devuelve {venta_id: (aceptada, motivo)}.
+    """
+    etiquetas = dict(Ventas.ESTADO_CHOICES)
+    if nuevo_estado not in etiquetas:
+        raise VentaInvalida(f'Estado inválido: {nuevo_estado}')
+    try:
+        ids = {int(venta_id) for venta_id in venta_ids}
+    except (TypeError, ValueError):
+        raise VentaInvalida('IDs de venta inválidos')
+
+    origenes = [
+        estado for estado, destinos in TRANSICIONES_VENTA.items()
+        if nuevo_estado in destinos
+    ]
+    resultados = {}
+
+    with transaction.atomic():
+        actuales = {
+            venta_id: (estado, usuario_creador_id)
+            for venta_id, estado, usuario_creador_id in Ventas.objects.filter(
+                id__in=ids
+            ).values_list('id', 'estado', 'usuario_creador_id')
+        }
+        candidatas = []
+        for venta_id in sorted(ids):
+            if venta_id not in actuales:
+                resultados[venta_id] = (False, 'No existe')
+                continue
+            estado, usuario_creador_id = actuales[venta_id]
+            if estado not in origenes:
+                resultados[venta_id] = (
+                    False, f'No se puede cambiar de "{etiquetas[estado]}" a "{etiquetas[nuevo_estado]}"'
+                )
+            elif nuevo_estado == 'pendiente' and not usuario_creador_id:
+                # Misma regla que Ventas.save()
+                resultados[venta_id] = (False, 'Una venta pendiente debe tener usuario creador')
+            else:
+                candidatas.append(venta_id)
+
+        demanda_por_venta = {}
+        if nuevo_estado == 'confirmada' or any(actuales[v][0] == 'confirmada' for v in candidatas):
+            demanda_por_venta = _demanda_por_venta(candidatas)
+        if nuevo_estado == 'confirmada':
+            # 🔒 Sólo se confirman las que tienen disponible, por orden de alta
+            candidatas, sin_stock, _ = _asignar(candidatas, demanda_por_venta, 'disponible')
+            for venta_id, faltantes in sin_stock.items():
+                resultados[venta_id] = (False, f'Sin stock disponible: {StockInsuficiente(faltantes)}')
+
+        if candidatas:
+            filtro = {'id__in': candidatas, 'estado__in': origenes}
+            if nuevo_estado == 'pendiente':
+                filtro['usuario_creador__isnull'] = False
+            # Con la tabla actual ninguna transición masiva entra o sale de
+            # los estados contables, pero si cambiara los resúmenes siguen bien
+            ajustar = [
+                venta_id for venta_id in candidatas
+                if cuenta(actuales[venta_id][0]) != cuenta(nuevo_estado)
+            ]
+            Ventas.objects.filter(**filtro).update(estado=nuevo_estado, fecha_modificacion=timezone.now())
+
+            cambiadas = set(Ventas.objects.filter(
+                id__in=candidatas, estado=nuevo_estado
+            ).values_list('id', flat=True))
+            for venta_id in candidatas:
+                resultados[venta_id] = (
+                    (True, '') if venta_id in cambiadas
+                    else (False, 'Otro usuario la modificó')
+                )
+            aplicar_ventas(
+                Ventas.objects.filter(id__in=[v for v in ajustar if v in cambiadas]),
+                1 if cuenta(nuevo_estado) else -1,
+            )
+            publicar_ventas(Ventas.objects.filter(id__in=cambiadas))
+            EventoEstado.objects.bulk_create([
+                evento(Ventas(id=venta_id), actuales[venta_id][0], nuevo_estado, usuario=usuario)
+                for venta_id in sorted(cambiadas)
+            ])
+
+            reservar, liberar = defaultdict(int), defaultdict(int)
+            for venta_id in cambiadas:
+                if nuevo_estado == 'confirmada':
+                    destino = reservar
+                elif actuales[venta_id][0] == 'confirmada':
+                    destino = liberar
+                else:
+                    continue
+                for producto_id, total in demanda_por_venta.get(venta_id, {}).items():
+                    destino[producto_id] += total
+            sin_stock = {
+                producto_id: total
+                for producto_id, total in reservar.items()
+                if not _reservar(producto_id, total)
+            }
+            if sin_stock:
+                raise StockInsuficiente(_faltantes(sin_stock, 'disponible'))
+            for producto_id, total in liberar.items():
+                _liberar(producto_id, total)
+
+    return resultados
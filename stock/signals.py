@@ -0,0 +1,73 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import estadisticas
+from .cache import invalidar_catalogo
+from .eventos import evento_envio, evento_venta, publicar
+from .models import Envio, ImagenProducto, Producto, TipoProducto, Ventas
+from .resumenes import aplicar_venta, cuenta, registrar_transicion
+from .services import liberar_venta
+
+
+@receiver([post_save, post_delete], sender=Producto)
+@receiver([post_save, post_delete], sender=ImagenProducto)
+@receiver([post_save, post_delete], sender=TipoProducto)
+def catalogo_modificado(sender, **kwargs):
+    invalidar_catalogo()
+
+
+# Lo que se lee de la base antes de guardar (la instancia puede estar desactualizada)
+CAMPOS_PREVIOS = {
+    Ventas: ('estado', 'chofer_id'),
+    Envio: estadisticas.CAMPOS,
+}
+
+
+@receiver(pre_save, sender=Ventas)
+@receiver(pre_save, sender=Envio)
+def recordar_estado(sender, instance, raw=False, **kwargs):
+    instance._previo = None
+    if instance.pk and not raw:
+        instance._previo = sender.objects.filter(pk=instance.pk).values(*CAMPOS_PREVIOS[sender]).first()
+    previo = instance._previo or {}
+    instance._estado_previo = previo.get('estado')
+    instance._chofer_previo = previo.get('chofer_id')
+
+
+def _cambio_visible(instance, created):
+    return created or (instance._estado_previo, instance._chofer_previo) != (
+        instance.estado, instance.chofer_id
+    )
+
+
+@receiver(post_save, sender=Ventas)
+def venta_guardada(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    registrar_transicion(instance, getattr(instance, '_estado_previo', None))
+    if _cambio_visible(instance, created):
+        publicar(evento_venta(instance, instance._chofer_previo))
+
+
+@receiver(post_save, sender=Envio)
+def envio_guardado(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    estadisticas.registrar_cambio(instance._previo, estadisticas.datos(instance))
+    if _cambio_visible(instance, created):
+        publicar(evento_envio(instance, instance._chofer_previo))
+
+
+@receiver(post_delete, sender=Envio)
+def envio_borrado(sender, instance, **kwargs):
+    estadisticas.registrar_cambio(estadisticas.datos(instance), None)
+
+
+@receiver(pre_delete, sender=Ventas)
+def venta_borrada(sender, instance, **kwargs):
+    # pre_delete: los detalles todavía existen
+    estado = Ventas.objects.filter(pk=instance.pk).values_list('estado', flat=True).first()
+    if cuenta(estado):
+        aplicar_venta(instance, -1)
+    elif estado == 'confirmada':
+        liberar_venta(instance)
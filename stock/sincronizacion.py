@@ -0,0 +1,139 @@
+"""
+Sincronización incremental para la app del chofer (offline-first).
+
+El celular guarda sus ventas y envíos y, cuando tiene señal:
+- baja sólo lo que cambió desde el último cursor que le dio el servidor
+  (`fecha_modificacion >= cursor`, con índice por chofer), más la lista de
+  ids vigentes para borrar lo que ya no le corresponde;
+- sube en un solo pedido los cambios de estado y notas que encoló sin señal.
+
+Los conflictos se resuelven con la hora del servidor: si el registro se
+modificó en el servidor después del cursor con el que el chofer trabajaba,
+gana el servidor y el cambio de estado se rechaza (la nota se agrega igual
+al historial: las notas sólo se acumulan). Lo mismo si el estado no es un
+paso permitido desde el actual (TRANSICIONES_VENTA / TRANSICIONES_ENVIO). El cursor va firmado para que el celular no
+pueda fabricarlo.
+"""
+from datetime import timedelta
+
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Envio, Ventas
+from .pagination import CursorInvalido
+from .serializers import EnvioSincronizacionSerializer, VentaSincronizacionSerializer
+from .services import (
+    TRANSICIONES_ENVIO, TRANSICIONES_VENTA, StockInsuficiente, agregar_nota,
+    cambiar_estado_envio, cambiar_estado_venta,
+)
+
+ESTADOS_ACTIVOS_VENTA = ('confirmada', 'enviada')
+ESTADOS_ACTIVOS_ENVIO = ('pendiente', 'en_camino')
+
+# Solapamiento entre una bajada y la siguiente: cubre transacciones que
+# tomaron su hora antes del cursor pero terminaron después. Lo repetido el
+# celular lo pisa por id.
+MARGEN = timedelta(seconds=5)
+
+_SAL = 'stock.sincronizacion'
+
+
+def emitir_cursor(momento):
+    return signing.dumps(momento.isoformat(), salt=_SAL, compress=True)
+
+
+def leer_cursor(cursor):
+    """datetime del cursor, o None si viene vacío (primera sincronización)."""
+    if not cursor:
+        return None
+    try:
+        momento = parse_datetime(signing.loads(cursor, salt=_SAL))
+    except (signing.BadSignature, TypeError, ValueError) as e:
+        raise CursorInvalido(cursor) from e
+    if momento is None:
+        raise CursorInvalido(cursor)
+    return momento
+
+
+def cambios(chofer, desde=None):
+    """
+    Lo que el celular de `chofer` tiene que actualizar desde `desde`
+    (sin `desde`: todo lo activo). Devuelve un dict listo para JSON.
+    """
+    ahora = timezone.now()
+    ventas = Ventas.objects.filter(chofer=chofer)
+    envios = Envio.objects.filter(chofer=chofer)
+    if desde is None:
+        ventas = ventas.filter(estado__in=ESTADOS_ACTIVOS_VENTA)
+        envios = envios.filter(estado__in=ESTADOS_ACTIVOS_ENVIO)
+    else:
+        ventas = ventas.filter(fecha_modificacion__gte=desde - MARGEN)
+        envios = envios.filter(fecha_modificacion__gte=desde - MARGEN)
+
+    ventas = ventas.select_related('cliente').prefetch_related('detalles__producto').order_by('id')
+    envios = envios.select_related('venta__cliente').order_by('id')
+
+    return {
+        'cursor': emitir_cursor(ahora),
+        'ventas': VentaSincronizacionSerializer(ventas, many=True).data,
+        'envios': EnvioSincronizacionSerializer(envios, many=True).data,
+        # Lo que no esté acá (reasignado, cerrado, borrado) el celular lo descarta
+        'vigentes': {
+            'ventas': list(Ventas.objects.filter(
+                chofer=chofer, estado__in=ESTADOS_ACTIVOS_VENTA
+            ).values_list('id', flat=True)),
+            'envios': list(Envio.objects.filter(
+                chofer=chofer, estado__in=ESTADOS_ACTIVOS_ENVIO
+            ).values_list('id', flat=True)),
+        },
+    }
+
+
+def aplicar(chofer, operaciones, base=None):
+    """
+    Aplica en orden las operaciones encoladas por el chofer.
+    `base`: momento del cursor con el que el celular vio los datos.
+    Devuelve una lista de {'id', 'resultado', 'motivo'} con resultado
+    'aplicada', 'conflicto' o 'rechazada'.
+    """
+    resultados = []
+    tocados = set()  # registros ya cambiados por este mismo lote
+    for operacion in operaciones:
+        modelo = Ventas if operacion['tipo'] == 'venta' else Envio
+        registro = modelo.objects.filter(id=operacion['objeto'], chofer=chofer).first()
+        clave = (operacion['tipo'], operacion['objeto'])
+        resultado, motivo = 'aplicada', ''
+
+        if registro is None:
+            resultados.append({'id': operacion['id'], 'resultado': 'rechazada', 'motivo': 'No está asignado a este chofer'})
+            continue
+
+        nuevo_estado = operacion['estado']
+        if nuevo_estado == registro.estado:
+            nuevo_estado = ''
+        if nuevo_estado and base and clave not in tocados and registro.fecha_modificacion > base:
+            resultado, motivo = 'conflicto', 'Se modificó en el servidor después de la última sincronización'
+            nuevo_estado = ''
+        transiciones = TRANSICIONES_ENVIO if operacion['tipo'] == 'envio' else TRANSICIONES_VENTA
+        if nuevo_estado and nuevo_estado not in transiciones.get(registro.estado, []):
+            resultado, motivo = 'rechazada', f'No se puede pasar de "{registro.estado}" a "{nuevo_estado}"'
+            nuevo_estado = ''
+
+        try:
+            with transaction.atomic():
+                if operacion['tipo'] == 'envio' and nuevo_estado:
+                    cambiar_estado_envio(registro, nuevo_estado, operacion['nota'], chofer=chofer)
+                elif nuevo_estado:
+                    cambiar_estado_venta(registro, nuevo_estado, chofer=chofer, nota=operacion['nota'])
+                elif operacion['nota']:
+                    agregar_nota(registro, operacion['nota'], chofer=chofer)
+                    registro.save(update_fields=['fecha_modificacion'])
+        except StockInsuficiente as e:
+            resultado, motivo = 'rechazada', f'Sin stock para ese estado: {e}'
+
+        if resultado == 'aplicada':
+            tocados.add(clave)
+        resultados.append({'id': operacion['id'], 'resultado': resultado, 'motivo': motivo})
+    return resultados
@@ -0,0 +1,14 @@
+import uuid
+
+from django import template
+from django.utils.html import format_html
+
+from stock.idempotencia import CAMPO_FORM
+
+register = template.Library()
+
+
+@register.simple_tag
+def clave_idempotencia():
+    """Campo oculto con una clave nueva por cada vez que se dibuja el formulario."""
+    return format_html('<input type="hidden" name="{}" value="{}">', CAMPO_FORM, uuid.uuid4().hex)
@@ -0,0 +1,26 @@
+from django import template
+from django.conf import settings
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def imagen_producto(imagen, ancho, alt=''):
+    """
+    <picture> con la variante más chica que cubra `ancho` px (x2 para
+    pantallas de alta densidad): WebP y JPEG de fallback, o el original.
+    """
+    necesario = int(ancho) * 2
+    media = settings.MEDIA_URL
+    if not imagen.variantes:
+        return format_html(
+            '<img src="{}{}" alt="{}" width="{}" loading="lazy">',
+            media, imagen.ruta, alt, ancho,
+        )
+    return format_html(
+        '<picture><source srcset="{}{}" type="image/webp">'
+        '<img src="{}{}" alt="{}" width="{}" loading="lazy"></picture>',
+        media, imagen.variante(necesario, 'webp'),
+        media, imagen.variante(necesario, 'jpeg'), alt, ancho,
+    )
@@ -1,3 +1,1681 @@
-from django.test import TestCase
+import asyncio
+import csv
+import importlib
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import zipfile
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Chofer, ClaveIdempotencia, Cliente, DetalleVenta, Envio, EventoEstado, ImagenProducto, Producto,
+    ResumenChoferSemana, StockMovimiento, TipoProducto, Ventas,
+)
+from .cache import estadisticas, obtener_o_construir, version_catalogo
+from .pagination import paginar
+from . import asignacion, eventos, exportar, idempotencia, imagenes, reportes, resumenes, rutas
+from .reintentos import reintentar_si_ocupada
+from .search import TABLA_FTS, buscar_productos, expresion_fts
+from .services import (
+    StockInsuficiente, VentaInvalida, cambiar_estado_envio, cambiar_estado_venta, cambiar_estado_ventas,
+    despachar_venta, despachar_ventas, historial, registrar_venta, restar_stock,
+)
+
+
+class DatosBase(TestCase):
+    """Usuario, producto, cliente y chofer que usan casi todos los tests."""
+
+    STOCK = 100
+    UMBRAL = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('admin', 'admin@example.com', 'clave')
+        cls.tipo = TipoProducto.objects.create(nombre='Bebidas')
+        cls.producto = Producto.objects.create(
+            nombre='Agua', tipo=cls.tipo, cantidad=cls.STOCK, valor=10, umbral_alerta=cls.UMBRAL
+        )
+        cls.cliente = Cliente.objects.create(nombre_completo='Ana', direccion='Calle 1')
+        cls.chofer = Chofer.objects.create(nombre_completo='Juan', telefono='1', vehiculo='Moto')
+
+    def iniciar_sesion_chofer(self, chofer=None):
+        """Login del usuario con `chofer` (por defecto el de la clase) elegido en el panel."""
+        self.client.force_login(self.usuario)
+        sesion = self.client.session
+        sesion['chofer_id'] = (chofer or self.chofer).id
+        sesion.save()
+
+
+class PlanesDeConsultaTests(DatosBase):
+    """
+    La consulta principal de cada listado tiene que resolverse con un índice
+    (SEARCH/SCAN ... USING INDEX) y no recorriendo la tabla entera.
+    Se captura el SQL que ejecuta la vista y se le pide EXPLAIN QUERY PLAN.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for indice in range(3):
+            venta = registrar_venta(cls.cliente, [(cls.producto.id, 1)], cls.usuario)
+            Envio.objects.create(
+                venta=venta, chofer=cls.chofer, fecha_envio=timezone.localdate(),
+                hora_estimada=time(9 + indice), direccion_entrega='Calle 1',
+            )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def consultas(self, url, tabla, **parametros):
+        """SQL de las consultas de la vista que leen `tabla`."""
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.client.get(url, parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        sql = [q['sql'] for q in capturadas if f'FROM "{tabla}"' in q['sql']]
+        self.assertTrue(sql, f'La vista no consultó {tabla}')
+        return sql
+
+    def assertUsaIndice(self, sql, tabla):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [fila[-1] for fila in cursor.fetchall()]
+        pasos = [paso for paso in plan if re.match(rf'(SCAN|SEARCH) {tabla}\b', paso)]
+        self.assertTrue(pasos, f'{tabla} no aparece en el plan: {plan}')
+        for paso in pasos:
+            self.assertIn('USING', paso, f'Recorre {tabla} completa: {plan}\n{sql}')
+
+    def assertListadoUsaIndices(self, url, tabla, **parametros):
+        for sql in self.consultas(url, tabla, **parametros):
+            with self.subTest(parametros=parametros, sql=sql):
+                self.assertUsaIndice(sql, tabla)
+
+    def test_lista_ventas(self):
+        url = reverse('lista_ventas')
+        hoy = timezone.localdate().isoformat()
+        self.assertListadoUsaIndices(url, 'stock_ventas')
+        self.assertListadoUsaIndices(url, 'stock_ventas', estado='pendiente')
+        self.assertListadoUsaIndices(url, 'stock_ventas', estado='pendiente', desde=hoy, hasta=hoy)
+        self.assertListadoUsaIndices(url, 'stock_ventas', desde=hoy)
+        self.assertListadoUsaIndices(url, 'stock_ventas', cliente=self.cliente.id)
+
+    def test_consultar_ventas(self):
+        url = reverse('consultar_ventas')
+        hoy = timezone.localdate().isoformat()
+        self.assertListadoUsaIndices(url, 'stock_ventas', desde=hoy, hasta=hoy)
+        self.assertListadoUsaIndices(url, 'stock_ventas', cliente=self.cliente.id)
+
+    def test_lista_envios(self):
+        url = reverse('lista_envios')
+        hoy = timezone.localdate().isoformat()
+        self.assertListadoUsaIndices(url, 'stock_envio')
+        self.assertListadoUsaIndices(url, 'stock_envio', fecha=hoy, estado='pendiente')
+        self.assertListadoUsaIndices(url, 'stock_envio', desde=hoy, hasta=hoy)
+
+    def test_chofer_historial(self):
+        self.iniciar_sesion_chofer()
+        url = reverse('chofer_historial')
+        hoy = timezone.localdate().isoformat()
+        self.assertListadoUsaIndices(url, 'stock_envio')
+        self.assertListadoUsaIndices(url, 'stock_envio', estado='entregado', desde=hoy, hasta=hoy)
+
+    def test_asignar_envios_pendientes(self):
+        url = reverse('asignar_envios_pendientes')
+        self.assertListadoUsaIndices(url, 'stock_ventas')
+        self.assertListadoUsaIndices(url, 'stock_ventas', fecha=timezone.localdate().isoformat())
+
+    def test_historial_de_estados(self):
+        envio = Envio.objects.first()
+        self.assertListadoUsaIndices(reverse('detalle_venta', args=[envio.venta_id]), 'stock_eventoestado')
+        self.assertListadoUsaIndices(reverse('detalle_envio', args=[envio.id]), 'stock_eventoestado')
+
+
+class PanelChoferTests(DatosBase):
+    """El panel del chofer hace siempre la misma cantidad de consultas."""
+
+    STOCK = 1000
+
+    # sesión + usuario + chofer + ventas + envíos + contadores
+    CONSULTAS_PANEL = 6
+
+    def setUp(self):
+        self.iniciar_sesion_chofer()
+
+    def cargar_trabajo(self, cantidad):
+        """`cantidad` ventas de cada tipo que muestra el panel."""
+        hoy = timezone.localdate()
+        for indice in range(cantidad):
+            for estado_venta, estado_envio in (
+                ('confirmada', None), ('enviada', None),
+                ('enviada', 'pendiente'), ('enviada', 'en_camino'), ('entregada', 'entregado'),
+            ):
+                venta = registrar_venta(self.cliente, [(self.producto.id, 1)], self.usuario)
+                venta.chofer = self.chofer
+                venta.estado = estado_venta
+                venta.save()
+                if estado_envio:
+                    Envio.objects.create(
+                        venta=venta, chofer=self.chofer, fecha_envio=hoy, estado=estado_envio,
+                        hora_estimada=time(8 + indice % 12), direccion_entrega='Calle 1',
+                    )
+
+    def test_presupuesto_de_consultas(self):
+        for cantidad in (0, 1, 20):
+            with self.subTest(cantidad=cantidad):
+                self.cargar_trabajo(cantidad)
+                with self.assertNumQueries(self.CONSULTAS_PANEL):
+                    respuesta = self.client.get(reverse('panel_chofer'))
+                self.assertEqual(respuesta.status_code, 200)
+
+    def test_reparto_por_estado(self):
+        self.cargar_trabajo(2)
+        contexto = self.client.get(reverse('panel_chofer')).context
+        self.assertEqual(len(contexto['pendientes']), 2)
+        self.assertEqual(len(contexto['en_camino']), 2)
+        self.assertEqual(len(contexto['ventas_enviadas_sin_envio']), 2)
+        self.assertEqual(contexto['total_ventas_enviadas'], 6)
+        self.assertEqual(contexto['total_ventas_confirmadas'], 2)
+        self.assertEqual(contexto['total_activas'], 6)
+        self.assertEqual(contexto['entregados_hoy'], 2)
+
+
+class HistorialEstadosTests(DatosBase):
+    """Cambios de estado y notas son filas de EventoEstado, no texto agregado a `notas`."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.venta = registrar_venta(cls.cliente, [(cls.producto.id, 1)], cls.usuario)
+        cls.venta.estado = 'enviada'
+        cls.venta.save()
+        cls.envio = Envio.objects.create(
+            venta=cls.venta, chofer=cls.chofer, fecha_envio=timezone.localdate(),
+            hora_estimada=time(9), direccion_entrega='Calle 1', notas='Tocar timbre',
+        )
+
+    def test_cambio_con_nota_es_un_evento(self):
+        cambiar_estado_envio(self.envio, 'en_camino', 'Salgo ahora', chofer=self.chofer)
+        evento = EventoEstado.objects.get(envio=self.envio)
+        self.assertEqual((evento.estado_anterior, evento.estado_nuevo), ('pendiente', 'en_camino'))
+        self.assertEqual((evento.nota, evento.chofer), ('Salgo ahora', self.chofer))
+        self.envio.refresh_from_db()
+        self.assertEqual(self.envio.notas, 'Tocar timbre')
+
+    def test_entrega_cierra_la_venta_en_su_historial(self):
+        cambiar_estado_envio(self.envio, 'entregado', usuario=self.usuario)
+        with self.assertNumQueries(1):
+            cambios = [(e.tipo, e.estado_anterior, e.estado_nuevo) for e in historial(self.venta)]
+        self.assertEqual(cambios, [
+            ('venta', '', 'pendiente'),
+            ('envio', 'pendiente', 'entregado'),
+            ('venta', 'enviada', 'entregada'),
+        ])
+
+
+class PerfilSQLiteTests(TransactionTestCase):
+    """Perfil de producción: PRAGMAs por conexión, BEGIN IMMEDIATE y reintentos."""
+
+    def test_pragmas_y_begin_immediate(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+        with CaptureQueriesContext(connection) as consultas:
+            with transaction.atomic():
+                Producto.objects.count()
+        self.assertEqual(consultas[0]['sql'], 'BEGIN IMMEDIATE')
+
+    @override_settings(ESCRITURA_ESPERA_INICIAL=0)
+    def test_reintenta_si_la_base_esta_ocupada(self):
+        intentos = []
+
+        @reintentar_si_ocupada
+        def vista(request):
+            intentos.append(connection.in_atomic_block)
+            if len(intentos) < 3:
+                raise OperationalError('database is locked')
+            return HttpResponse('ok')
+
+        self.assertEqual(vista(RequestFactory().post('/')).content, b'ok')
+        self.assertEqual(intentos, [True, True, True])
+
+        with override_settings(ESCRITURA_REINTENTOS=1), self.assertRaises(OperationalError):
+            intentos.clear()
+            vista(RequestFactory().post('/'))
+        self.assertEqual(len(intentos), 2)
+
+
+class RouterReportesTests(SimpleTestCase):
+    """Dentro de un reporte se leen los modelos de stock de 'reporting'; se escribe siempre en default."""
+
+    @override_settings(REPORTES_MODO='solo_lectura')
+    @mock.patch.object(reportes, 'alias', return_value=reportes.ALIAS)
+    def test_lecturas_del_reporte(self, _alias):
+        bases = {}
+
+        @reportes.reporte
+        def vista(request):
+            bases.update(producto=Producto.objects.db, usuario=User.objects.db,
+                         escritura=reportes.RouterReportes().db_for_write(Producto))
+            return HttpResponse()
+
+        vista(RequestFactory().get('/'))
+        self.assertEqual(bases, {'producto': 'reporting', 'usuario': 'default', 'escritura': 'default'})
+        self.assertEqual(Producto.objects.db, 'default')
+
+    def test_en_tests_reporting_es_espejo_de_default(self):
+        self.assertEqual(reportes.alias(), 'default')
+
+
+class PaginacionCursorTests(DatosBase):
+    """Recorrer un listado por cursor devuelve todas las filas una vez, aunque la clave de orden tenga NULL."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for indice in range(7):
+            venta = registrar_venta(cls.cliente, [(cls.producto.id, 1)], cls.usuario)
+            if indice % 2:
+                # Dos ventas por fecha: el desempate es el id
+                Ventas.objects.filter(id=venta.id).update(
+                    fecha_envio=timezone.now() - timedelta(days=indice // 4)
+                )
+
+    def recorrer(self, orden):
+        """Ids en el orden en que salen yendo hacia adelante y después hacia atrás."""
+        adelante, atras, cursor = [], [], ''
+        while True:
+            pagina = paginar(RequestFactory().get('/', {'cursor': cursor}), Ventas.objects.all(), orden, por_pagina=2)
+            adelante += [venta.id for venta in pagina]
+            if not pagina.tiene_siguiente:
+                break
+            cursor = pagina.cursor_siguiente
+        while True:
+            atras = [venta.id for venta in pagina] + atras
+            if not pagina.tiene_anterior:
+                break
+            pagina = paginar(
+                RequestFactory().get('/', {'cursor': pagina.cursor_anterior}), Ventas.objects.all(), orden, por_pagina=2
+            )
+        return adelante, atras
+
+    def test_clave_con_nulos(self):
+        for orden in (['-fecha_envio', '-id'], ['fecha_envio', 'id'], ['fecha_envio', '-id']):
+            with self.subTest(orden=orden):
+                esperado = list(Ventas.objects.order_by(*orden).values_list('id', flat=True))
+                adelante, atras = self.recorrer(orden)
+                self.assertEqual(adelante, esperado)
+                self.assertEqual(atras, esperado)
+
+
+class StockAtomicoTests(DatosBase):
+    """El stock se descuenta con un UPDATE condicional: nunca queda negativo y cada salida queda en el ledger."""
+
+    STOCK = 5
+    UMBRAL = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.venta = registrar_venta(cls.cliente, [(cls.producto.id, 3)], cls.usuario)
+        cambiar_estado_venta(cls.venta, 'confirmada')
+
+    def despachar(self):
+        return despachar_venta(
+            self.venta, chofer=self.chofer, fecha_envio=timezone.localdate(),
+            hora_estimada=time(9), usuario=self.usuario,
+        )
+
+    def test_despacho_descuenta_y_registra_la_salida(self):
+        envio = self.despachar()
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.cantidad, self.producto.en_alerta), (2, True))
+        salida = StockMovimiento.objects.get(tipo='salida')
+        self.assertEqual((salida.producto, salida.cantidad, salida.envio), (self.producto, -3, envio))
+
+    def test_sin_stock_no_vende_de_mas(self):
+        # Otro request se llevó el stock después de confirmar
+        Producto.objects.filter(id=self.producto.id).update(cantidad=2)
+        with self.assertRaises(StockInsuficiente):
+            self.despachar()
+        self.venta.refresh_from_db()
+        self.producto.refresh_from_db()
+        self.assertEqual((self.venta.estado, self.producto.cantidad), ('confirmada', 2))
+        self.assertFalse(Envio.objects.exists())
+        self.assertFalse(StockMovimiento.objects.filter(tipo='salida').exists())
+
+    def test_ajuste_manual_nunca_deja_negativo(self):
+        with self.assertRaises(StockInsuficiente):
+            restar_stock(self.producto, 6, usuario=self.usuario)
+        restar_stock(self.producto, 5, usuario=self.usuario)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.cantidad, 0)
+        self.assertEqual(
+            list(StockMovimiento.objects.filter(tipo='ajuste').values_list('cantidad', flat=True)), [-5]
+        )
+
+
+class IdempotenciaTests(DatosBase):
+    """Un POST reenviado con la misma clave no se ejecuta dos veces."""
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def crear_por_api(self, clave):
+        return self.client.post(
+            reverse('api_crear_venta'),
+            json.dumps({'cliente': self.cliente.id, 'lineas': [{'producto': self.producto.id, 'cantidad': 2}]}),
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY=clave,
+        )
+
+    def test_reintento_por_api_devuelve_la_misma_venta(self):
+        primera = self.crear_por_api('pedido-1')
+        segunda = self.crear_por_api('pedido-1')
+        self.assertEqual((primera.status_code, segunda.status_code), (201, 201))
+        self.assertEqual(segunda.json(), primera.json())
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', primera)
+        self.assertEqual(Ventas.objects.count(), 1)
+
+        self.assertEqual(self.crear_por_api('pedido-2').status_code, 201)
+        self.assertEqual(Ventas.objects.count(), 2)
+
+    def test_reenvio_del_formulario(self):
+        datos = {
+            'cliente': self.cliente.id, 'productos': [self.producto.id], 'cantidades': [1],
+            idempotencia.CAMPO_FORM: 'formulario-1',
+        }
+        for _ in range(2):
+            respuesta = self.client.post(reverse('crear_venta'), datos)
+            self.assertEqual((respuesta.status_code, respuesta['Location']), (302, reverse('lista_ventas')))
+        self.assertEqual(Ventas.objects.count(), 1)
+
+    def test_clave_en_proceso_es_conflicto(self):
+        request = RequestFactory().post(reverse('api_crear_venta'))
+        request.user = self.usuario
+        ClaveIdempotencia.objects.create(
+            clave=idempotencia._firmar(request, 'pedido-1'), usuario=self.usuario
+        )
+        self.assertEqual(self.crear_por_api('pedido-1').status_code, 409)
+        self.assertFalse(Ventas.objects.exists())
+
+
+class ResumenesVentasTests(DatosBase):
+    """Los resúmenes diarios suman la venta al despacharla y la restan cuando deja de contar."""
+
+    def assertTotales(self, ventas, unidades, recaudado):
+        esperado = {'ventas': ventas, 'unidades': unidades, 'recaudado': Decimal(recaudado)}
+        self.assertEqual(resumenes.totales(cliente_id=self.cliente.id), esperado)
+        self.assertEqual(resumenes.totales(producto_id=self.producto.id), esperado)
+
+    def test_alta_despacho_y_cambios_de_estado(self):
+        venta = registrar_venta(self.cliente, [(self.producto.id, 3)], self.usuario)
+        cambiar_estado_venta(venta, 'confirmada')
+        self.assertTotales(0, 0, 0)
+
+        despachar_venta(venta, chofer=self.chofer, fecha_envio=timezone.localdate(), hora_estimada=time(9))
+        self.assertTotales(1, 3, 30)
+        # Sigue contando: no se suma de nuevo
+        cambiar_estado_venta(venta, 'entregada')
+        self.assertTotales(1, 3, 30)
+        cambiar_estado_venta(venta, 'cancelada')
+        self.assertTotales(0, 0, 0)
+        cambiar_estado_venta(venta, 'entregada')
+        self.assertTotales(1, 3, 30)
+
+    def test_coincide_con_reconstruir(self):
+        for cantidad in (1, 2, 4):
+            venta = registrar_venta(self.cliente, [(self.producto.id, cantidad)], self.usuario)
+            cambiar_estado_venta(venta, 'confirmada')
+            despachar_venta(venta, chofer=self.chofer, fecha_envio=timezone.localdate(), hora_estimada=time(9))
+        cambiar_estado_venta(venta, 'cancelada')
+        incremental = resumenes.totales(cliente_id=self.cliente.id)
+        resumenes.reconstruir()
+        self.assertEqual(resumenes.totales(cliente_id=self.cliente.id), incremental)
+        self.assertTotales(2, 3, 30)
+
+
+class ReservasStockTests(DatosBase):
+    """Confirmar reserva stock (baja `disponible`, no `cantidad`); cancelar lo libera y despachar lo consume."""
+
+    STOCK = 10
+
+    def venta(self, cantidad):
+        return registrar_venta(self.cliente, [(self.producto.id, cantidad)], self.usuario)
+
+    def assertStock(self, cantidad, reservado, disponible):
+        self.producto.refresh_from_db()
+        self.assertEqual(
+            (self.producto.cantidad, self.producto.reservado, self.producto.disponible),
+            (cantidad, reservado, disponible),
+        )
+
+    def test_confirmar_y_cancelar(self):
+        venta = self.venta(6)
+        self.assertStock(10, 0, 10)
+        cambiar_estado_venta(venta, 'confirmada')
+        self.assertStock(10, 6, 4)
+
+        # Lo reservado no se vuelve a prometer
+        otra = self.venta(5)
+        with self.assertRaises(StockInsuficiente):
+            cambiar_estado_venta(otra, 'confirmada')
+        otra.refresh_from_db()
+        self.assertEqual(otra.estado, 'pendiente')
+        self.assertStock(10, 6, 4)
+
+        cambiar_estado_venta(venta, 'cancelada')
+        self.assertStock(10, 0, 10)
+
+    def test_despachar_consume_la_reserva(self):
+        venta = self.venta(6)
+        cambiar_estado_venta(venta, 'confirmada')
+        despachar_venta(venta, chofer=self.chofer, fecha_envio=timezone.localdate(), hora_estimada=time(9))
+        self.assertStock(4, 0, 4)
+
+    def test_confirmacion_masiva(self):
+        ventas = [self.venta(cantidad) for cantidad in (4, 7, 3)]
+        resultados = cambiar_estado_ventas([venta.id for venta in ventas], 'confirmada', self.usuario)
+        # Por orden de alta: la segunda ya no entra en lo que quedó
+        self.assertEqual([resultados[venta.id][0] for venta in ventas], [True, False, True])
+        self.assertStock(10, 7, 3)
+
+        resultados = cambiar_estado_ventas([ventas[0].id], 'pendiente', self.usuario)
+        self.assertEqual(resultados[ventas[0].id], (True, ''))
+        self.assertStock(10, 3, 7)
+
+    def test_editar_no_pisa_stock_ni_reserva(self):
+        # El formulario de edición leyó el producto antes de la venta y el ajuste
+        formulario = Producto.objects.get(id=self.producto.id)
+        cambiar_estado_venta(self.venta(2), 'confirmada')
+        restar_stock(self.producto, 6, usuario=self.usuario)
+
+        formulario.nombre = 'Agua mineral'
+        formulario.umbral_alerta = 3
+        formulario.save()
+        self.assertStock(4, 2, 2)
+        self.assertEqual((self.producto.nombre, self.producto.en_alerta), ('Agua mineral', False))
+
+
+class SincronizacionChoferTests(DatosBase):
+    """
+    La app del chofer sube sus cambios con el cursor con el que vio los datos:
+    si el registro cambió en el servidor después, gana el servidor.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        venta = registrar_venta(cls.cliente, [(cls.producto.id, 1)], cls.usuario)
+        cambiar_estado_venta(venta, 'confirmada')
+        cls.envio = despachar_venta(
+            venta, chofer=cls.chofer, fecha_envio=timezone.localdate(), hora_estimada=time(9)
+        )
+
+    def setUp(self):
+        self.iniciar_sesion_chofer()
+
+    def subir(self, cursor, estado, nota=''):
+        respuesta = self.client.post(reverse('api_sincronizar_chofer'), json.dumps({
+            'cursor': cursor,
+            'operaciones': [{'id': 'op-1', 'tipo': 'envio', 'objeto': self.envio.id, 'estado': estado, 'nota': nota}],
+        }), content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()['resultados'][0]
+
+    def test_cambio_sin_conflicto(self):
+        cursor = self.client.get(reverse('api_sincronizar_chofer')).json()['cursor']
+        self.assertEqual(self.subir(cursor, 'en_camino')['resultado'], 'aplicada')
+        self.envio.refresh_from_db()
+        self.assertEqual(self.envio.estado, 'en_camino')
+
+    def test_gana_el_servidor(self):
+        cursor = self.client.get(reverse('api_sincronizar_chofer')).json()['cursor']
+        # En la oficina lo pasan a en camino: entregado seguiría siendo un paso válido
+        cambiar_estado_envio(Envio.objects.get(id=self.envio.id), 'en_camino', usuario=self.usuario)
+
+        resultado = self.subir(cursor, 'entregado', 'Entregado en portería')
+        self.assertEqual(resultado['resultado'], 'conflicto')
+        self.envio.refresh_from_db()
+        self.assertEqual(self.envio.estado, 'en_camino')
+        # La nota se guarda igual, sin cambiar el estado
+        evento = EventoEstado.objects.filter(envio=self.envio).latest('id')
+        self.assertEqual(
+            (evento.estado_anterior, evento.estado_nuevo, evento.nota),
+            ('en_camino', 'en_camino', 'Entregado en portería'),
+        )
+
+    def test_transicion_no_permitida(self):
+        cambiar_estado_envio(self.envio, 'entregado')
+        cursor = self.client.get(reverse('api_sincronizar_chofer')).json()['cursor']
+        self.assertEqual(self.subir(cursor, 'pendiente')['resultado'], 'rechazada')
+        self.envio.refresh_from_db()
+        self.assertEqual(self.envio.estado, 'entregado')
+
+    def test_solo_el_chofer_de_la_sesion(self):
+        sesion = self.client.session
+        del sesion['chofer_id']
+        sesion.save()
+        respuesta = self.client.get(reverse('api_sincronizar_chofer'), {'chofer_id': self.chofer.id})
+        self.assertEqual(respuesta.status_code, 403)
+
+
+class EstadisticasChoferTests(DatosBase):
+    """Cerrar un envío suma en la fila semanal de su chofer; reabrirlo o cambiarle el chofer la corrige."""
+
+    LUNES = date(2026, 10, 12)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.juan = cls.chofer
+        cls.pedro = Chofer.objects.create(nombre_completo='Pedro', telefono='2', vehiculo='Auto')
+        cls.ventas = [registrar_venta(cls.cliente, [(cls.producto.id, 1)], cls.usuario) for _ in range(2)]
+
+    def entregar(self, venta, dia, minutos_tarde):
+        envio = Envio.objects.create(
+            venta=venta, chofer=self.juan, fecha_envio=dia,
+            hora_estimada=time(9), direccion_entrega='Calle 1',
+        )
+        envio.hora_real_entrega = timezone.make_aware(datetime.combine(dia, time(9))) + timedelta(
+            minutes=minutos_tarde
+        )
+        envio.estado = 'entregado'
+        envio.save()
+        return envio
+
+    def semana(self, chofer):
+        fila = ResumenChoferSemana.objects.filter(chofer=chofer, semana=self.LUNES).first()
+        if fila is None:
+            return None
+        return fila.entregados, fila.a_tiempo, fila.minutos_demora, fila.cancelados, fila.dias
+
+    def test_entregas_a_tiempo_y_tarde(self):
+        self.entregar(self.ventas[0], self.LUNES, 5)
+        self.entregar(self.ventas[1], self.LUNES + timedelta(days=2), 40)
+        # Días con entregas: lunes (bit 0) y miércoles (bit 2)
+        self.assertEqual(self.semana(self.juan), (2, 1, 40, 0, 0b101))
+
+    def test_reabrir_resta(self):
+        self.entregar(self.ventas[0], self.LUNES, 5)
+        envio = self.entregar(self.ventas[1], self.LUNES, 40)
+        envio.estado = 'en_camino'
+        envio.save()
+        # Queda la otra entrega del lunes: el día sigue marcado
+        self.assertEqual(self.semana(self.juan), (1, 1, 0, 0, 0b1))
+
+        envio.estado = 'cancelado'
+        envio.save()
+        self.assertEqual(self.semana(self.juan), (1, 1, 0, 1, 0b1))
+
+    def test_cambio_de_chofer(self):
+        envio = self.entregar(self.ventas[0], self.LUNES, 40)
+        envio.chofer = self.pedro
+        envio.save()
+        self.assertEqual(self.semana(self.juan), (0, 0, 0, 0, 0))
+        self.assertEqual(self.semana(self.pedro), (1, 0, 40, 0, 0b1))
+
+
+class AsignacionAutomaticaTests(DatosBase):
+    """Reparto automático de las ventas sin chofer de un día (stock.asignacion)."""
+
+    STOCK = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.pedro = Chofer.objects.create(nombre_completo='Pedro', telefono='2', vehiculo='Auto')
+        cls.inactivo = Chofer.objects.create(nombre_completo='Zoe', telefono='3', vehiculo='Moto', activo=False)
+        cls.hoy = timezone.localdate()
+
+    def venta(self, cantidad=1, **campos):
+        venta = registrar_venta(self.cliente, [(self.producto.id, cantidad)], self.usuario)
+        if campos:
+            Ventas.objects.filter(id=venta.id).update(**campos)
+            venta.refresh_from_db()
+        return venta
+
+    def test_reparte_parejo_y_respeta_capacidad(self):
+        for _ in range(4):
+            self.venta()
+        plan = asignacion.planificar(self.hoy)
+        self.assertEqual(sorted(len(carga.nuevas) for carga in plan['cargas']), [2, 2])
+        self.assertNotIn(self.inactivo.id, plan['asignaciones'].values())
+
+        Chofer.objects.filter(id=self.pedro.id).update(capacidad_paradas=1)
+        Chofer.objects.filter(id=self.chofer.id).update(capacidad_paradas=2)
+        plan = asignacion.planificar(self.hoy)
+        por_chofer = {carga.chofer.id: len(carga.nuevas) for carga in plan['cargas']}
+        self.assertEqual(por_chofer, {self.chofer.id: 2, self.pedro.id: 1})
+        self.assertEqual(len(plan['sin_asignar']), 1)
+
+    def test_no_usa_choferes_inactivos_ni_pisa_asignadas(self):
+        libre = self.venta()
+        tomada = self.venta(chofer=self.pedro)
+        asignadas = asignacion.aplicar(self.hoy, {libre.id: self.inactivo.id, tomada.id: self.chofer.id})
+        self.assertEqual(asignadas, 0)
+        libre.refresh_from_db()
+        tomada.refresh_from_db()
+        self.assertIsNone(libre.chofer_id)
+        self.assertEqual(tomada.chofer_id, self.pedro.id)
+
+    def test_confirma_las_pendientes_reservando_stock(self):
+        venta = self.venta(4)
+        self.assertEqual(asignacion.aplicar(self.hoy, {venta.id: self.chofer.id}, self.usuario), 1)
+        venta.refresh_from_db()
+        self.producto.refresh_from_db()
+        self.assertEqual(
+            (venta.estado, venta.chofer_id, venta.fecha_envio_programada), ('confirmada', self.chofer.id, self.hoy)
+        )
+        self.assertEqual((self.producto.reservado, self.producto.disponible), (4, 6))
+
+    def test_sin_stock_queda_como_estaba(self):
+        alcanza = self.venta(6)
+        sin_fecha = self.venta(6)
+        con_fecha = self.venta(6, fecha_envio_programada=self.hoy)
+        asignadas = asignacion.aplicar(
+            self.hoy, {alcanza.id: self.chofer.id, sin_fecha.id: self.chofer.id, con_fecha.id: self.pedro.id}
+        )
+        self.assertEqual(asignadas, 1)
+        estados = {
+            venta.id: (venta.estado, venta.chofer_id, venta.fecha_envio_programada)
+            for venta in Ventas.objects.all()
+        }
+        self.assertEqual(estados, {
+            alcanza.id: ('confirmada', self.chofer.id, self.hoy),
+            sin_fecha.id: ('pendiente', None, None),
+            con_fecha.id: ('pendiente', None, self.hoy),
+        })
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.reservado, 6)
+
+
+class DespachoEnLoteTests(DatosBase):
+    """
+    despachar_ventas reparte el stock entre las ventas por antigüedad con la
+    demanda sumada por producto, y crea todo o nada.
+    """
+
+    STOCK = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.yerba = Producto.objects.create(
+            nombre='Yerba', tipo=cls.tipo, cantidad=10, valor=20, umbral_alerta=5
+        )
+
+    def confirmada(self, *lineas):
+        venta = registrar_venta(self.cliente, list(lineas), self.usuario)
+        cambiar_estado_venta(venta, 'confirmada')
+        return venta
+
+    def despachar(self, ventas):
+        return despachar_ventas(
+            [venta.id for venta in ventas], chofer=self.chofer,
+            fecha_envio=timezone.localdate(), hora_estimada=time(9), usuario=self.usuario,
+        )
+
+    def stock(self, producto):
+        producto.refresh_from_db()
+        return producto.cantidad, producto.reservado, producto.disponible
+
+    def test_demanda_sumada_por_producto(self):
+        ventas = [self.confirmada((self.producto.id, 3)) for _ in range(3)]
+        # Se rompieron 5 después de confirmar: alcanza para una sola de 3
+        Producto.objects.filter(id=self.producto.id).update(cantidad=5)
+        resultado = self.despachar(ventas)
+        self.assertEqual(resultado['despachadas'], [ventas[0].id])
+        self.assertEqual(set(resultado['sin_stock']), {ventas[1].id, ventas[2].id})
+        self.assertEqual(resultado['sin_stock'][ventas[1].id][0]['hay'], 2)
+        self.assertEqual(self.stock(self.producto), (2, 6, -4))
+        self.assertEqual(
+            list(Ventas.objects.order_by('id').values_list('estado', flat=True)),
+            ['enviada', 'confirmada', 'confirmada'],
+        )
+        self.assertEqual(Envio.objects.get().venta_id, ventas[0].id)
+
+    def test_rechazadas_no_se_tocan(self):
+        pendiente = registrar_venta(self.cliente, [(self.producto.id, 1)], self.usuario)
+        venta = self.confirmada((self.producto.id, 2))
+        resultado = self.despachar([pendiente, venta])
+        self.assertEqual(resultado['despachadas'], [venta.id])
+        self.assertEqual(list(resultado['rechazadas']), [pendiente.id])
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.estado, 'pendiente')
+        self.assertFalse(Envio.objects.filter(venta=pendiente).exists())
+
+    def test_si_falla_un_envio_no_queda_nada(self):
+        ventas = [self.confirmada((self.producto.id, 2), (self.yerba.id, 1)) for _ in range(2)]
+        with mock.patch.object(Envio.objects, 'bulk_create', side_effect=IntegrityError('envío duplicado')):
+            with self.assertRaises(IntegrityError):
+                self.despachar(ventas)
+        self.assertEqual(set(Ventas.objects.values_list('estado', flat=True)), {'confirmada'})
+        self.assertEqual(self.stock(self.producto), (10, 4, 6))
+        self.assertEqual(self.stock(self.yerba), (10, 2, 8))
+        self.assertFalse(StockMovimiento.objects.filter(tipo='salida').exists())
+
+    def test_ledger_y_reservas_por_venta(self):
+        primera = self.confirmada((self.producto.id, 2), (self.yerba.id, 1))
+        segunda = self.confirmada((self.producto.id, 3))
+        self.assertEqual(len(self.despachar([primera, segunda])['despachadas']), 2)
+        salidas = set(StockMovimiento.objects.filter(tipo='salida').values_list(
+            'venta_id', 'producto_id', 'cantidad', 'envio__venta_id'
+        ))
+        self.assertEqual(salidas, {
+            (primera.id, self.producto.id, -2, primera.id),
+            (primera.id, self.yerba.id, -1, primera.id),
+            (segunda.id, self.producto.id, -3, segunda.id),
+        })
+        self.assertEqual(self.stock(self.producto), (5, 0, 5))
+        self.assertEqual(self.stock(self.yerba), (9, 0, 9))
+
+    def test_vista_json(self):
+        venta = self.confirmada((self.producto.id, 2))
+        self.client.force_login(self.usuario)
+        respuesta = self.client.post(reverse('despachar_ventas_lote'), {
+            'ventas': [venta.id, 999], 'chofer': self.chofer.id,
+            'fecha_envio': timezone.localdate().isoformat(), 'hora_estimada': '09:00',
+        }, HTTP_ACCEPT='application/json')
+        self.assertEqual(respuesta.json(), {
+            'despachadas': [venta.id], 'sin_stock': {}, 'rechazadas': {'999': 'No está confirmada o ya tiene envío'},
+        })
+
+
+class BusquedaProductosTests(DatosBase):
+    """Índice FTS5 de productos: triggers, acentos, prefijos y texto del usuario."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.almacen = TipoProducto.objects.create(nombre='Almacén')
+        cls.cafe = Producto.objects.create(nombre='Café Molido', tipo=cls.almacen, cantidad=10, valor=10)
+        cls.azucar = Producto.objects.create(nombre='Azúcar Ledesma', tipo=cls.almacen, cantidad=10, valor=10)
+
+    def buscar(self, texto):
+        return set(buscar_productos(Producto.objects.all(), texto).values_list('nombre', flat=True))
+
+    def filas_indice(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid, nombre, tipo FROM {TABLA_FTS} ORDER BY rowid')
+            return cursor.fetchall()
+
+    def test_triggers_sobreviven_a_las_migraciones(self):
+        # Una migración que reconstruye stock_producto sin SUSPENDER/RESTAURAR_TRIGGERS los borra
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%fts%'")
+            triggers = {fila[0] for fila in cursor.fetchall()}
+        self.assertEqual(triggers, {
+            'stock_producto_fts_ai', 'stock_producto_fts_au', 'stock_producto_fts_ad', 'stock_tipoproducto_fts_au',
+        })
+
+    def test_triggers_mantienen_el_indice(self):
+        self.assertEqual(self.buscar('molido'), {'Café Molido'})
+        Producto.objects.filter(id=self.cafe.id).update(nombre='Café Torrado')
+        self.assertEqual(self.buscar('molido'), set())
+        self.assertEqual(self.buscar('torrado'), {'Café Torrado'})
+
+        TipoProducto.objects.filter(id=self.almacen.id).update(nombre='Despensa')
+        self.assertEqual(self.buscar('despensa'), {'Café Torrado', 'Azúcar Ledesma'})
+
+        Producto.objects.filter(id=self.azucar.id).delete()
+        self.assertEqual(
+            self.filas_indice(),
+            [(self.producto.id, 'Agua', 'Bebidas'), (self.cafe.id, 'Café Torrado', 'Despensa')],
+        )
+
+    def test_sin_acentos_y_por_prefijo(self):
+        for texto in ('cafe', 'CAFÉ', 'caf', 'mol', 'azucar led', 'alma'):
+            with self.subTest(texto=texto):
+                self.assertTrue(self.buscar(texto))
+        self.assertEqual(self.buscar('caf mol'), {'Café Molido'})
+        self.assertEqual(self.buscar('cafe azucar'), set())
+
+    def test_texto_del_usuario_no_es_sintaxis_fts(self):
+        self.assertEqual(expresion_fts('café" OR mol*'), '"café"* "OR"* "mol"*')
+        for texto in ('"caf', 'caf*', '(caf', 'mol -', 'caf:', '^caf', 'caf)"'):
+            with self.subTest(texto=texto):
+                self.assertEqual(self.buscar(texto), {'Café Molido'})
+        # OR es una palabra más, no el operador: no trae las dos
+        self.assertEqual(self.buscar('cafe OR azucar'), set())
+        # Sin palabras no filtra
+        self.assertEqual(len(self.buscar('"()*')), 3)
+
+    def test_comando_reconstruye_el_indice(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLA_FTS}')
+        self.assertEqual(self.buscar('cafe'), set())
+        call_command('reconstruir_busqueda', stdout=mock.Mock())
+        self.assertEqual(len(self.filas_indice()), 3)
+        self.assertEqual(self.buscar('cafe'), {'Café Molido'})
+
+
+class CambioEstadoMasivoTests(DatosBase):
+    """
+    cambiar_estado_ventas valida cada venta por separado: las válidas pasan
+    juntas, las demás vuelven con su motivo y no se tocan.
+    """
+
+    STOCK = 10
+
+    def venta(self, cantidad, estado='pendiente'):
+        venta = registrar_venta(self.cliente, [(self.producto.id, cantidad)], self.usuario)
+        if estado != 'pendiente':
+            cambiar_estado_venta(venta, estado)
+        return venta
+
+    def stock(self):
+        self.producto.refresh_from_db()
+        return self.producto.cantidad, self.producto.reservado, self.producto.disponible
+
+    def estados(self, *ventas):
+        return [Ventas.objects.get(id=venta.id).estado for venta in ventas]
+
+    def test_transiciones_mezcladas(self):
+        confirmada = self.venta(3, 'confirmada')
+        cancelada = self.venta(1, 'cancelada')
+        entra, no_entra = self.venta(4), self.venta(7)
+        eventos = EventoEstado.objects.count()
+
+        resultados = cambiar_estado_ventas(
+            [entra.id, no_entra.id, confirmada.id, cancelada.id, 999], 'confirmada', self.usuario
+        )
+        self.assertEqual(set(resultados), {entra.id, no_entra.id, confirmada.id, cancelada.id, 999})
+        self.assertEqual(resultados[entra.id], (True, ''))
+        self.assertFalse(resultados[no_entra.id][0])
+        self.assertIn('Sin stock disponible', resultados[no_entra.id][1])
+        self.assertEqual(resultados[confirmada.id], (False, 'No se puede cambiar de "Confirmada" a "Confirmada"'))
+        self.assertEqual(resultados[cancelada.id], (False, 'No se puede cambiar de "Cancelada" a "Confirmada"'))
+        self.assertEqual(resultados[999], (False, 'No existe'))
+
+        self.assertEqual(
+            self.estados(entra, no_entra, confirmada, cancelada),
+            ['confirmada', 'pendiente', 'confirmada', 'cancelada'],
+        )
+        self.assertEqual(self.stock(), (10, 7, 3))
+        # Un solo evento: el de la venta que cambió
+        nuevos = EventoEstado.objects.order_by('id')[eventos:]
+        self.assertEqual(
+            [(e.tipo, e.venta_id, e.estado_anterior, e.estado_nuevo, e.usuario_id) for e in nuevos],
+            [('venta', entra.id, 'pendiente', 'confirmada', self.usuario.id)],
+        )
+
+    def test_vista_json_cancela_y_libera(self):
+        confirmadas = [self.venta(cantidad, 'confirmada') for cantidad in (2, 3)]
+        pendiente = self.venta(1)
+        entregada = self.venta(1, 'confirmada')
+        despachar_venta(entregada, chofer=self.chofer, fecha_envio=timezone.localdate(), hora_estimada=time(9))
+        self.assertEqual(self.stock(), (9, 5, 4))
+        eventos = EventoEstado.objects.count()
+
+        self.client.force_login(self.usuario)
+        ids = [venta.id for venta in (*confirmadas, pendiente, entregada)]
+        respuesta = self.client.post(
+            reverse('cambiar_estado_ventas_masivo'), {'ventas': ids, 'estado': 'cancelada'},
+            HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json(), {
+            'estado': 'cancelada',
+            'resultados': {
+                str(confirmadas[0].id): {'aceptada': True, 'motivo': ''},
+                str(confirmadas[1].id): {'aceptada': True, 'motivo': ''},
+                str(pendiente.id): {'aceptada': True, 'motivo': ''},
+                str(entregada.id): {'aceptada': False, 'motivo': 'No se puede cambiar de "Enviada" a "Cancelada"'},
+            },
+        })
+        # Sólo las que estaban confirmadas devuelven su reserva
+        self.assertEqual(self.stock(), (9, 0, 9))
+        self.assertEqual(
+            self.estados(*confirmadas, pendiente, entregada),
+            ['cancelada', 'cancelada', 'cancelada', 'enviada'],
+        )
+        self.assertEqual(
+            sorted(EventoEstado.objects.order_by('id')[eventos:].values_list('venta_id', 'estado_anterior', 'estado_nuevo')),
+            sorted([
+                (confirmadas[0].id, 'confirmada', 'cancelada'),
+                (confirmadas[1].id, 'confirmada', 'cancelada'),
+                (pendiente.id, 'pendiente', 'cancelada'),
+            ]),
+        )
+
+    def test_vista_avisa_las_rechazadas(self):
+        pendiente, cancelada = self.venta(2), self.venta(1, 'cancelada')
+        self.client.force_login(self.usuario)
+        respuesta = self.client.post(
+            reverse('cambiar_estado_ventas_masivo'),
+            {'ventas': [pendiente.id, cancelada.id], 'estado': 'confirmada'}, follow=True,
+        )
+        mensajes = [str(mensaje) for mensaje in respuesta.context['messages']]
+        self.assertEqual(len(mensajes), 2)
+        self.assertIn('1 venta(s) pasaron a "Confirmada"', mensajes[0])
+        self.assertIn(f'#{cancelada.id}', mensajes[1])
+        self.assertEqual(self.estados(pendiente, cancelada), ['confirmada', 'cancelada'])
+
+    def test_estado_invalido(self):
+        venta = self.venta(2)
+        self.client.force_login(self.usuario)
+        respuesta = self.client.post(
+            reverse('cambiar_estado_ventas_masivo'), {'ventas': [venta.id], 'estado': 'perdida'},
+            HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self.estados(venta), ['pendiente'])
+
+
+class ExportacionesTests(DatosBase):
+    """CSV y XLSX en streaming: mismas columnas, mismos filtros y consultas fijas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.otro_cliente = Cliente.objects.create(nombre_completo='Beto', direccion='Calle 2')
+        cls.otro_chofer = Chofer.objects.create(nombre_completo='Pedro', telefono='2', vehiculo='Auto')
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def despachada(self, cliente=None, cantidad=2):
+        venta = registrar_venta(cliente or self.cliente, [(self.producto.id, cantidad)], self.usuario)
+        cambiar_estado_venta(venta, 'confirmada')
+        despachar_venta(venta, chofer=self.chofer, fecha_envio=timezone.localdate(), hora_estimada=time(9))
+        return venta
+
+    def descargar(self, nombre, **parametros):
+        respuesta = self.client.get(reverse(nombre), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        return respuesta, b''.join(respuesta.streaming_content)
+
+    def filas_csv(self, nombre, **parametros):
+        respuesta, contenido = self.descargar(nombre, **parametros)
+        self.assertEqual(respuesta['Content-Type'], 'text/csv; charset=utf-8')
+        return list(csv.reader(io.StringIO(contenido.decode('utf-8-sig'))))
+
+    def test_ventas_csv(self):
+        venta = self.despachada()
+        # Estaba programada para Juan, el envío se reasignó y ya salió:
+        # chofer y estado vienen del envío, no de la venta
+        Ventas.objects.filter(id=venta.id).update(chofer=self.chofer)
+        Envio.objects.filter(venta=venta).update(chofer=self.otro_chofer, estado='en_camino')
+        self.despachada(self.otro_cliente)
+
+        filas = self.filas_csv('exportar_ventas', cliente=self.cliente.id)
+        self.assertEqual(filas[0], exportar.COLUMNAS_DETALLE)
+        self.assertEqual(len(filas), 2)
+        fila = dict(zip(filas[0], filas[1]))
+        self.assertEqual(
+            (fila['Venta'], fila['Estado venta'], fila['Cliente'], fila['Producto'], fila['Cantidad']),
+            (str(venta.id), 'enviada', 'Ana', 'Agua', '2'),
+        )
+        self.assertEqual((fila['Chofer'], fila['Estado envío']), ('Pedro', 'en_camino'))
+
+    def test_envios_xlsx(self):
+        venta = self.despachada()
+        otra = self.despachada(self.otro_cliente)
+        Envio.objects.filter(venta=otra).update(chofer=self.otro_chofer)
+
+        respuesta, contenido = self.descargar('exportar_envios', formato='xlsx', chofer=self.chofer.id)
+        self.assertEqual(respuesta['Content-Type'], exportar.FORMATOS['xlsx'][0])
+        self.assertIn('.xlsx"', respuesta['Content-Disposition'])
+        with zipfile.ZipFile(io.BytesIO(contenido)) as archivo:
+            self.assertIn('xl/workbook.xml', archivo.namelist())
+            hoja = archivo.read('xl/worksheets/sheet1.xml').decode()
+        filas = re.findall('<row>.*?</row>', hoja)
+        self.assertEqual(len(filas), 2)
+        self.assertIn('Estado envío', filas[0])
+        self.assertIn(f'<v>{venta.envio.id}</v>', filas[1])
+        self.assertIn('>Juan<', filas[1])
+        self.assertNotIn('Beto', hoja)
+
+    def test_sale_por_tandas(self):
+        for _ in range(5):
+            self.despachada()
+        with mock.patch.object(exportar, 'TAMANIO_TANDA', 2):
+            respuesta = self.client.get(reverse('exportar_ventas'), {'formato': 'xlsx'})
+            partes = [parte for parte in respuesta.streaming_content if parte]
+        self.assertGreater(len(partes), 1)
+
+    def test_consultas_fijas(self):
+        def consultas():
+            with CaptureQueriesContext(connection) as contexto:
+                for nombre in ('exportar_ventas', 'exportar_envios'):
+                    for formato in ('csv', 'xlsx'):
+                        self.descargar(nombre, formato=formato)
+            return len(contexto)
+
+        self.despachada()
+        pocas = consultas()
+        for _ in range(4):
+            self.despachada(self.otro_cliente)
+        self.assertEqual(consultas(), pocas)
+
+
+class CatalogoApiTests(DatosBase):
+    """api_productos: ETag/304, cursor en `Link`, parámetros validados y consultas fijas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.almacen = TipoProducto.objects.create(nombre='Almacén')
+        cls.yerba = Producto.objects.create(nombre='Yerba', tipo=cls.almacen, cantidad=10, valor=20)
+
+    def setUp(self):
+        # El catálogo cacheado es por versión y en los tests on_commit no corre solo
+        cache.clear()
+
+    def pedir(self, **parametros):
+        encabezados = {}
+        if 'etag' in parametros:
+            encabezados['HTTP_IF_NONE_MATCH'] = parametros.pop('etag')
+        return self.client.get(reverse('api_productos'), parametros, **encabezados)
+
+    def test_etag_y_304(self):
+        respuesta = self.pedir()
+        self.assertEqual(respuesta.status_code, 200)
+        etag = respuesta['ETag']
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+
+        respuesta = self.pedir(etag=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta.content, b'')
+
+        # Otros parámetros son otro recurso
+        self.assertEqual(self.pedir(etag=etag, tipo=self.almacen.id).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.yerba.nombre = 'Yerba mate'
+            self.yerba.save()
+        respuesta = self.pedir(etag=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+        # Borrar el producto más viejo no mueve el máximo, pero sí el total
+        etag = respuesta['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.get(id=self.producto.id).delete()
+        self.assertEqual(self.pedir(etag=etag).status_code, 200)
+
+    def test_cursor_en_link(self):
+        for numero in range(3):
+            Producto.objects.create(nombre=f'Galletitas {numero}', tipo=self.almacen, cantidad=1, valor=1)
+        vistos, url, paginas = [], reverse('api_productos') + '?limite=2&fields=id', 0
+        while url:
+            respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            vistos += [item['id'] for item in respuesta.json()]
+            paginas += 1
+            enlace = respuesta.get('Link')
+            url = re.fullmatch(r'<(.+)>; rel="next"', enlace).group(1) if enlace else None
+        self.assertEqual(paginas, 3)
+        self.assertEqual(vistos, list(Producto.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_campos_y_filtros(self):
+        respuesta = self.pedir(fields='id,tipo_nombre,disponible', tipo=self.almacen.id)
+        self.assertEqual(respuesta.json(), [{'id': self.yerba.id, 'tipo_nombre': 'Almacén', 'disponible': 10}])
+
+        corte = timezone.now()
+        Producto.objects.filter(id=self.producto.id).update(fecha_modificacion=corte + timedelta(minutes=1))
+        respuesta = self.pedir(fields='id', updated_since=corte.isoformat())
+        self.assertEqual(respuesta.json(), [{'id': self.producto.id}])
+
+    def test_parametros_invalidos(self):
+        for parametros in (
+            {'fields': 'id,costo'},
+            {'updated_since': 'ayer'},
+            {'updated_since': '2024-13-45T00:00:00'},
+            {'tipo': 'bebidas'},
+            {'limite': '0'},
+            {'ancho': 'grande'},
+        ):
+            with self.subTest(**parametros):
+                respuesta = self.pedir(**parametros)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertIn('error', respuesta.json())
+
+    def test_imagenes_sin_n_mas_1(self):
+        def con_imagenes(cantidad):
+            for numero in range(cantidad):
+                producto = Producto.objects.create(nombre=f'Foto {numero}', tipo=self.almacen, cantidad=1, valor=1)
+                ImagenProducto.objects.create(producto=producto, ruta=f'productos/{producto.id}.jpg', variantes={
+                    'miniatura': {'ancho': 160, 'webp': f'd/{producto.id}-160.webp', 'jpeg': f'd/{producto.id}-160.jpg'},
+                    'mediana': {'ancho': 480, 'webp': f'd/{producto.id}-480.webp', 'jpeg': f'd/{producto.id}-480.jpg'},
+                })
+
+        campos = 'id,imagen,imagen_variantes,tipo_nombre'
+        con_imagenes(2)
+        # Estado del catálogo + productos con su tipo + todas las imágenes
+        with self.assertNumQueries(3):
+            self.pedir(fields=campos)
+        con_imagenes(6)
+        cache.clear()
+        with self.assertNumQueries(3):
+            datos = self.pedir(fields=campos, ancho=200).json()
+        fotos = [item for item in datos if item['imagen']]
+        self.assertEqual(len(fotos), 8)
+        self.assertTrue(all(item['imagen'].endswith('-480.webp') for item in fotos))
+        self.assertEqual(set(fotos[0]['imagen_variantes']), {'miniatura', 'mediana'})
+        self.assertEqual([item['imagen'] for item in datos if item['id'] == self.yerba.id], [None])
+
+
+class CacheCatalogoTests(DatosBase):
+    """La versión del catálogo cambia cuando la transacción confirma, nunca si vuelve atrás."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cambia_al_confirmar(self):
+        antes = version_catalogo()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.nombre = 'Agua mineral'
+            self.producto.save()
+            # Hasta el commit los demás siguen leyendo la versión vieja
+            self.assertEqual(version_catalogo(), antes)
+        self.assertNotEqual(version_catalogo(), antes)
+
+    def test_rollback_no_cambia_la_version(self):
+        antes = version_catalogo()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(StockInsuficiente):
+                with transaction.atomic():
+                    self.producto.save()
+                    restar_stock(self.producto, 1)
+                    restar_stock(self.producto, 1000)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(version_catalogo(), antes)
+
+    def test_payload_por_version(self):
+        construir = mock.Mock(return_value=['Agua'])
+        self.assertEqual(obtener_o_construir('prueba', 'a=1', construir), ['Agua'])
+        self.assertEqual(obtener_o_construir('prueba', 'a=1', construir), ['Agua'])
+        obtener_o_construir('prueba', 'a=2', construir)
+        self.assertEqual(construir.call_count, 2)
+        self.assertEqual((estadisticas()['hits'], estadisticas()['misses']), (1, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TipoProducto.objects.create(nombre='Limpieza')
+        obtener_o_construir('prueba', 'a=1', construir)
+        self.assertEqual(construir.call_count, 3)
+
+    def test_update_de_stock_invalida(self):
+        # Los UPDATE de services no disparan señales: invalidan ellos
+        self.assertEqual(self.client.get(reverse('api_productos'), {'fields': 'cantidad'}).json(), [{'cantidad': 100}])
+        with self.captureOnCommitCallbacks(execute=True):
+            restar_stock(self.producto, 30)
+        self.assertEqual(self.client.get(reverse('api_productos'), {'fields': 'cantidad'}).json(), [{'cantidad': 70}])
+
+
+@skipUnless(imagenes.pillow_disponible(), 'Requiere Pillow')
+class ImagenesBase(DatosBase):
+    """MEDIA_ROOT temporal y fotos generadas en memoria."""
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.media = carpeta.name
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def foto(self, ancho=300, alto=200, color=(200, 30, 30, 255), nombre='foto.png'):
+        contenido = io.BytesIO()
+        imagenes.Image.new('RGBA', (ancho, alto), color).save(contenido, 'PNG')
+        return SimpleUploadedFile(nombre, contenido.getvalue(), content_type='image/png')
+
+    def existe(self, ruta):
+        return os.path.exists(os.path.join(self.media, ruta))
+
+
+class DerivadosImagenTests(ImagenesBase):
+    """Miniatura/tarjeta/completa en WebP y JPEG, generadas después del commit."""
+
+    def imagen(self, **foto):
+        return ImagenProducto.objects.create(
+            producto=self.producto, ruta=imagenes.guardar_original(self.foto(**foto))
+        )
+
+    def test_tamanios_sin_agrandar(self):
+        imagen = self.imagen(ancho=300)
+        variantes = imagenes.generar_derivados(imagen)
+        # 300 px no alcanza para "completa": no se agranda
+        self.assertEqual({nombre: v['ancho'] for nombre, v in variantes.items()}, {'miniatura': 160, 'tarjeta': 300})
+        for variante in variantes.values():
+            with imagenes.Image.open(os.path.join(self.media, variante['webp'])) as webp:
+                self.assertEqual((webp.format, webp.width), ('WEBP', variante['ancho']))
+            with imagenes.Image.open(os.path.join(self.media, variante['jpeg'])) as jpeg:
+                # Sin alfa: la transparencia se aplana sobre blanco
+                self.assertEqual((jpeg.format, jpeg.mode), ('JPEG', 'RGB'))
+        imagen.refresh_from_db()
+        self.assertEqual(imagen.variantes, variantes)
+        self.assertEqual(imagen.variante(200), variantes['tarjeta']['webp'])
+        self.assertEqual(imagen.variante(2000, 'jpeg'), variantes['tarjeta']['jpeg'])
+
+    def test_mueve_fecha_y_version(self):
+        imagen = self.imagen(ancho=1600, alto=100)
+        antes = Producto.objects.get(id=self.producto.id).fecha_modificacion
+        version = version_catalogo()
+        with self.captureOnCommitCallbacks(execute=True):
+            variantes = imagenes.generar_derivados(imagen)
+        self.assertEqual(set(variantes), {'miniatura', 'tarjeta', 'completa'})
+        self.assertGreater(Producto.objects.get(id=self.producto.id).fecha_modificacion, antes)
+        self.assertNotEqual(version_catalogo(), version)
+
+    def test_subir_programa_y_el_comando_completa(self):
+        self.client.force_login(self.usuario)
+        with mock.patch.object(imagenes._ejecutor, 'submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('subir_imagen'), {'producto_id': self.producto.id, 'imagen': self.foto()})
+        imagen = ImagenProducto.objects.get(producto=self.producto)
+        # El request sólo guarda el original y encola el resto
+        self.assertEqual(imagen.variantes, {})
+        submit.assert_called_once_with(imagenes._generar_en_segundo_plano, imagen.id)
+
+        call_command('generar_derivados', stdout=mock.Mock())
+        imagen.refresh_from_db()
+        self.assertEqual(set(imagen.variantes), {'miniatura', 'tarjeta'})
+        self.assertTrue(all(self.existe(v['webp']) and self.existe(v['jpeg']) for v in imagen.variantes.values()))
+
+
+class MediaDeduplicadaTests(ImagenesBase):
+    """Originales por contenido y limpiar_media: nunca borra lo que alguien usa."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.yerba = Producto.objects.create(nombre='Yerba', tipo=cls.tipo, cantidad=10, valor=20)
+
+    def subir(self, producto, foto):
+        with mock.patch.object(imagenes._ejecutor, 'submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('subir_imagen'), {'producto_id': producto.id, 'imagen': foto})
+        return ImagenProducto.objects.get(producto=producto), submit
+
+    def archivos(self):
+        return {
+            os.path.relpath(os.path.join(carpeta, nombre), self.media).replace(os.sep, '/')
+            for carpeta, _, nombres in os.walk(self.media) for nombre in nombres
+        }
+
+    def envejecer(self):
+        hace_un_dia = timezone.now().timestamp() - 86400
+        for ruta in self.archivos():
+            os.utime(os.path.join(self.media, ruta), (hace_un_dia, hace_un_dia))
+
+    def test_misma_foto_un_solo_archivo(self):
+        self.client.force_login(self.usuario)
+        agua, _ = self.subir(self.producto, self.foto(nombre='agua.png'))
+        self.assertRegex(agua.ruta, r'^productos/[0-9a-f]{64}\.png$')
+        imagenes.generar_derivados(agua)
+
+        yerba, submit = self.subir(self.yerba, self.foto(nombre='otra.PNG'))
+        self.assertEqual(yerba.ruta, agua.ruta)
+        # Reusa los derivados ya generados en vez de encolar otra vez
+        agua.refresh_from_db()
+        self.assertEqual(yerba.variantes, agua.variantes)
+        submit.assert_not_called()
+        self.assertEqual(len([a for a in self.archivos() if '/derivados/' not in a]), 1)
+
+        otra, _ = self.subir(self.yerba, self.foto(color=(0, 0, 255, 255)))
+        self.assertNotEqual(otra.ruta, agua.ruta)
+
+    def test_limpiar_media_respeta_referencias(self):
+        self.client.force_login(self.usuario)
+        agua, _ = self.subir(self.producto, self.foto())
+        imagenes.generar_derivados(agua)
+        # La foto de la yerba se reemplaza por la misma del agua: la primera queda huérfana
+        descartada, _ = self.subir(self.yerba, self.foto(color=(0, 0, 255, 255)))
+        self.subir(self.yerba, self.foto())
+        self.assertFalse(ImagenProducto.objects.filter(ruta=descartada.ruta).exists())
+        usados = self.archivos() - {descartada.ruta}
+        self.envejecer()
+        # Una subida en curso: todavía no tiene ImagenProducto pero es reciente
+        with open(os.path.join(self.media, 'productos', '.subida-123'), 'wb') as temporal:
+            temporal.write(b'...')
+
+        self.assertEqual([ruta for ruta, _ in imagenes.archivos_huerfanos()], [descartada.ruta])
+        call_command('limpiar_media', '--dry-run', stdout=mock.Mock())
+        self.assertTrue(self.existe(descartada.ruta))
+
+        call_command('limpiar_media', stdout=mock.Mock())
+        self.assertEqual(self.archivos(), usados | {'productos/.subida-123'})
+
+        # Compartido: mientras un producto lo use, el archivo queda
+        ImagenProducto.objects.filter(producto=self.producto).delete()
+        call_command('limpiar_media', stdout=mock.Mock())
+        self.assertTrue(self.existe(agua.ruta))
+        ImagenProducto.objects.all().delete()
+        self.assertIn(agua.ruta, [ruta for ruta, _ in imagenes.archivos_huerfanos()])
+
+
+class AltaDePedidosTests(DatosBase):
+    """registrar_venta: consultas fijas sin importar las líneas, y todo o nada."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.productos = [cls.producto] + [
+            Producto.objects.create(nombre=f'Producto {numero}', tipo=cls.tipo, cantidad=100, valor=numero)
+            for numero in range(1, 40)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def lineas(self, cantidad):
+        return [(self.productos[numero % len(self.productos)].id, 2) for numero in range(cantidad)]
+
+    def assertNadaCreado(self):
+        self.assertFalse(Ventas.objects.exists())
+        self.assertFalse(DetalleVenta.objects.exists())
+        self.assertFalse(EventoEstado.objects.exists())
+
+    def test_pedido_grande_en_consultas_fijas(self):
+        def consultas(lineas):
+            with CaptureQueriesContext(connection) as contexto:
+                venta = registrar_venta(self.cliente, lineas, self.usuario)
+            return venta, len(contexto)
+
+        _, pocas = consultas(self.lineas(3))
+        venta, muchas = consultas(self.lineas(150))
+        self.assertEqual(muchas, pocas)
+        self.assertEqual(venta.detalles.count(), 150)
+        precios = {producto.id: producto.valor for producto in self.productos}
+        self.assertEqual(venta.valor_total, sum(precios[pid] * 2 for pid, _ in self.lineas(150)))
+
+    def test_datos_invalidos_no_crean_nada(self):
+        for lineas, error in (
+            ([], 'no tiene productos'),
+            ([(self.producto.id, 1), (self.producto.id, 0)], 'mayores a cero'),
+            ([(self.producto.id, 1), (998, 1), (999, 2)], 'Productos inexistentes: 998, 999'),
+        ):
+            with self.subTest(error=error):
+                with self.assertRaisesMessage(VentaInvalida, error):
+                    registrar_venta(self.cliente, lineas, self.usuario)
+                self.assertNadaCreado()
+
+    def test_falla_a_mitad_no_deja_venta(self):
+        with mock.patch.object(DetalleVenta.objects, 'bulk_create', side_effect=IntegrityError('disco lleno')):
+            with self.assertRaises(IntegrityError):
+                registrar_venta(self.cliente, self.lineas(20), self.usuario)
+        self.assertNadaCreado()
+
+    def test_api(self):
+        def crear(lineas, cliente=None):
+            return self.client.post(reverse('api_crear_venta'), json.dumps({
+                'cliente': cliente or self.cliente.id, 'notas': 'Mayorista',
+                'lineas': [{'producto': producto_id, 'cantidad': cantidad} for producto_id, cantidad in lineas],
+            }), content_type='application/json')
+
+        respuesta = crear([(self.producto.id, 3), (self.productos[5].id, 4)])
+        self.assertEqual(respuesta.status_code, 201)
+        venta = Ventas.objects.get()
+        self.assertEqual(respuesta.json(), {'id': venta.id, 'estado': 'pendiente', 'valor_total': '50.00', 'lineas': 2})
+        self.assertEqual((venta.notas, venta.usuario_creador), ('Mayorista', self.usuario))
+
+        for lineas, cliente in (
+            ([(self.producto.id, 1), (999, 1)], None),
+            ([(self.producto.id, 0)], None),
+            ([], None),
+            ([(self.producto.id, 1)], 999),
+        ):
+            with self.subTest(lineas=lineas, cliente=cliente):
+                self.assertEqual(crear(lineas, cliente).status_code, 400)
+        self.assertEqual(Ventas.objects.count(), 1)
+
+    def test_formulario_con_producto_inexistente(self):
+        respuesta = self.client.post(reverse('crear_venta'), {
+            'cliente': self.cliente.id, 'productos': [self.producto.id, 999], 'cantidades': [1, 1],
+        }, follow=True)
+        self.assertIn('Productos inexistentes: 999', str(list(respuesta.context['messages'])[0]))
+        self.assertNadaCreado()
+
+
+class BrokerEventosTests(SimpleTestCase):
+    """BrokerLocal y el stream SSE, sin base de datos."""
+
+    def evento(self, objeto, fecha='2026-10-18', chofer=1, chofer_anterior=None, tipo='envio'):
+        return {'tipo': tipo, 'objeto': objeto, 'fecha': fecha, 'chofer': chofer, 'chofer_anterior': chofer_anterior}
+
+    def test_publicar_y_suscribir(self):
+        broker = eventos.BrokerLocal(historial=2)
+
+        async def escuchar():
+            suscripcion = broker.suscribir()
+            # Se publica desde otro hilo, como el commit de un request
+            await asyncio.to_thread(broker.publicar, self.evento(1))
+            await asyncio.to_thread(broker.publicar, self.evento(2))
+            recibidos = [await suscripcion.siguiente(1), await suscripcion.siguiente(1)]
+            broker.desuscribir(suscripcion)
+            broker.publicar(self.evento(3))
+            sin_nada = await suscripcion.siguiente(0.05)
+            # Reconexión con Last-Event-ID: repite lo posterior que quede en el historial
+            repetidos = broker.suscribir(desde=1)
+            return recibidos, sin_nada, [await repetidos.siguiente(1), await repetidos.siguiente(1)]
+
+        recibidos, sin_nada, repetidos = asyncio.run(escuchar())
+        self.assertEqual([(e['objeto'], e['secuencia']) for e in recibidos], [(1, 1), (2, 2)])
+        self.assertIsNone(sin_nada)
+        self.assertEqual([e['objeto'] for e in repetidos], [2, 3])
+
+    def test_cliente_lento_se_corta(self):
+        async def llenar():
+            suscripcion = eventos.Suscripcion(asyncio.get_running_loop(), tamanio=2)
+            for numero in range(3):
+                suscripcion.entregar(self.evento(numero))
+            await asyncio.sleep(0)
+            return suscripcion.desbordada
+
+        self.assertTrue(asyncio.run(llenar()))
+
+    def test_filtros(self):
+        self.assertTrue(eventos.coincide(self.evento(1), fecha='2026-10-18', chofer='1', tipos={'envio'}))
+        self.assertFalse(eventos.coincide(self.evento(1), fecha='2026-10-19'))
+        self.assertFalse(eventos.coincide(self.evento(1), tipos={'venta'}))
+        self.assertFalse(eventos.coincide(self.evento(1), chofer='2'))
+        # Al que le sacaron el envío también se entera
+        self.assertTrue(eventos.coincide(self.evento(1, chofer=3, chofer_anterior=2), chofer='2'))
+
+    def test_flujo_sse_filtra_y_se_desuscribe(self):
+        broker = eventos.BrokerLocal()
+
+        async def leer():
+            flujo = eventos.flujo_sse(fecha='2026-10-18', chofer='1')
+            mensajes = [await flujo.__anext__()]
+            siguiente = asyncio.ensure_future(flujo.__anext__())
+            await asyncio.sleep(0)
+            broker.publicar(self.evento(1, chofer=2))
+            broker.publicar(self.evento(2, fecha='2026-10-19'))
+            broker.publicar(self.evento(3))
+            mensajes.append(await siguiente)
+            await flujo.aclose()
+            return mensajes
+
+        with mock.patch.object(eventos, 'broker', return_value=broker), mock.patch.object(eventos, 'LATIDO', 1):
+            mensajes = asyncio.run(leer())
+        self.assertEqual(mensajes[0], 'retry: 3000\n\n')
+        cabecera, datos = mensajes[1].split('data: ')
+        self.assertEqual(cabecera, 'id: 3\nevent: envio\n')
+        self.assertEqual(json.loads(datos)['objeto'], 3)
+        self.assertEqual(broker._suscripciones, set())
+
+
+class EventosEnVivoTests(DatosBase):
+    """Los cambios de envíos y ventas se publican después del commit; el stream pide sesión."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        venta = registrar_venta(cls.cliente, [(cls.producto.id, 1)], cls.usuario)
+        cambiar_estado_venta(venta, 'confirmada')
+        cls.envio = despachar_venta(venta, chofer=cls.chofer, fecha_envio=date(2026, 10, 18), hora_estimada=time(9))
+
+    def test_se_publica_al_confirmar(self):
+        with mock.patch.object(eventos, 'broker') as broker:
+            with self.captureOnCommitCallbacks(execute=True):
+                cambiar_estado_envio(self.envio, 'en_camino', usuario=self.usuario)
+                broker.return_value.publicar.assert_not_called()
+        publicados = [llamada.args[0] for llamada in broker.return_value.publicar.call_args_list]
+        self.assertIn(
+            {'tipo': 'envio', 'objeto': self.envio.id, 'estado': 'en_camino', 'chofer': self.chofer.id,
+             'fecha': '2026-10-18'},
+            [{clave: e[clave] for clave in ('tipo', 'objeto', 'estado', 'chofer', 'fecha')} for e in publicados],
+        )
+
+    def test_rollback_no_publica(self):
+        with mock.patch.object(eventos, 'broker') as broker:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    cambiar_estado_envio(self.envio, 'en_camino', usuario=self.usuario)
+                    raise IntegrityError('falla después del cambio')
+        broker.return_value.publicar.assert_not_called()
+
+    def test_stream_pide_sesion(self):
+        self.assertEqual(self.client.get(reverse('eventos_envios')).status_code, 403)
+
+        self.client.force_login(self.usuario)
+        respuesta = self.client.get(reverse('eventos_envios'), {'fecha': '2026-10-18'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+        self.assertEqual(respuesta['Cache-Control'], 'no-cache')
+        respuesta.close()
+
+
+class RutasTests(SimpleTestCase):
+    """Vecino más cercano + 2-opt: visita todas las paradas y nunca alarga el recorrido."""
+
+    DEPOSITO = (-34.60, -58.40)
+
+    def paradas(self, cantidad, semilla):
+        azar = random.Random(semilla)
+        return [(-34.60 + azar.uniform(-0.1, 0.1), -58.40 + azar.uniform(-0.1, 0.1)) for _ in range(cantidad)]
+
+    def largo(self, orden, puntos, deposito=None):
+        recorrido = ([deposito] if deposito else []) + [puntos[i] for i in orden]
+        return sum(rutas.distancia_km(a, b) for a, b in zip(recorrido, recorrido[1:]))
+
+    def test_nunca_peor_que_vecino_mas_cercano(self):
+        for cantidad in (3, 4, 10, 60, 200):
+            for semilla in range(3):
+                with self.subTest(cantidad=cantidad, semilla=semilla):
+                    puntos = self.paradas(cantidad, semilla)
+                    nodos = [self.DEPOSITO, *puntos]
+                    vecino = rutas._vecino_mas_cercano(rutas._matriz(nodos), len(nodos))
+                    solo_vecino = [nodo - 1 for nodo in vecino[1:]]
+
+                    orden = rutas.secuenciar(puntos, self.DEPOSITO)
+                    self.assertEqual(sorted(orden), list(range(cantidad)))
+                    self.assertLessEqual(
+                        self.largo(orden, puntos, self.DEPOSITO),
+                        self.largo(solo_vecino, puntos, self.DEPOSITO) + 1e-9,
+                    )
+
+    def test_sin_deposito_arranca_por_la_primera(self):
+        self.assertEqual(rutas.secuenciar([]), [])
+        self.assertEqual(rutas.secuenciar([(0, 0), (0, 1)]), [0, 1])
+        # Sobre una recta desordenada, el orden óptimo es recorrerla
+        puntos = [(0, 0), (0, 0.3), (0, 0.1), (0, 0.4), (0, 0.2)]
+        self.assertEqual(rutas.secuenciar(puntos), [0, 2, 4, 1, 3])
+
+    def test_leer_coordenada(self):
+        self.assertEqual(rutas.leer_coordenada(' -34,6037 ', 90), Decimal('-34.603700'))
+        for texto in ('', 'norte', '91', 'nan', 'inf'):
+            with self.subTest(texto=texto):
+                self.assertIsNone(rutas.leer_coordenada(texto, 90))
+
+    @override_settings(
+        RUTA_DEPOSITO=(0.0, 0.0), RUTA_HORA_SALIDA=time(8), RUTA_VELOCIDAD_KMH=60, RUTA_MINUTOS_POR_PARADA=10,
+    )
+    def test_planificar(self):
+        def envio(numero, hora, cliente=None, parada=None):
+            latitud, longitud = cliente or (None, None)
+            venta = Ventas(cliente=Cliente(nombre_completo=f'Cliente {numero}', latitud=latitud, longitud=longitud))
+            envio = Envio(id=numero, venta=venta, hora_estimada=hora)
+            if parada:
+                envio.latitud, envio.longitud = parada
+            return envio
+
+        # ~11 km por cada 0.1 grado de latitud
+        lejos = envio(1, time(9), cliente=(Decimal('0.2'), 0))
+        sin_ubicacion = envio(2, time(8))
+        # El envío manda sobre la dirección del cliente
+        cerca = envio(3, time(10), cliente=(Decimal('5'), 0), parada=(Decimal('0.1'), 0))
+        plan = rutas.planificar([lejos, sin_ubicacion, cerca], date(2026, 10, 18))
+
+        self.assertEqual([parada['envio'] for parada in plan], [cerca, lejos, sin_ubicacion])
+        self.assertEqual([parada['orden'] for parada in plan], [1, 2, 3])
+        self.assertAlmostEqual(plan[0]['km'], 11.1, places=1)
+        self.assertAlmostEqual(plan[1]['km'], 11.1, places=1)
+        self.assertIsNone(plan[2]['km'])
+        # 11 km a 60 km/h, redondeado a 5 minutos; 10 minutos de descarga entre paradas
+        self.assertEqual([parada['hora_sugerida'] for parada in plan], [time(8, 15), time(8, 35), None])
+
+
+class NotasAEventosTests(DatosBase):
+    """Migración 0016: las líneas "[dd/mm/aaaa hh:mm] texto" de `notas` pasan al historial."""
+
+    migracion = importlib.import_module('stock.migrations.0016_historial_estados')
+
+    def test_partir_notas(self):
+        partir = self.migracion.partir_notas
+        self.assertEqual(partir(None), ('', []))
+        self.assertEqual(partir('Tocar timbre\n[urgente] llamar antes'), ('Tocar timbre\n[urgente] llamar antes', []))
+        self.assertEqual(
+            partir(
+                'Dejar en portería\n'
+                '[01/02/2024 10:30] Cliente ausente\n'
+                'vuelvo a la tarde\n'
+                '[01/02/2024 16:05]\n'
+                '[02/02/2024 09:00] Entregado'
+            ),
+            ('Dejar en portería', [
+                [datetime(2024, 2, 1, 10, 30, tzinfo=dt_timezone.utc), 'Cliente ausente\nvuelvo a la tarde'],
+                [datetime(2024, 2, 1, 16, 5, tzinfo=dt_timezone.utc), ''],
+                [datetime(2024, 2, 2, 9, 0, tzinfo=dt_timezone.utc), 'Entregado'],
+            ]),
+        )
+
+    def test_separar_notas(self):
+        venta = registrar_venta(self.cliente, [(self.producto.id, 1)], self.usuario)
+        cambiar_estado_venta(venta, 'confirmada')
+        envio = despachar_venta(venta, chofer=self.chofer, fecha_envio=timezone.localdate(), hora_estimada=time(9))
+        sin_fecha = registrar_venta(self.cliente, [(self.producto.id, 1)], self.usuario, notas='Pagó [en efectivo] ')
+        Ventas.objects.filter(id=venta.id).update(notas='Envolver\n[03/03/2024 12:00] Chofer: Juan tomó el pedido')
+        Envio.objects.filter(id=envio.id).update(notas='[03/03/2024 13:15] En camino\n[03/03/2024 14:00] Entregado')
+        modificado = Envio.objects.get(id=envio.id).fecha_modificacion
+
+        self.migracion.separar_notas(apps, None)
+
+        notas = dict(Ventas.objects.values_list('id', 'notas'))
+        self.assertEqual((notas[venta.id], notas[sin_fecha.id]), ('Envolver', 'Pagó [en efectivo] '))
+        envio.refresh_from_db()
+        self.assertEqual((envio.notas, envio.fecha_modificacion), ('', modificado))
+        self.assertEqual(
+            list(EventoEstado.objects.exclude(nota='').order_by('fecha').values_list(
+                'tipo', 'venta_id', 'envio_id', 'estado_anterior', 'estado_nuevo', 'nota'
+            )),
+            [
+                ('venta', venta.id, None, '', '', 'Chofer: Juan tomó el pedido'),
+                ('envio', venta.id, envio.id, '', '', 'En camino'),
+                ('envio', venta.id, envio.id, '', '', 'Entregado'),
+            ],
+        )
+        self.assertEqual(
+            EventoEstado.objects.filter(nota='En camino').get().fecha,
+            datetime(2024, 3, 3, 13, 15, tzinfo=dt_timezone.utc),
+        )
@@ -35,6 +35,7 @@ urlpatterns = [
     # CHOFERES
     # ==================================
     path('choferes/', views.lista_choferes, name='lista_choferes'),
+    path('choferes/ranking/', views.ranking_choferes, name='ranking_choferes'),
     path('choferes/crear/', views.crear_chofer, name='crear_chofer'),
     path('choferes/editar/<int:chofer_id>/', views.editar_chofer, name='editar_chofer'),
     
@@ -45,21 +46,28 @@ urlpatterns = [
     path('ventas/crear/', views.crear_venta, name='crear_venta'),
     path('ventas/detalle/<int:venta_id>/', views.detalle_venta, name='detalle_venta'),
     path('ventas/actualizar-estado/<int:venta_id>/', views.actualizar_estado_venta, name='actualizar_estado_venta'),
+    path('ventas/cambiar-estado/', views.cambiar_estado_ventas_masivo, name='cambiar_estado_ventas_masivo'),
     
     # ==================================
     # REPORTES (SOLO VENTAS CONFIRMADAS)
     # ==================================
     path('ventas/consultar/', views.consultar_ventas, name='consultar_ventas'),
+    path('ventas/consultar/exportar/', views.exportar_ventas, name='exportar_ventas'),
     
     # ==================================
     # ENVÍOS (TRACKING OPCIONAL)
     # ==================================
     path('envios/', views.lista_envios, name='lista_envios'),
+    path('envios/exportar/', views.exportar_envios, name='exportar_envios'),
     path('envios/crear/<int:venta_id>/', views.crear_envio, name='crear_envio'),
     path('envios/detalle/<int:envio_id>/', views.detalle_envio, name='detalle_envio'),
     path('envios/actualizar-estado/<int:envio_id>/', views.actualizar_estado_envio, name='actualizar_estado_envio'),
     path('envios/programa-dia/', views.programa_dia, name='programa_dia'),
+    path('envios/programa-dia/aplicar-horarios/', views.aplicar_horarios_ruta, name='aplicar_horarios_ruta'),
+    path('envios/eventos/', views.eventos_envios, name='eventos_envios'),
     path('envios/asignar-pendientes/', views.asignar_envios_pendientes, name='asignar_envios_pendientes'),
+    path('envios/asignar-automatico/', views.asignar_choferes_automatico, name='asignar_choferes_automatico'),
+    path('envios/despachar-lote/', views.despachar_ventas_lote, name='despachar_ventas_lote'),
 
         path('ventas/<int:venta_id>/asignar-chofer/', views.asignar_chofer_venta, name='asignar_chofer_venta'),
     # ==================================
@@ -67,6 +75,8 @@ urlpatterns = [
     # ==================================
     path('imagenes/subir/', views.subir_imagen, name='subir_imagen'),
     path('api/productos/', views.api_productos, name='api_productos'),
+    path('api/ventas/', views.api_crear_venta, name='api_crear_venta'),
+    path('api/chofer/sincronizar/', views.api_sincronizar_chofer, name='api_sincronizar_chofer'),
 
        # 🚚 PANEL DE CHOFERES
 # 🚚 PANEL DE CHOFERES
@@ -1,18 +1,44 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import F, Sum
+from django.urls import reverse
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.db import OperationalError
+from django.db.models import Count, Max, Prefetch, Q, Sum
 from django.contrib import messages
 from django.utils import timezone
-from django.http import JsonResponse
-from datetime import date
-import os
-import uuid
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from asgiref.sync import sync_to_async
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition
+from datetime import date, timedelta
+import hashlib
 from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from .models import (
     Producto, TipoProducto, Cliente, Ventas, DetalleVenta,
     ImagenProducto, Chofer, Envio
 )
+from .services import (
+    StockInsuficiente, VentaNoDespachable,
+    sumar_stock, restar_stock, registrar_stock_inicial, despachar_venta,
+    registrar_venta, VentaInvalida, TRANSICIONES_VENTA, cambiar_estado_ventas,
+    despachar_ventas, cambiar_estado_venta, cambiar_estado_envio, historial,
+)
+from .serializers import CrearVentaSerializer, SincronizacionSerializer
+from .pagination import CursorInvalido, paginar
+from .search import buscar_productos
+from .cache import obtener_o_construir
+from . import asignacion, estadisticas, eventos, filtros, rutas, sincronizacion
+from .exportar import COLUMNAS_DETALLE, COLUMNAS_ENVIO, filas_envios, filas_ventas, respuesta_exportacion
+from .idempotencia import idempotente
+from .reintentos import reintentar_si_ocupada
+from .reportes import reporte
+from .resumenes import totales as totales_resumen
+from .imagenes import guardar_original, programar_derivados, variantes_existentes
 
 
 
@@ -45,9 +71,8 @@ def logout_usuario(request):
 # ==================================
 @login_required
 def home(request):
-    productos_bajo_stock = Producto.objects.filter(
-        cantidad__lt=F('umbral_alerta')
-    ).count()
+    # 🚨 Lee el índice parcial de en_alerta en vez de escanear productos
+    productos_bajo_stock = Producto.objects.filter(en_alerta=True).count()
     
     con_alerta = productos_bajo_stock > 0
     
@@ -70,22 +95,41 @@ def home(request):
 # ==================================
 @login_required
 def lista_productos(request):
-    tipos = TipoProducto.objects.all()
     query_nombre = request.GET.get('nombre')
     query_tipo = request.GET.get('tipo')
-
-    productos = Producto.objects.select_related('tipo').all()
-
-    if query_nombre:
-        productos = productos.filter(nombre__icontains=query_nombre)
-    if query_tipo:
-        productos = productos.filter(tipo_id=query_tipo)
+    solo_disponibles = request.GET.get('disponibles') == '1'
+
+    def construir():
+        productos = Producto.objects.select_related('tipo').prefetch_related(Prefetch(
+            'imagenproducto_set',
+            queryset=ImagenProducto.objects.order_by('id'),
+            to_attr='imagenes',
+        ))
+        orden = ['nombre', 'id']
+
+        if query_nombre:
+            # 🔎 Índice FTS: prefijos, sin acentos y ordenado por relevancia
+            productos = buscar_productos(productos, query_nombre)
+            orden = ['rank', 'id']
+        if query_tipo:
+            productos = productos.filter(tipo_id=query_tipo)
+        if solo_disponibles:
+            # Lo que se puede prometer: cantidad - reservado (columna indexada)
+            productos = productos.filter(disponible__gt=0)
+
+        return paginar(request, productos, orden)
+
+    # 📦 Cache versionado: se invalida solo cuando cambia el catálogo
+    pagina = obtener_o_construir('lista_productos', request.GET.urlencode(), construir)
+    tipos = obtener_o_construir('tipos', '', lambda: list(TipoProducto.objects.all()))
 
     return render(request, 'lista_productos.html', {
-        'productos': productos,
+        'productos': pagina,
+        'pagina': pagina,
         'tipos': tipos,
         'query_nombre': query_nombre,
         'query_tipo': query_tipo,
+        'solo_disponibles': solo_disponibles,
     })
 
 @login_required
@@ -116,7 +160,7 @@ def crear_producto(request):
 
         if nombre and tipo_id:
             tipo = TipoProducto.objects.get(id=tipo_id)
-            Producto.objects.create(
+            producto = Producto.objects.create(
                 nombre=nombre,
                 tipo=tipo,
                 cantidad=cantidad,
@@ -124,10 +168,12 @@ def crear_producto(request):
                 valor=valor,
                 umbral_alerta=umbral_alerta
             )
+            registrar_stock_inicial(producto, usuario=request.user)
             return redirect('lista_productos')
 
     return render(request, 'crear_producto.html', {'tipos': tipos})
 @login_required
+@reintentar_si_ocupada
 def actualizar_stock(request, producto_id):
     producto = get_object_or_404(Producto, id=producto_id)
 
@@ -135,14 +181,16 @@ def actualizar_stock(request, producto_id):
         cantidad = int(request.POST.get('cantidad'))
         accion = request.POST.get('accion')
 
+        # 🎯 UPDATE atómico + movimiento en el ledger (sin read-modify-write)
         if accion == 'sumar':
-            producto.cantidad += cantidad
+            sumar_stock(producto, cantidad, usuario=request.user)
         elif accion == 'restar':
-            producto.cantidad -= cantidad
-            if producto.cantidad < 0:
-                producto.cantidad = 0
+            try:
+                restar_stock(producto, cantidad, usuario=request.user)
+            except StockInsuficiente as e:
+                messages.error(request, f'❌ Stock insuficiente: {e}')
+                return redirect('actualizar_stock', producto_id=producto.id)
 
-        producto.save()
         return redirect('lista_productos')
 
     return render(request, 'actualizar_stock.html', {'producto': producto})
@@ -180,13 +228,13 @@ def editar_producto(request, producto_id):
 
 @login_required
 def panel_alertas(request):
-    productos_con_alerta = Producto.objects.filter(
-        cantidad__lt=F('umbral_alerta')
-    ).select_related('tipo').order_by('nombre')
+    productos_con_alerta = list(
+        Producto.objects.filter(en_alerta=True).select_related('tipo').order_by('nombre')
+    )
     
     contexto = {
         'productos_con_alerta': productos_con_alerta,
-        'conteo_alertas': productos_con_alerta.count(),
+        'conteo_alertas': len(productos_con_alerta),
     }
     
     return render(request, 'panel_alertas.html', contexto)
@@ -197,8 +245,8 @@ def panel_alertas(request):
 # ==================================
 @login_required
 def lista_clientes(request):
-    clientes = Cliente.objects.all()
-    return render(request, 'lista_clientes.html', {'clientes': clientes})
+    pagina = paginar(request, Cliente.objects.all(), ['nombre_completo', 'id'])
+    return render(request, 'lista_clientes.html', {'clientes': pagina, 'pagina': pagina})
 
 @login_required
 def crear_cliente(request):
@@ -217,7 +265,9 @@ def crear_cliente(request):
                 cuil=cuil if cuil else None,  # 🆕 NUEVO
                 email=email if email else None,
                 telefono=telefono if telefono else None,
-                direccion=direccion if direccion else None
+                direccion=direccion if direccion else None,
+                latitud=rutas.leer_coordenada(request.POST.get('latitud'), 90),
+                longitud=rutas.leer_coordenada(request.POST.get('longitud'), 180),
             )
             messages.success(request, 'Cliente creado correctamente')
             return redirect('lista_clientes')
@@ -233,6 +283,8 @@ def editar_cliente(request, cliente_id):
         cliente.email = request.POST.get('email') or None
         cliente.telefono = request.POST.get('telefono') or None
         cliente.direccion = request.POST.get('direccion') or None
+        cliente.latitud = rutas.leer_coordenada(request.POST.get('latitud'), 90)
+        cliente.longitud = rutas.leer_coordenada(request.POST.get('longitud'), 180)
         cliente.save()
         
         messages.success(request, f'Cliente "{cliente.nombre_completo}" actualizado')
@@ -244,11 +296,53 @@ def editar_cliente(request, cliente_id):
 # ==================================
 # CHOFERES
 # ==================================
+def _entero_positivo(valor):
+    """int > 0 de un input opcional; vacío o inválido = None (sin límite)."""
+    valor = (valor or '').strip()
+    return int(valor) if valor.isdigit() and int(valor) > 0 else None
+
+
 @login_required
 def lista_choferes(request):
     choferes = Chofer.objects.all()
     return render(request, 'envios/lista_choferes.html', {'choferes': choferes})
 
+@login_required
+def ranking_choferes(request):
+    """
+    Ranking de choferes de la oficina: puntualidad, atraso promedio,
+    entregas por día y cancelaciones de una o varias semanas.
+    Lee las filas semanales (una por chofer y semana).
+    """
+    dia = filtros.fecha(request.GET, 'semana') or timezone.localdate()
+    try:
+        cantidad = min(max(int(request.GET.get('semanas', 1)), 1), 52)
+    except ValueError:
+        cantidad = 1
+    hasta = estadisticas.inicio_semana(dia)
+    desde = hasta - timedelta(weeks=cantidad - 1)
+    ranking = estadisticas.ranking(desde, hasta)
+    
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({
+            'desde': desde.isoformat(),
+            'hasta': (hasta + timedelta(days=6)).isoformat(),
+            'choferes': [
+                {'id': t.chofer.id, 'nombre': t.chofer.nombre_completo, **t.como_dict()}
+                for t in ranking
+            ],
+        })
+    
+    return render(request, 'envios/ranking_choferes.html', {
+        'ranking': ranking,
+        'desde': desde,
+        'hasta': hasta + timedelta(days=6),
+        'semana': dia,
+        'semanas': cantidad,
+        'anterior': hasta - timedelta(weeks=1),
+        'siguiente': hasta + timedelta(weeks=1),
+    })
+
 @login_required
 def crear_chofer(request):
     if request.method == 'POST':
@@ -262,7 +356,9 @@ def crear_chofer(request):
                 nombre_completo=nombre,
                 telefono=telefono,
                 vehiculo=vehiculo,
-                notas=notas
+                notas=notas,
+                capacidad_paradas=_entero_positivo(request.POST.get('capacidad_paradas')),
+                capacidad_unidades=_entero_positivo(request.POST.get('capacidad_unidades')),
             )
             messages.success(request, 'Chofer creado correctamente')
             return redirect('lista_choferes')
@@ -281,6 +377,8 @@ def editar_chofer(request, chofer_id):
         chofer.vehiculo = request.POST.get('vehiculo')
         chofer.notas = request.POST.get('notas')
         chofer.activo = request.POST.get('activo') == 'on'
+        chofer.capacidad_paradas = _entero_positivo(request.POST.get('capacidad_paradas'))
+        chofer.capacidad_unidades = _entero_positivo(request.POST.get('capacidad_unidades'))
         chofer.save()
         
         messages.success(request, f'Chofer "{chofer.nombre_completo}" actualizado')
@@ -293,6 +391,8 @@ def editar_chofer(request, chofer_id):
 # 🆕 VENTAS - VENDEDORES
 # ==================================
 @login_required
+@reintentar_si_ocupada
+@idempotente
 def crear_venta(request):
     """
     SIMPLIFICADO: Solo crear venta con productos.
@@ -310,52 +410,31 @@ def crear_venta(request):
             try:
                 cliente = Cliente.objects.get(id=cliente_id)
 
-                # 🔹 Crear la venta SIMPLE (pendiente) con usuario creador
-                venta = Ventas.objects.create(
-                    cliente=cliente,
-                    estado='pendiente',
-                    notas=notas or '',
-                    valor_total=0,
-                    usuario_creador=request.user  # 👈 CLAVE
+                # 🔹 Venta pendiente + detalles en bloque, con usuario creador
+                venta = registrar_venta(
+                    cliente,
+                    [(p, c) for p, c in zip(productos_ids, cantidades) if p and c],
+                    usuario=request.user,  # 👈 CLAVE
+                    notas=notas,
                 )
 
-                total_venta = 0
-
-                # 🔹 Agregar productos
-                for prod_id, cant in zip(productos_ids, cantidades):
-                    if prod_id and cant:
-                        producto = Producto.objects.get(id=prod_id)
-                        cantidad = int(cant)
-                        precio = producto.valor
-                        subtotal = precio * cantidad
-
-                        DetalleVenta.objects.create(
-                            venta=venta,
-                            producto=producto,
-                            cantidad=cantidad,
-                            precio_unitario=precio,
-                            subtotal=subtotal
-                        )
-
-                        total_venta += subtotal
-
-                # 🔹 Actualizar total
-                venta.valor_total = total_venta
-                venta.save(update_fields=['valor_total'])
-
                 messages.success(
                     request,
-                    f'✅ Venta #{venta.id} creada por ${total_venta:.2f}. Estado: Pendiente.'
+                    f'✅ Venta #{venta.id} creada por ${venta.valor_total:.2f}. Estado: Pendiente.'
                 )
                 return redirect('lista_ventas')
 
+            except OperationalError:
+                raise  # base ocupada: lo reintenta reintentar_si_ocupada
             except Exception as e:
                 messages.error(request, f'Error al crear venta: {str(e)}')
         else:
             messages.error(request, 'Seleccione un cliente y al menos un producto')
 
     clientes = Cliente.objects.all().order_by('nombre_completo')
-    productos = Producto.objects.all().order_by('nombre')
+    productos = obtener_o_construir('selector_venta', '', lambda: list(
+        Producto.objects.order_by('nombre').values('id', 'nombre', 'valor', 'cantidad', 'disponible')
+    ))
 
     return render(request, 'ventas/crear_venta.html', {
         'clientes': clientes,
@@ -373,23 +452,18 @@ def lista_ventas(request):
     fecha_desde = request.GET.get('desde')
     fecha_hasta = request.GET.get('hasta')
     
-    ventas = Ventas.objects.select_related('cliente').prefetch_related(
+    # El prefetch de detalles corre sólo sobre la ventana paginada
+    ventas = filtros.ventas(request.GET).select_related('cliente').prefetch_related(
         'detalles__producto'
-    ).all().order_by('-fecha_creacion')
-    
-    if estado:
-        ventas = ventas.filter(estado=estado)
-    if cliente_id:
-        ventas = ventas.filter(cliente_id=cliente_id)
-    if fecha_desde:
-        ventas = ventas.filter(fecha_creacion__date__gte=fecha_desde)
-    if fecha_hasta:
-        ventas = ventas.filter(fecha_creacion__date__lte=fecha_hasta)
+    )
     
+    # Mismo sentido en ambas claves: el índice de fecha_creacion da el orden hecho
+    pagina = paginar(request, ventas, ['-fecha_creacion', '-id'])
     clientes = Cliente.objects.all().order_by('nombre_completo')
     
     return render(request, 'ventas/lista_ventas.html', {
-        'ventas': ventas,
+        'ventas': pagina,
+        'pagina': pagina,
         'clientes': clientes,
         'estado': estado,
         'cliente_id': cliente_id,
@@ -407,11 +481,14 @@ def detalle_venta(request, venta_id):
     
     return render(request, 'ventas/detalle_venta.html', {
         'venta': venta,
+        'historial': historial(venta),
         'detalles': detalles,
         'choferes': choferes  # 👈 ESTO ES LO IMPORTANTE
     })
 
 
+@reintentar_si_ocupada
+@idempotente
 def actualizar_estado_venta(request, venta_id):
     """
     Cambiar estado: pendiente ↔ confirmada ↔ cancelada
@@ -423,23 +500,19 @@ def actualizar_estado_venta(request, venta_id):
         nuevo_estado = request.POST.get('estado')
         
         # Validar transiciones permitidas
-        transiciones_permitidas = {
-            'pendiente': ['confirmada', 'cancelada'],
-            'confirmada': ['pendiente', 'cancelada'],
-            'enviada': ['entregada'],  # Solo si chofer actualiza envío
-            'entregada': [],  # No se puede cambiar
-            'cancelada': []   # No se puede cambiar
-        }
-        
-        if nuevo_estado not in transiciones_permitidas.get(venta.estado, []):
+        if nuevo_estado not in TRANSICIONES_VENTA.get(venta.estado, []):
             messages.error(
                 request, 
                 f'❌ No se puede cambiar de "{venta.get_estado_display()}" a "{dict(Ventas.ESTADO_CHOICES).get(nuevo_estado)}"'
             )
             return redirect('detalle_venta', venta_id=venta_id)
         
-        venta.estado = nuevo_estado
-        venta.save()
+        # 🔒 Confirmar reserva stock; volver a pendiente o cancelar lo libera
+        try:
+            cambiar_estado_venta(venta, nuevo_estado, usuario=request.user)
+        except StockInsuficiente as e:
+            messages.error(request, f'❌ No hay stock disponible para confirmar: {e}')
+            return redirect('detalle_venta', venta_id=venta_id)
         
         messages.success(
             request, 
@@ -452,13 +525,67 @@ def actualizar_estado_venta(request, venta_id):
         'estados': Ventas.ESTADO_CHOICES
     })
 
+@login_required
+@reintentar_si_ocupada
+@idempotente
+def cambiar_estado_ventas_masivo(request):
+    """
+    Confirmar / cancelar / volver a pendiente muchas ventas de una vez
+    (desde lista_ventas o asignar_envios_pendientes).
+    POST: ventas=<id>&ventas=<id>...&estado=<nuevo>
+    Con Accept: application/json devuelve el resultado de cada venta.
+    """
+    destino = request.POST.get('siguiente')
+    if not destino or not url_has_allowed_host_and_scheme(destino, allowed_hosts={request.get_host()}):
+        destino = reverse('lista_ventas')
+    if request.method != 'POST':
+        return redirect(destino)
+
+    quiere_json = 'application/json' in request.headers.get('Accept', '')
+    nuevo_estado = request.POST.get('estado')
+    try:
+        resultados = cambiar_estado_ventas(request.POST.getlist('ventas'), nuevo_estado, usuario=request.user)
+    except (VentaInvalida, StockInsuficiente) as e:
+        if quiere_json:
+            return JsonResponse({'error': str(e)}, status=400)
+        messages.error(request, f'❌ {e}')
+        return redirect(destino)
+
+    if quiere_json:
+        return JsonResponse({
+            'estado': nuevo_estado,
+            'resultados': {
+                str(venta_id): {'aceptada': aceptada, 'motivo': motivo}
+                for venta_id, (aceptada, motivo) in resultados.items()
+            },
+        })
+
+    aceptadas = [venta_id for venta_id, (aceptada, _) in resultados.items() if aceptada]
+    rechazadas = [(venta_id, motivo) for venta_id, (aceptada, motivo) in resultados.items() if not aceptada]
+    if aceptadas:
+        messages.success(
+            request,
+            f'✅ {len(aceptadas)} venta(s) pasaron a "{dict(Ventas.ESTADO_CHOICES)[nuevo_estado]}"'
+        )
+    if rechazadas:
+        detalle = ', '.join(f'#{venta_id} ({motivo})' for venta_id, motivo in rechazadas[:10])
+        if len(rechazadas) > 10:
+            detalle += f' y {len(rechazadas) - 10} más'
+        messages.warning(request, f'⚠️ No se cambiaron: {detalle}')
+    if not resultados:
+        messages.error(request, '❌ No se seleccionó ninguna venta')
+    return redirect(destino)
+
 # ==================================
 # CONSULTAR VENTAS (REPORTES)
 # ==================================
 @login_required
+@reporte
 def consultar_ventas(request):
     """
     Consultar SOLO ventas enviadas/entregadas (confirmadas)
+    Los totales salen de los resúmenes diarios; de las ventas en sí sólo se
+    trae la página visible.
     """
     productos = Producto.objects.all()
     clientes = Cliente.objects.all().order_by('nombre_completo')
@@ -468,33 +595,38 @@ def consultar_ventas(request):
     cliente_id = request.GET.get('cliente')
     producto_id = request.GET.get('producto')
 
+    pagina = None
+    resumen = {'ventas': 0, 'unidades': 0, 'recaudado': 0}
     if fecha_desde or fecha_hasta or cliente_id or producto_id or request.GET:
         # 🎯 SOLO ventas enviadas o entregadas
-        ventas = Ventas.objects.filter(
-            estado__in=['enviada', 'entregada']
-        ).select_related('cliente').prefetch_related(
+        ventas = filtros.ventas_consultadas(request.GET).select_related('cliente').prefetch_related(
             'detalles__producto'
-        ).order_by('-fecha_envio')
-        
-        if fecha_desde:
-            ventas = ventas.filter(fecha_envio__date__gte=fecha_desde)
-        if fecha_hasta:
-            ventas = ventas.filter(fecha_envio__date__lte=fecha_hasta)
-        if cliente_id:
-            ventas = ventas.filter(cliente_id=cliente_id)
-        if producto_id:
-            ventas = ventas.filter(detalles__producto_id=producto_id).distinct()
-            
-        total_recaudado = ventas.aggregate(Sum('valor_total'))['valor_total__sum'] or 0
-    else:
-        ventas = Ventas.objects.none()
-        total_recaudado = 0
+        )
+
+        # 📊 Totales desde los resúmenes (cliente + producto no tiene resumen)
+        resumen = totales_resumen(
+            filtros.fecha(request.GET, 'desde'), filtros.fecha(request.GET, 'hasta'),
+            cliente_id, producto_id,
+        )
+        if resumen is None:
+            resumen = DetalleVenta.objects.filter(
+                venta__in=ventas, producto_id=producto_id
+            ).aggregate(
+                ventas=Count('venta_id', distinct=True),
+                unidades=Sum('cantidad'),
+                recaudado=Sum('subtotal'),
+            )
+
+        pagina = paginar(request, ventas, ['-fecha_envio', '-id'])
         
     return render(request, 'consultar_ventas.html', {
-        'ventas': ventas,
+        'ventas': pagina or [],
+        'pagina': pagina,
         'productos': productos,
         'clientes': clientes,
-        'total_recaudado': total_recaudado,
+        'total_recaudado': resumen['recaudado'],
+        'total_ventas': resumen['ventas'],
+        'total_unidades': resumen['unidades'],
         'fecha_desde': fecha_desde,
         'fecha_hasta': fecha_hasta,
         'cliente_id': cliente_id,
@@ -515,20 +647,7 @@ def lista_envios(request):
     estado = request.GET.get('estado')
     
     # 🎯 SOLO envíos que ya existen
-    envios = Envio.objects.select_related('venta__cliente', 'chofer').all()
-    
-    if fecha:
-        envios = envios.filter(fecha_envio=fecha)
-    else:
-        # Por defecto mostrar envíos de hoy
-        envios = envios.filter(fecha_envio=date.today())
-    
-    if chofer_id:
-        envios = envios.filter(chofer_id=chofer_id)
-    
-    if estado:
-        envios = envios.filter(estado=estado)
-    
+    envios = filtros.envios(request.GET).select_related('venta__cliente', 'chofer')
     envios = envios.order_by('hora_estimada')
     
     choferes = Chofer.objects.filter(activo=True)
@@ -554,7 +673,37 @@ def lista_envios(request):
     
     return render(request, 'envios/lista_envios.html', context)
 
+# ==================================
+# EXPORTACIONES (CSV / XLSX)
+# ==================================
+@login_required
+@reporte
+def exportar_ventas(request):
+    """
+    Ventas de consultar_ventas con los mismos filtros, una fila por producto.
+    ?formato=csv (default) o xlsx. Se genera en streaming.
+    """
+    ventas = filtros.ventas_consultadas(request.GET)
+    return respuesta_exportacion(
+        f'ventas_{timezone.localdate():%Y%m%d}', COLUMNAS_DETALLE,
+        filas_ventas(ventas), request.GET.get('formato', 'csv'),
+    )
+
+
 @login_required
+@reporte
+def exportar_envios(request):
+    """Envíos de lista_envios con los mismos filtros (acepta desde/hasta)."""
+    envios = filtros.envios(request.GET)
+    return respuesta_exportacion(
+        f'envios_{timezone.localdate():%Y%m%d}', COLUMNAS_ENVIO,
+        filas_envios(envios), request.GET.get('formato', 'csv'),
+    )
+
+
+@login_required
+@reintentar_si_ocupada
+@idempotente
 def crear_envio(request, venta_id):
     """
     Crear envío = asignar chofer + programar + DESCONTAR STOCK + marcar como ENVIADA
@@ -585,50 +734,31 @@ def crear_envio(request, venta_id):
             try:
                 chofer = Chofer.objects.get(id=chofer_id)
                 
-                # 🎯 Verificar stock
-                detalles = venta.detalles.select_related('producto').all()
-                stock_insuficiente = []
-                
-                for detalle in detalles:
-                    if detalle.producto.cantidad < detalle.cantidad:
-                        stock_insuficiente.append(
-                            f'{detalle.producto.nombre} (Necesita: {detalle.cantidad}, Hay: {detalle.producto.cantidad})'
-                        )
-                
-                if stock_insuficiente:
-                    messages.error(
-                        request,
-                        f'❌ Stock insuficiente: {", ".join(stock_insuficiente)}'
-                    )
-                    return redirect('crear_envio', venta_id=venta_id)
-                
-                # 🎯 DESCONTAR STOCK
-                for detalle in detalles:
-                    detalle.producto.cantidad -= detalle.cantidad
-                    detalle.producto.save()
-                
-                # 🎯 Crear envío
-                Envio.objects.create(
-                    venta=venta,
+                # 🎯 Descontar stock + crear envío + marcar ENVIADA (una transacción)
+                despachar_venta(
+                    venta,
                     chofer=chofer,
                     fecha_envio=fecha_envio,
                     hora_estimada=hora_estimada,
                     direccion_entrega=direccion or venta.cliente.direccion or '',
                     notas=notas or '',
-                    estado='pendiente'
+                    usuario=request.user,
                 )
                 
-                # 🎯 Marcar venta como ENVIADA
-                venta.estado = 'enviada'
-                venta.fecha_envio = timezone.now()
-                venta.save()
-                
                 messages.success(
                     request, 
                     f'✅ Envío creado. Stock descontado. Venta #{venta.id} marcada como ENVIADA.'
                 )
                 return redirect('lista_envios')
                 
+            except StockInsuficiente as e:
+                messages.error(request, f'❌ Stock insuficiente: {e}')
+                return redirect('crear_envio', venta_id=venta_id)
+            except VentaNoDespachable:
+                messages.warning(request, 'Esta venta ya fue despachada o cambió de estado')
+                return redirect('lista_envios')
+            except OperationalError:
+                raise  # base ocupada: lo reintenta reintentar_si_ocupada
             except Exception as e:
                 messages.error(request, f'Error: {str(e)}')
         else:
@@ -649,9 +779,11 @@ def detalle_envio(request, envio_id):
     
     return render(request, 'envios/detalle_envio.html', {
         'envio': envio,
+        'historial': historial(envio),
     })
 
 @login_required
+@reintentar_si_ocupada
 def actualizar_estado_envio(request, envio_id):
     """
     Actualizar estado del envío (para choferes)
@@ -665,20 +797,11 @@ def actualizar_estado_envio(request, envio_id):
             messages.error(request, 'Estado inválido')
             return redirect('detalle_envio', envio_id=envio_id)
         
-        # Actualizar estado del envío
-        envio.estado = nuevo_estado
-        
-        # Si se marca como entregado, registrar hora
-        if nuevo_estado == 'entregado' and not envio.hora_real_entrega:
-            envio.hora_real_entrega = timezone.now()
-            
-            # Actualizar también el estado de la venta a "entregada"
-            if envio.venta.estado == 'enviada':
-                envio.venta.estado = 'entregada'
-                envio.venta.save()
-                messages.success(request, f'✅ Envío entregado. Venta #{envio.venta.id} marcada como entregada.')
-        
-        envio.save()
+        # Entregado: registra la hora y cierra la venta; queda en el historial
+        estado_venta = envio.venta.estado
+        cambiar_estado_envio(envio, nuevo_estado, usuario=request.user)
+        if envio.venta.estado != estado_venta:
+            messages.success(request, f'✅ Envío entregado. Venta #{envio.venta.id} marcada como entregada.')
         
         if nuevo_estado != 'entregado':
             messages.success(request, f'Estado del envío actualizado a "{envio.get_estado_display()}"')
@@ -690,33 +813,104 @@ def actualizar_estado_envio(request, envio_id):
         'estados': Envio.ESTADO_CHOICES
     })
 
+async def eventos_envios(request):
+    """
+    Server-Sent Events con los cambios de estado/chofer de envíos y ventas.
+    ?fecha=YYYY-MM-DD  ?chofer=<id>  ?tipo=envio,venta
+    Pensado para correr bajo ASGI (amarce.asgi): cada cliente conectado es
+    una corrutina esperando, no un worker bloqueado.
+    """
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return HttpResponse(status=403)
+
+    tipos = {t for t in request.GET.get('tipo', '').split(',') if t} or None
+    ultimo = request.headers.get('Last-Event-ID', '')
+    response = StreamingHttpResponse(
+        eventos.flujo_sse(
+            fecha=request.GET.get('fecha') or None,
+            chofer=request.GET.get('chofer') or None,
+            tipos=tipos,
+            desde=int(ultimo) if ultimo.isdigit() else None,
+        ),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # que nginx no lo junte en buffer
+    return response
+
 @login_required
 def programa_dia(request):
-    """Vista del programa diario de envíos por chofer"""
-    fecha = request.GET.get('fecha', date.today())
+    """
+    Hoja de ruta del día por chofer: las entregas activas en orden de visita
+    (stock.rutas, vecino más cercano + 2-opt) con su hora sugerida; las ya
+    entregadas o canceladas al final.
+    """
+    fecha = filtros.fecha(request.GET, 'fecha') or timezone.localdate()
     
     envios = Envio.objects.filter(fecha_envio=fecha).select_related(
         'venta__cliente', 'chofer'
-    ).order_by('chofer', 'hora_estimada')
+    ).prefetch_related('venta__detalles__producto').order_by('chofer', 'hora_estimada')
     
     # Agrupar por chofer
     envios_por_chofer = {}
     for envio in envios:
-        chofer_nombre = envio.chofer.nombre_completo if envio.chofer else "Sin Asignar"
-        if chofer_nombre not in envios_por_chofer:
-            envios_por_chofer[chofer_nombre] = []
-        envios_por_chofer[chofer_nombre].append(envio)
+        envios_por_chofer.setdefault(envio.chofer, []).append(envio)
+    
+    hojas = []
+    for chofer, lista in envios_por_chofer.items():
+        activos = [e for e in lista if e.estado in ('pendiente', 'en_camino')]
+        paradas = rutas.planificar(activos, fecha) + [
+            {'envio': e, 'orden': None, 'km': None, 'hora_sugerida': None}
+            for e in lista if e.estado not in ('pendiente', 'en_camino')
+        ]
+        hojas.append({
+            'chofer': chofer,
+            'nombre': chofer.nombre_completo if chofer else "Sin Asignar",
+            'paradas': paradas,
+            'km': sum(p['km'] or 0 for p in paradas),
+        })
     
     return render(request, 'envios/programa_dia.html', {
-        'envios_por_chofer': envios_por_chofer,
-        'fecha': fecha
+        'hojas': hojas,
+        'fecha': fecha,
     })
 
+@login_required
+@reintentar_si_ocupada
+def aplicar_horarios_ruta(request):
+    """
+    POST fecha + chofer: guarda como hora estimada de cada entrega activa
+    la hora sugerida por la ruta. Un solo bulk_update.
+    """
+    fecha = filtros.fecha(request.POST, 'fecha')
+    chofer_id = request.POST.get('chofer')
+    if request.method != 'POST' or not fecha or not chofer_id:
+        return redirect('programa_dia')
+    
+    activos = list(Envio.objects.filter(
+        fecha_envio=fecha, chofer_id=chofer_id, estado__in=['pendiente', 'en_camino']
+    ).select_related('venta__cliente'))
+    
+    ahora = timezone.now()
+    cambiados = []
+    for parada in rutas.planificar(activos, fecha):
+        envio = parada['envio']
+        if parada['hora_sugerida'] and envio.hora_estimada != parada['hora_sugerida']:
+            envio.hora_estimada = parada['hora_sugerida']
+            # bulk_update no toca auto_now: la sincronización del chofer lo necesita
+            envio.fecha_modificacion = ahora
+            cambiados.append(envio)
+    Envio.objects.bulk_update(cambiados, ['hora_estimada', 'fecha_modificacion'])
+    
+    messages.success(request, f'✅ {len(cambiados)} horario(s) actualizados según la ruta')
+    return redirect(f"{reverse('programa_dia')}?fecha={fecha.isoformat()}")
+
 
 # ==================================
 # IMÁGENES
 # ==================================
 @login_required
+@reintentar_si_ocupada
 def subir_imagen(request):
     productos = Producto.objects.all()
     
@@ -727,22 +921,25 @@ def subir_imagen(request):
         if producto_id and imagen:
             try:
                 producto = Producto.objects.get(id=producto_id)
-                nombre_archivo = f"{uuid.uuid4()}{os.path.splitext(imagen.name)[1]}"
-                ruta_relativa = f"productos/{nombre_archivo}"
-                ruta_completa = os.path.join(settings.MEDIA_ROOT, ruta_relativa)
-                
-                os.makedirs(os.path.dirname(ruta_completa), exist_ok=True)
-                
-                with open(ruta_completa, 'wb+') as destino:
-                    for chunk in imagen.chunks():
-                        destino.write(chunk)
+                # 🔑 Nombre = hash del contenido: la misma foto se guarda una sola vez
+                ruta_relativa = guardar_original(imagen)
+                variantes = variantes_existentes(ruta_relativa)
                 
                 producto.imagenproducto_set.all().delete()
-                ImagenProducto.objects.create(producto=producto, ruta=ruta_relativa)
+                imagen_producto = ImagenProducto.objects.create(
+                    producto=producto, ruta=ruta_relativa, variantes=variantes
+                )
+                # 🖼️ Miniaturas/WebP se generan en segundo plano (si no existían ya)
+                if not variantes:
+                    programar_derivados(imagen_producto)
+                # La imagen es parte del catálogo: mueve el ETag de api_productos
+                producto.save(update_fields=['fecha_modificacion'])
                 
                 messages.success(request, f'Imagen subida correctamente para {producto.nombre}')
             except Producto.DoesNotExist:
                 messages.error(request, 'Producto no encontrado')
+            except OperationalError:
+                raise  # base ocupada: lo reintenta reintentar_si_ocupada
             except Exception as e:
                 messages.error(request, f'Error al subir la imagen: {str(e)}')
         else:
@@ -752,26 +949,255 @@ def subir_imagen(request):
     
     return render(request, 'imagenes/subir.html', {'productos': productos})
 
-def api_productos(request):
+# ==================================
+# API CATÁLOGO (frontend React)
+# ==================================
+def _imagen_catalogo(p, ctx):
+    if not p.imagenes:
+        return None
+    return f"{ctx['media']}{p.imagenes[0].variante(ctx['ancho'])}"
+
+
+def _variantes_catalogo(p, ctx):
+    if not p.imagenes:
+        return {}
+    return {
+        nombre: {
+            'ancho': v['ancho'],
+            'webp': f"{ctx['media']}{v['webp']}",
+            'jpeg': f"{ctx['media']}{v['jpeg']}",
+        }
+        for nombre, v in p.imagenes[0].variantes.items()
+    }
+
+
+# Campos disponibles en ?fields= y cómo se serializa cada uno
+CAMPOS_CATALOGO = {
+    'id': lambda p, ctx: p.id,
+    'nombre': lambda p, ctx: p.nombre,
+    'valor': lambda p, ctx: float(p.valor),
+    'imagen': _imagen_catalogo,
+    'imagen_variantes': _variantes_catalogo,
+    'tipo': lambda p, ctx: p.tipo_id,
+    'tipo_nombre': lambda p, ctx: p.tipo.nombre,
+    'cantidad': lambda p, ctx: p.cantidad,
+    'reservado': lambda p, ctx: p.reservado,
+    'disponible': lambda p, ctx: p.disponible,
+    'fecha_modificacion': lambda p, ctx: p.fecha_modificacion.isoformat(),
+}
+CAMPOS_CATALOGO_DEFECTO = ['id', 'nombre', 'valor', 'imagen']
+CAMPOS_CON_IMAGEN = {'imagen', 'imagen_variantes'}
+LIMITE_CATALOGO_MAX = 500
+ANCHO_IMAGEN_DEFECTO = 480
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def _catalogo_filtrado(request):
+    """Productos del catálogo con los filtros ?tipo= y ?updated_since= aplicados."""
     productos = Producto.objects.all()
-    
-    lista = []
-    for p in productos:
-        img = p.imagenproducto_set.first()
-        imagen_url = None
-        if img and img.ruta:
-            imagen_url = request.build_absolute_uri(f'{settings.MEDIA_URL}{img.ruta}')
-        
-        lista.append({
-            'id': p.id,
-            'nombre': p.nombre,
-            'valor': float(p.valor),
-            'imagen': imagen_url
-        })
-    
-    return JsonResponse(lista, safe=False)
+
+    tipo = request.GET.get('tipo')
+    if tipo:
+        if not tipo.isdigit():
+            raise ParametroInvalido('tipo debe ser un id numérico')
+        productos = productos.filter(tipo_id=tipo)
+
+    desde = request.GET.get('updated_since')
+    if desde:
+        try:
+            fecha = parse_datetime(desde)
+        except ValueError:
+            fecha = None
+        if fecha is None:
+            raise ParametroInvalido('updated_since debe ser una fecha ISO 8601')
+        if timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+        productos = productos.filter(fecha_modificacion__gt=fecha)
+
+    return productos
+
+
+def _catalogo_estado(request):
+    """max(fecha_modificacion) y cantidad de productos: una consulta indexada (cacheada)."""
+    if not hasattr(request, '_catalogo_estado'):
+        try:
+            productos = _catalogo_filtrado(request)
+            request._catalogo_estado = obtener_o_construir(
+                'api_productos_estado', request.GET.urlencode(),
+                lambda: productos.aggregate(ultima=Max('fecha_modificacion'), total=Count('id')),
+            )
+        except ParametroInvalido:
+            request._catalogo_estado = {'ultima': None, 'total': 0}
+    return request._catalogo_estado
+
+
+def _catalogo_etag(request):
+    estado = _catalogo_estado(request)
+    # El total cubre bajas de productos, que no mueven el máximo
+    firma = f"{estado['ultima']}|{estado['total']}|{request.GET.urlencode()}"
+    return hashlib.sha1(firma.encode()).hexdigest()
+
+
+def _catalogo_ultima_modificacion(request):
+    return _catalogo_estado(request)['ultima']
+
+
+@condition(etag_func=_catalogo_etag, last_modified_func=_catalogo_ultima_modificacion)
+def api_productos(request):
+    """
+    Catálogo para el frontend.
+
+    ?fields=id,nombre,...   campos a devolver (por defecto id, nombre, valor, imagen)
+    ?ancho=<px>             `imagen` = variante más chica de al menos ese ancho (480)
+    ?tipo=<id>              filtra por tipo de producto
+    ?updated_since=<ISO>    sólo productos modificados después de esa fecha
+    ?limite=<n>&cursor=...  paginación por cursor; el link a la página
+                            siguiente viaja en el header `Link` (rel="next")
+
+    Responde con ETag/Last-Modified: si el catálogo no cambió devuelve 304 sin cuerpo.
+    """
+    try:
+        productos = _catalogo_filtrado(request)
+
+        campos = CAMPOS_CATALOGO_DEFECTO
+        if request.GET.get('fields'):
+            campos = [c.strip() for c in request.GET['fields'].split(',') if c.strip()]
+            invalidos = [c for c in campos if c not in CAMPOS_CATALOGO]
+            if invalidos:
+                raise ParametroInvalido(f'Campos desconocidos: {", ".join(invalidos)}')
+
+        limite = request.GET.get('limite')
+        if limite is not None:
+            if not limite.isdigit() or not 1 <= int(limite) <= LIMITE_CATALOGO_MAX:
+                raise ParametroInvalido(f'limite debe estar entre 1 y {LIMITE_CATALOGO_MAX}')
+
+        ancho = request.GET.get('ancho', str(ANCHO_IMAGEN_DEFECTO))
+        if not ancho.isdigit():
+            raise ParametroInvalido('ancho debe ser un número de píxeles')
+    except ParametroInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    media = request.build_absolute_uri(settings.MEDIA_URL)
+    contexto = {'media': media, 'ancho': int(ancho)}
+
+    def construir():
+        nonlocal productos
+        if 'tipo_nombre' in campos:
+            productos = productos.select_related('tipo')
+        if CAMPOS_CON_IMAGEN & set(campos):
+            # 🖼️ Todas las imágenes en UNA consulta (antes: una por producto)
+            productos = productos.prefetch_related(Prefetch(
+                'imagenproducto_set',
+                queryset=ImagenProducto.objects.order_by('id'),
+                to_attr='imagenes',
+            ))
+
+        siguiente = None
+        if limite is not None:
+            pagina = paginar(request, productos, ['id'], por_pagina=int(limite))
+            items = pagina.items
+            if pagina.tiene_siguiente:
+                siguiente = request.build_absolute_uri(pagina.url_siguiente)
+        else:
+            items = productos.order_by('id')
+
+        serializadores = [(c, CAMPOS_CATALOGO[c]) for c in campos]
+        lista = [{c: serializar(p, contexto) for c, serializar in serializadores} for p in items]
+        return lista, siguiente
+
+    # 📦 Payload ya serializado bajo la versión actual del catálogo
+    lista, siguiente = obtener_o_construir(
+        'api_productos', f'{media}?{request.GET.urlencode()}', construir
+    )
+
+    response = JsonResponse(lista, safe=False)
+    if siguiente:
+        response['Link'] = f'<{siguiente}>; rel="next"'
+    # Que el navegador revalide siempre con el ETag en vez de adivinar frescura
+    patch_cache_control(response, no_cache=True)
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@reintentar_si_ocupada
+@idempotente
+def api_crear_venta(request):
+    """
+    Alta de pedidos para integraciones (JSON):
+    {"cliente": id, "notas": "...", "lineas": [{"producto": id, "cantidad": n}, ...]}
+    Misma lógica que crear_venta: una consulta de productos, bulk_create, atómico.
+    Con header `Idempotency-Key` un reintento devuelve la misma venta.
+    """
+    serializer = CrearVentaSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    datos = serializer.validated_data
+
+    try:
+        venta = registrar_venta(
+            datos['cliente'],
+            [(linea['producto'], linea['cantidad']) for linea in datos['lineas']],
+            usuario=request.user,
+            notas=datos['notas'],
+        )
+    except VentaInvalida as e:
+        return Response({'error': str(e)}, status=400)
+
+    return Response({
+        'id': venta.id,
+        'estado': venta.estado,
+        'valor_total': str(venta.valor_total),
+        'lineas': len(datos['lineas']),
+    }, status=201)
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+@reintentar_si_ocupada
+@idempotente
+def api_sincronizar_chofer(request):
+    """
+    Sincronización de la app del chofer de la sesión (el que eligió en el panel).
+
+    GET  ?cursor=...   lo modificado desde el cursor (sin cursor: todo lo activo)
+    POST {"cursor": "...", "operaciones": [{"id": "...", "tipo": "envio"|"venta",
+          "objeto": id, "estado": "...", "nota": "..."}, ...]}
+         aplica las operaciones encoladas y devuelve sus resultados junto
+         con lo modificado desde el cursor.
+    Con header `Idempotency-Key` el reenvío de un lote no se aplica dos veces.
+    """
+    # Sólo el chofer de la sesión: con un parámetro cualquiera podría actuar por otro
+    chofer_id = request.session.get('chofer_id')
+    if not chofer_id:
+        return Response({'error': 'No hay un chofer con sesión iniciada'}, status=403)
+    chofer = get_object_or_404(Chofer, id=chofer_id)
+
+    if request.method == 'GET':
+        cursor = request.query_params.get('cursor', '')
+    else:
+        serializer = SincronizacionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cursor = serializer.validated_data['cursor']
+
+    try:
+        desde = sincronizacion.leer_cursor(cursor)
+    except CursorInvalido:
+        return Response({'error': 'Cursor inválido; sincronizar desde cero'}, status=400)
+
+    resultados = None
+    if request.method == 'POST':
+        resultados = sincronizacion.aplicar(
+            chofer, serializer.validated_data['operaciones'], base=desde
+        )
+
+    datos = sincronizacion.cambios(chofer, desde)
+    if resultados is not None:
+        datos['resultados'] = resultados
+    return Response(datos)
 
 @login_required
+@reintentar_si_ocupada
 def asignar_chofer_venta(request, venta_id):
     """
     Asignar o cambiar chofer y programar envío para una venta pendiente/confirmada
@@ -796,23 +1222,32 @@ def asignar_chofer_venta(request, venta_id):
         # 🆕 CAMBIO AUTOMÁTICO DE ESTADO
         # Si la venta estaba pendiente y se asigna chofer, cambiar a confirmada
         if venta.estado == 'pendiente' and chofer_id:
-            venta.estado = 'confirmada'
-            messages.success(
-                request, 
-                f'✅ Venta confirmada automáticamente. '
-                f'Chofer asignado: {venta.chofer.nombre_completo}. '
-                f'Programado para: {fecha_programada or "Sin fecha"}'
-            )
-        elif chofer_id:
-            messages.success(
-                request, 
-                f'✅ Chofer actualizado: {venta.chofer.nombre_completo}. '
-                f'Programado para: {fecha_programada or "Sin fecha"}'
-            )
+            try:
+                # 🔒 Confirmar reserva el stock; si no alcanza queda pendiente
+                cambiar_estado_venta(venta, 'confirmada', usuario=request.user)
+                messages.success(
+                    request, 
+                    f'✅ Venta confirmada automáticamente. '
+                    f'Chofer asignado: {venta.chofer.nombre_completo}. '
+                    f'Programado para: {fecha_programada or "Sin fecha"}'
+                )
+            except StockInsuficiente as e:
+                venta.save()
+                messages.warning(
+                    request,
+                    f'⚠️ Chofer asignado, pero la venta sigue pendiente: no hay stock disponible ({e})'
+                )
         else:
-            messages.success(request, 'Chofer removido de la venta')
-        
-        venta.save()
+            if chofer_id:
+                messages.success(
+                    request, 
+                    f'✅ Chofer actualizado: {venta.chofer.nombre_completo}. '
+                    f'Programado para: {fecha_programada or "Sin fecha"}'
+                )
+            else:
+                messages.success(request, 'Chofer removido de la venta')
+            
+            venta.save()
         
         return redirect('detalle_venta', venta_id=venta_id)
     
@@ -834,14 +1269,10 @@ def asignar_envios_pendientes(request):
     fecha = request.GET.get('fecha')
     
     # AMBAS: pendientes Y confirmadas
-    ventas = Ventas.objects.filter(
-        estado__in=['pendiente', 'confirmada']
-    ).select_related('cliente').prefetch_related('detalles__producto')
-    
-    if cliente_id:
-        ventas = ventas.filter(cliente_id=cliente_id)
-    if fecha:  # SOLO filtrar si el usuario PONE una fecha
-        ventas = ventas.filter(fecha_creacion__date=fecha)
+    # SOLO filtra por fecha si el usuario PONE una fecha
+    ventas = filtros.ventas_por_despachar(request.GET).select_related(
+        'cliente'
+    ).prefetch_related('detalles__producto')
     
     ventas = ventas.order_by('estado', '-fecha_creacion')  # Pendientes primero
     
@@ -864,16 +1295,129 @@ def asignar_envios_pendientes(request):
     return render(request, 'envios/asignar_envios_pendientes.html', context)
 
 @login_required
+@reintentar_si_ocupada
+@idempotente
+def asignar_choferes_automatico(request):
+    """
+    Reparto automático de las ventas sin chofer de un día (stock.asignacion).
+    GET: vista previa del plan (?fecha=, ?zona=1 para agrupar por zona).
+    POST: guarda exactamente el plan que se mostró (pares venta:chofer) en un solo UPDATE
+          y confirma las pendientes (las que no tienen stock quedan sin chofer).
+    """
+    quiere_json = 'application/json' in request.headers.get('Accept', '')
+    datos = request.POST if request.method == 'POST' else request.GET
+    fecha = filtros.fecha(datos, 'fecha') or timezone.localdate()
+    agrupar = datos.get('zona') == '1'
+
+    if request.method == 'POST':
+        asignaciones = {}
+        for par in request.POST.getlist('asignacion'):
+            venta_id, _, chofer_id = par.partition(':')
+            if venta_id.isdigit() and chofer_id.isdigit():
+                asignaciones[int(venta_id)] = int(chofer_id)
+        asignadas = asignacion.aplicar(fecha, asignaciones, usuario=request.user)
+        if quiere_json:
+            return JsonResponse({'asignadas': asignadas, 'enviadas': len(asignaciones)})
+        if asignadas < len(asignaciones):
+            messages.warning(
+                request,
+                f'⚠️ {len(asignaciones) - asignadas} venta(s) cambiaron mientras tanto o no tienen '
+                'stock disponible para confirmarlas, y no se asignaron'
+            )
+        messages.success(request, f'✅ {asignadas} venta(s) asignadas para el {fecha:%d/%m/%Y}')
+        return redirect(f"{reverse('asignar_choferes_automatico')}?fecha={fecha.isoformat()}")
+
+    plan = asignacion.planificar(fecha, agrupar=agrupar)
+    if quiere_json:
+        return JsonResponse({
+            'fecha': fecha.isoformat(),
+            'asignaciones': {str(k): v for k, v in plan['asignaciones'].items()},
+            'choferes': [
+                {
+                    'id': carga.chofer.id,
+                    'nombre': carga.chofer.nombre_completo,
+                    'paradas': carga.paradas,
+                    'unidades': carga.unidades,
+                    'nuevas': [venta.id for venta in carga.nuevas],
+                }
+                for carga in plan['cargas']
+            ],
+            'sin_asignar': [venta.id for venta in plan['sin_asignar']],
+        })
+
+    return render(request, 'envios/asignacion_automatica.html', {
+        'plan': plan,
+        'fecha': fecha,
+        'agrupar': agrupar,
+    })
+
+@login_required
+@reintentar_si_ocupada
+@idempotente
+def despachar_ventas_lote(request):
+    """
+    Crear los envíos de varias ventas confirmadas de una vez (desde
+    asignar_envios_pendientes). Chofer / fecha / hora del form se usan para
+    las ventas que no los tengan programados.
+    """
+    if request.method != 'POST':
+        return redirect('asignar_envios_pendientes')
+
+    quiere_json = 'application/json' in request.headers.get('Accept', '')
+    chofer = Chofer.objects.filter(id=request.POST.get('chofer') or None).first()
+    try:
+        resultado = despachar_ventas(
+            request.POST.getlist('ventas'),
+            chofer=chofer,
+            fecha_envio=request.POST.get('fecha_envio') or None,
+            hora_estimada=request.POST.get('hora_estimada') or None,
+            usuario=request.user,
+        )
+    except (VentaInvalida, VentaNoDespachable, StockInsuficiente) as e:
+        # Nada quedó a medias: la transacción se deshizo completa
+        if quiere_json:
+            return JsonResponse({'error': str(e)}, status=409)
+        messages.error(request, f'❌ No se creó ningún envío: {e}')
+        return redirect('asignar_envios_pendientes')
+
+    if quiere_json:
+        return JsonResponse({
+            'despachadas': resultado['despachadas'],
+            'sin_stock': {str(k): v for k, v in resultado['sin_stock'].items()},
+            'rechazadas': {str(k): v for k, v in resultado['rechazadas'].items()},
+        })
+
+    if resultado['despachadas']:
+        messages.success(
+            request,
+            f'✅ {len(resultado["despachadas"])} envío(s) creados. Stock descontado.'
+        )
+    for venta_id, faltantes in resultado['sin_stock'].items():
+        detalle = ', '.join(
+            f"{f['producto']} (Necesita: {f['necesita']}, Hay: {f['hay']})" for f in faltantes
+        )
+        messages.error(request, f'❌ Venta #{venta_id} sin stock: {detalle}')
+    for venta_id, motivo in resultado['rechazadas'].items():
+        messages.warning(request, f'⚠️ Venta #{venta_id}: {motivo}')
+    if not any(resultado.values()):
+        messages.error(request, '❌ No se seleccionó ninguna venta')
+    return redirect('asignar_envios_pendientes')
+
+@login_required
+@reintentar_si_ocupada
 def confirmar_y_crear_envio(request, venta_id):
     """
     🆕 NUEVA FUNCIÓN: Confirma la venta automáticamente y va a crear envío
     """
     venta = get_object_or_404(Ventas, id=venta_id)
     
-    # Si está pendiente, la confirmamos automáticamente
+    # Si está pendiente, la confirmamos automáticamente (reserva stock)
     if venta.estado == 'pendiente':
-        venta.estado = 'confirmada'
-        venta.save()
+        try:
+            cambiar_estado_venta(venta, 'confirmada', usuario=request.user)
+        except StockInsuficiente as e:
+            messages.error(request, f'❌ No hay stock disponible para confirmar: {e}')
+            return redirect('detalle_venta', venta_id=venta_id)
         messages.success(request, f'✅ Venta #{venta.id} confirmada automáticamente')
     
     # Redirigir a crear envío
@@ -895,65 +1439,61 @@ def panel_chofer(request):
             'choferes': choferes
         })
     
-    request.session['chofer_id'] = chofer_id
+    if request.session.get('chofer_id') != chofer_id:
+        request.session['chofer_id'] = chofer_id
     chofer = get_object_or_404(Chofer, id=chofer_id)
     
-    # VENTAS ENVIADAS (con envío creado pero aún no entregadas)
-    ventas_enviadas = Ventas.objects.filter(
-        chofer=chofer,
-        estado='enviada'
-    ).select_related('cliente').prefetch_related('detalles__producto').order_by(
-        'fecha_envio'
-    )
-    
-    # VENTAS CONFIRMADAS (sin envío creado aún)
-    ventas_confirmadas = Ventas.objects.filter(
-        chofer=chofer,
-        estado='confirmada'
-    ).select_related('cliente').prefetch_related('detalles__producto').order_by(
-        'fecha_envio_programada', 'hora_envio_programada'
-    )
+    # Los choferes recargan el panel todo el tiempo desde el celular: una
+    # consulta de ventas, una de envíos y una de contadores, sin importar
+    # cuántas entregas tenga el chofer. El reparto por estado se hace acá.
+    ventas_enviadas = []
+    ventas_confirmadas = []
+    for venta in Ventas.objects.filter(
+        chofer=chofer, estado__in=['enviada', 'confirmada']
+    ).select_related('cliente').order_by('fecha_envio', 'fecha_envio_programada', 'hora_envio_programada', 'id'):
+        if venta.estado == 'enviada':
+            ventas_enviadas.append(venta)  # Con envío creado pero aún no entregadas
+        else:
+            ventas_confirmadas.append(venta)  # Sin envío creado aún
     
     # 🆕 ENVÍOS ACTIVOS (solo pendiente y en_camino, NO entregados)
-    envios_activos = Envio.objects.filter(
-        chofer=chofer,
-        estado__in=['pendiente', 'en_camino']  # 🔥 Solo activos
-    ).select_related('venta__cliente').order_by('fecha_envio', 'hora_estimada')
-    
-    # Separar envíos por estado
-    pendientes = envios_activos.filter(estado='pendiente')
-    en_camino = envios_activos.filter(estado='en_camino')
-    
-    # 🆕 OBTENER IDs de ventas que YA tienen envío (solo activos)
-    ventas_con_envio_ids = envios_activos.values_list('venta_id', flat=True)
-    
-    # 🆕 VENTAS ENVIADAS SIN OBJETO ENVIO
-    ventas_enviadas_sin_envio = ventas_enviadas.exclude(id__in=ventas_con_envio_ids)
-    
-    # 🆕 Contar entregados de HOY (opcional, para estadísticas)
-    entregados_hoy = Envio.objects.filter(
-        chofer=chofer,
-        estado='entregado',
-        fecha_envio=timezone.now().date()
-    ).count()
+    pendientes = []
+    en_camino = []
+    for envio in Envio.objects.filter(
+        chofer=chofer, estado__in=['pendiente', 'en_camino']
+    ).select_related('venta__cliente').order_by('fecha_envio', 'hora_estimada'):
+        (pendientes if envio.estado == 'pendiente' else en_camino).append(envio)
+    
+    # 🆕 VENTAS ENVIADAS SIN OBJETO ENVIO (activo)
+    ventas_con_envio_ids = {envio.venta_id for envio in pendientes + en_camino}
+    ventas_enviadas_sin_envio = [v for v in ventas_enviadas if v.id not in ventas_con_envio_ids]
+    
+    # 📊 Contadores en un solo aggregate condicional
+    contadores = Envio.objects.filter(chofer=chofer).aggregate(
+        pendientes=Count('id', filter=Q(estado='pendiente')),
+        en_camino=Count('id', filter=Q(estado='en_camino')),
+        entregados_hoy=Count('id', filter=Q(estado='entregado', fecha_envio=timezone.localdate())),
+    )
     
     context = {
         'chofer': chofer,
         'ventas_enviadas': ventas_enviadas,
         'ventas_enviadas_sin_envio': ventas_enviadas_sin_envio,
-        'total_ventas_enviadas': ventas_enviadas.count(),
+        'total_ventas_enviadas': len(ventas_enviadas),
         'ventas_confirmadas': ventas_confirmadas,
-        'total_ventas_confirmadas': ventas_confirmadas.count(),
+        'total_ventas_confirmadas': len(ventas_confirmadas),
         'pendientes': pendientes,
         'en_camino': en_camino,
-        'total_pendientes': pendientes.count(),
-        'total_en_camino': en_camino.count(),
-        'entregados_hoy': entregados_hoy,  # 🆕 Para mostrar en el header
+        'total_pendientes': contadores['pendientes'],
+        'total_en_camino': contadores['en_camino'],
+        'total_activas': contadores['pendientes'] + contadores['en_camino'] + len(ventas_enviadas_sin_envio),
+        'entregados_hoy': contadores['entregados_hoy'],  # 🆕 Para mostrar en el header
     }
     
     return render(request, 'choferes/panel_chofer.html', context)
 
 @login_required
+@reintentar_si_ocupada
 def chofer_detalle_venta_confirmada(request, venta_id):
     """
     Ver detalle de una VENTA CONFIRMADA (sin envío creado)
@@ -975,17 +1515,14 @@ def chofer_detalle_venta_confirmada(request, venta_id):
             messages.error(request, 'Estado inválido')
             return redirect('chofer_detalle_venta_confirmada', venta_id=venta_id)
         
-        # Actualizar estado
-        venta.estado = nuevo_estado
-        
-        # Agregar notas si las hay
-        if notas_adicionales:
-            if venta.notas:
-                venta.notas += f"\n[{timezone.now().strftime('%d/%m/%Y %H:%M')}] {notas_adicionales}"
-            else:
-                venta.notas = f"[{timezone.now().strftime('%d/%m/%Y %H:%M')}] {notas_adicionales}"
-        
-        venta.save()
+        # Actualizar estado (mantiene las reservas de stock); la nota va al historial
+        try:
+            cambiar_estado_venta(
+                venta, nuevo_estado, usuario=request.user, chofer=venta.chofer, nota=notas_adicionales
+            )
+        except StockInsuficiente as e:
+            messages.error(request, f'Sin stock para ese estado: {e}')
+            return redirect('chofer_detalle_venta_confirmada', venta_id=venta_id)
         
         messages.success(request, f'Estado actualizado a: {venta.get_estado_display()}')
         return redirect('panel_chofer')
@@ -994,6 +1531,7 @@ def chofer_detalle_venta_confirmada(request, venta_id):
     
     return render(request, 'choferes/detalle_venta_confirmada.html', {
         'venta': venta,
+        'historial': historial(venta),
         'detalles': detalles,
         'chofer': venta.chofer,
         'estados': Ventas.ESTADO_CHOICES,
@@ -1013,12 +1551,15 @@ def chofer_detalle_envio(request, envio_id):
     
     return render(request, 'choferes/detalle_envio.html', {
         'envio': envio,
+        'historial': historial(envio),
         'detalles': detalles,
         'chofer': envio.chofer,
         'estados': Envio.ESTADO_CHOICES,
     })
 
 @login_required
+@reintentar_si_ocupada
+@idempotente
 def chofer_cambiar_estado_envio(request, envio_id):
     """
     Permite al chofer cambiar el estado de su ENVÍO
@@ -1039,26 +1580,10 @@ def chofer_cambiar_estado_envio(request, envio_id):
             messages.error(request, 'Estado inválido')
             return redirect('chofer_detalle_envio', envio_id=envio_id)
         
-        # Actualizar estado
-        envio.estado = nuevo_estado
-        
-        # Si se marca como entregado, registrar la hora
-        if nuevo_estado == 'entregado' and not envio.hora_real_entrega:
-            envio.hora_real_entrega = timezone.now()
-            
-            # Actualizar también la venta a "entregada"
-            if envio.venta.estado == 'enviada':
-                envio.venta.estado = 'entregada'
-                envio.venta.save()
-        
-        # Agregar notas si las hay
-        if notas_adicionales:
-            if envio.notas:
-                envio.notas += f"\n[{timezone.now().strftime('%d/%m/%Y %H:%M')}] {notas_adicionales}"
-            else:
-                envio.notas = f"[{timezone.now().strftime('%d/%m/%Y %H:%M')}] {notas_adicionales}"
-        
-        envio.save()
+        # Actualizar estado (entregado: registra la hora y cierra la venta)
+        cambiar_estado_envio(
+            envio, nuevo_estado, notas_adicionales, usuario=request.user, chofer=envio.chofer
+        )
         
         messages.success(request, f'Estado actualizado a: {envio.get_estado_display()}')
         
@@ -1071,6 +1596,7 @@ def chofer_cambiar_estado_envio(request, envio_id):
     })
 
 @login_required
+@reporte
 def chofer_historial(request):
     """
     Historial de envíos del chofer
@@ -1079,33 +1605,31 @@ def chofer_historial(request):
     if not chofer_id:
         return redirect('panel_chofer')
     
-    chofer = get_object_or_404(Chofer, id=chofer_id)
+    # El chofer de la sesión puede ser más nuevo que la copia de reportes
+    chofer = get_object_or_404(Chofer.objects.using('default'), id=chofer_id)
     
     # Filtros
     fecha_desde = request.GET.get('desde')
     fecha_hasta = request.GET.get('hasta')
     estado = request.GET.get('estado')
     
-    envios = Envio.objects.filter(chofer=chofer).select_related(
+    envios = filtros.historial_chofer(chofer, request.GET).select_related(
         'venta__cliente'
-    ).order_by('-fecha_envio', '-hora_estimada')
+    )
     
-    if fecha_desde:
-        envios = envios.filter(fecha_envio__gte=fecha_desde)
-    if fecha_hasta:
-        envios = envios.filter(fecha_envio__lte=fecha_hasta)
-    if estado:
-        envios = envios.filter(estado=estado)
+    # 📊 Estadísticas: una fila por semana (stock.estadisticas), no un recorrido de envíos
+    totales, semanas = estadisticas.historial(
+        chofer, filtros.fecha(request.GET, 'desde'), filtros.fecha(request.GET, 'hasta')
+    )
     
-    # Estadísticas
-    total_envios = envios.count()
-    total_entregados = envios.filter(estado='entregado').count()
+    pagina = paginar(request, envios, ['-fecha_envio', '-hora_estimada', '-id'])
     
     context = {
         'chofer': chofer,
-        'envios': envios,
-        'total_envios': total_envios,
-        'total_entregados': total_entregados,
+        'envios': pagina,
+        'pagina': pagina,
+        'totales': totales,
+        'semanas': semanas,
         'estados': Envio.ESTADO_CHOICES,
         'fecha_desde': fecha_desde,
         'fecha_hasta': fecha_hasta,